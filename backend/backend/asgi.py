@@ -25,19 +25,15 @@ django_application = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
-from backend.cantine.consumers import JWTAuthMiddleware
-
-# Import de l'application cantine
-try:
-    from backend.cantine.routing import websocket_urlpatterns
-except ImportError:
-    from cantine.routing import websocket_urlpatterns
+from cantine.consumers import JWTAuthMiddleware
+from cantine.routing import websocket_urlpatterns
 
+# Le jeton JWT, s'il est fourni, prime sur l'utilisateur de la session
 application = ProtocolTypeRouter({
     "http": django_application,
     "websocket": AllowedHostsOriginValidator(
-        JWTAuthMiddleware(
-            AuthMiddlewareStack(
+        AuthMiddlewareStack(
+            JWTAuthMiddleware(
                 URLRouter(websocket_urlpatterns)
             )
         )
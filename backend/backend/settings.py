@@ -1,6 +1,7 @@
 import os
+import tempfile
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cantine.metriques.MetriquesMiddleware',
+    'cantine.profilage.ProfilageMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -73,11 +76,41 @@ ASGI_APPLICATION = 'backend.asgi.application'
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Channel layers configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Couche de canaux : partitionnée sur les serveurs de CANAUX_HOTES (Redis ou
+# courtier local, voir cantine.couche_canaux), en mémoire sinon
+CANAUX_HOTES = config('CANAUX_HOTES', default='', cast=Csv())
+if CANAUX_HOTES:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'cantine.couche_canaux.CoucheCanauxPartitionnee',
+            'CONFIG': {'hotes': CANAUX_HOTES},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# Cache partagé entre les processus (Redis si REDIS_URL est défini)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Cache propre à chaque processus : avec plusieurs workers, définir
+    # REDIS_URL. À défaut, les versions des menus et des paramètres
+    # expirent vite (voir cantine.cache_menu.DUREE_VERSION_LOCALE).
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 DATABASES = {
     'default': {
@@ -106,6 +139,11 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
 
+# Celery (expiration des réservations, génération des exports)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default=REDIS_URL or 'memory://localhost/')
+# Sans broker configuré (donc sans worker), exécuter les tâches dans le processus
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=CELERY_BROKER_URL.startswith('memory://'), cast=bool)
+
 # Configuration des fichiers statiques
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -147,10 +185,12 @@ CORS_ALLOW_HEADERS = [
 CORS_EXPOSE_HEADERS = ['Authorization']
 
 REST_FRAMEWORK = {
+    # JWT en premier : c'est le cas courant, et il ne lit pas la base
+    # (voir cantine.authentification)
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'cantine.authentification.JWTAuthenticationRapide',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -165,6 +205,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Relit le rôle et l'état du compte à chaque rafraîchissement
+    'TOKEN_REFRESH_SERIALIZER': 'cantine.authentification.RafraichissementSerializer',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -176,13 +218,21 @@ SPECTACULAR_SETTINGS = {
 
 AUTH_USER_MODEL = 'cantine.User'
 
-# Configuration du logging
+# Configuration du logging : écriture de la console par un thread (voir
+# cantine.journal), sans propagation pour n'écrire chaque message qu'une fois
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structure': {
+            '()': 'cantine.journal.FormatStructure',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'cantine.journal.FileAttenteHandler',
+            'formatter': 'structure',
         },
     },
     'root': {
@@ -193,15 +243,22 @@ LOGGING = {
         'django': {
             'handlers': ['console'],
             'level': 'INFO',
-            'propagate': True,
+            'propagate': False,
         },
         'cantine': {
             'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': config('NIVEAU_JOURNAL_CANTINE', default='DEBUG' if DEBUG else 'INFO'),
+            'propagate': False,
         },
     },
 }
+# Fraction journalisée des événements fréquents (cantine.journal.evenement)
+JOURNAL_ECHANTILLON = config('JOURNAL_ECHANTILLON', default=0.01, cast=float)
+
+# Métriques Prometheus (cantine.metriques) : un fichier par processus dans ce
+# dossier local ; /metrics exige ce jeton (sans jeton : DEBUG uniquement)
+METRIQUES_DOSSIER = config('METRIQUES_DOSSIER', default=os.path.join(tempfile.gettempdir(), 'cantine-metriques'))
+METRIQUES_JETON = config('METRIQUES_JETON', default='')
 WHITENOISE_ALLOW_ALL_ORIGINS = True
 WHITENOISE_MANIFEST_STRICT = False
 
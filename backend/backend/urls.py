@@ -5,9 +5,11 @@ from django.conf.urls.static import static
 from django.views.static import serve  # Ajoutez cette importation
 from rest_framework.permissions import AllowAny
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from cantine.metriques import exposer as exposer_metriques
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', exposer_metriques, name='metriques'),
     path('api/', include('cantine.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -1 +1,4 @@
-# Ce fichier est intentionnellement vide 
\ No newline at end of file
+# Charge l'application Celery au démarrage de Django pour que shared_task l'utilise
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -1,6 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Avis, User, Plat, EmploiDuTemps, Reservation, Notification, Parametre
+import json
+
+from django.db import transaction
+from django.utils.html import format_html
+from .models import Avis, User, Plat, EmploiDuTemps, Reservation, Notification, NotificationDiffusee, Parametre, ProfilRequete
+from . import notes, transitions
+from .temps_reel import creer_notifications
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'institut', 'is_staff', 'date_inscription')
@@ -40,18 +46,22 @@ class ReservationAdmin(admin.ModelAdmin):
     search_fields = ('etudiant__email', 'plat__nom_plat')
     actions = ['accepter_reservations', 'refuser_reservations']
 
+    # Actions ensemblistes : un UPDATE des statuts, un UPDATE du stock par
+    # créneau et des INSERT groupés de notifications, dans une transaction.
+    # Les signaux de Reservation ne sont pas déclenchés.
     def accepter_reservations(self, request, queryset):
-        for reservation in queryset:
-            reservation.statut = 'accepte'
-            reservation.save()
-            reservation.emploi_du_temps.quantite_disponible -= reservation.quantite
-            reservation.emploi_du_temps.save()
-        self.message_user(request, f"{queryset.count()} réservations acceptées")
+        # Les places ont été prises à la création : l'acceptation ne touche pas au stock
+        with transaction.atomic():
+            acceptees = transitions.transitionner(queryset, 'accepte')
+            transitions.notifier(acceptees, 'accepte')
+        self.message_user(request, f"{len(acceptees)} réservations acceptées")
     accepter_reservations.short_description = "Accepter les réservations sélectionnées"
 
     def refuser_reservations(self, request, queryset):
-        queryset.update(statut='refuse')
-        self.message_user(request, f"{queryset.count()} réservations refusées")
+        with transaction.atomic():
+            refusees = transitions.transitionner(queryset, 'refuse')
+            transitions.notifier(refusees, 'refuse')
+        self.message_user(request, f"{len(refusees)} réservations refusées")
     refuser_reservations.short_description = "Refuser les réservations sélectionnées"
 
 @admin.register(Notification)
@@ -60,6 +70,12 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ('est_lue', 'date_envoi')
     search_fields = ('destinataire__email', 'titre', 'contenu')
 
+@admin.register(NotificationDiffusee)
+class NotificationDiffuseeAdmin(admin.ModelAdmin):
+    list_display = ('titre', 'cle', 'date_envoi')
+    list_filter = ('date_envoi',)
+    search_fields = ('titre', 'contenu', 'cle')
+
 @admin.register(Parametre)
 class ParametreAdmin(admin.ModelAdmin):
     list_display = ('nom_parametre', 'valeur', 'date_modification')
@@ -74,20 +90,74 @@ class AvisAdmin(admin.ModelAdmin):
     actions = ['approuver_avis', 'desapprouver_avis']
 
     def approuver_avis(self, request, queryset):
-        updated = queryset.update(est_approuve=True)
-        for avis in queryset:
-            Notification.objects.create(
-                destinataire=avis.etudiant,
-                titre="Votre avis a été approuvé",
-                contenu=f"Votre avis sur le plat {avis.plat.nom_plat} a été publié.",
-                lien=f"/admin/cantine/avis/{avis.id}/change/"
-            )
-        self.message_user(request, f"{updated} avis approuvés.")
+        with transaction.atomic():
+            ids = notes.changer_approbation(queryset, True)
+            creer_notifications([
+                Notification(
+                    destinataire_id=etudiant_id,
+                    titre="Votre avis a été approuvé",
+                    contenu=f"Votre avis sur le plat {nom_plat} a été publié.",
+                    lien=f"/admin/cantine/avis/{avis_id}/change/"
+                )
+                for avis_id, etudiant_id, nom_plat in Avis.objects.filter(pk__in=ids)
+                .values_list('id', 'etudiant_id', 'plat__nom_plat')
+            ])
+        self.message_user(request, f"{len(ids)} avis approuvés.")
     approuver_avis.short_description = "Approuver les avis sélectionnés"
 
     def desapprouver_avis(self, request, queryset):
-        updated = queryset.update(est_approuve=False)
+        updated = len(notes.changer_approbation(queryset, False))
         self.message_user(request, f"{updated} avis désapprouvés.")
     desapprouver_avis.short_description = "Désapprouver les avis sélectionnés"
 
+@admin.register(ProfilRequete)
+class ProfilRequeteAdmin(admin.ModelAdmin):
+    """Profils capturés par cantine.profilage, en lecture seule."""
+    list_display = ('date', 'methode', 'chemin', 'statut', 'duree_ms', 'nombre_requetes_sql', 'duree_sql_ms')
+    list_filter = ('methode', 'statut')
+    search_fields = ('chemin', 'vue')
+    fields = ('date', 'demandeur_id', 'methode', 'chemin', 'vue', 'statut', 'duree_ms', 'echantillons',
+              'nombre_requetes_sql', 'duree_sql_ms', 'arbre_appels', 'chronologie_sql', 'chronologie_signaux')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def duree_ms(self, obj):
+        return f"{obj.duree * 1000:.1f} ms"
+    duree_ms.short_description = "Durée"
+
+    def duree_sql_ms(self, obj):
+        return f"{obj.duree_sql * 1000:.1f} ms"
+    duree_sql_ms.short_description = "Durée SQL"
+
+    def arbre_appels(self, obj):
+        total = obj.arbre.get('n') or 1
+        lignes = []
+
+        def parcourir(noeud, profondeur):
+            lignes.append(f"{'  ' * profondeur}{noeud['n'] * 100 / total:5.1f} %  {noeud['nom']}  {noeud['fichier']}")
+            for enfant in noeud.get('enfants', []):
+                parcourir(enfant, profondeur + 1)
+        if obj.arbre:
+            parcourir(obj.arbre, 0)
+        return format_html('<pre>{}</pre>', '\n'.join(lignes))
+    arbre_appels.short_description = "Arbre d'appels (part des échantillons)"
+
+    def chronologie_sql(self, obj):
+        return format_html('<pre>{}</pre>', '\n'.join(
+            f"{requete['debut']:9.1f} ms  +{requete['duree']:7.1f} ms  {requete['sql']}" for requete in obj.sql
+        ))
+    chronologie_sql.short_description = "Requêtes SQL"
+
+    def chronologie_signaux(self, obj):
+        return format_html('<pre>{}</pre>', '\n'.join(
+            f"{signal['debut']:9.1f} ms  +{signal['duree']:7.1f} ms  {signal['recepteur']} ({signal['sender']})"
+            for signal in obj.signaux
+        ))
+    chronologie_signaux.short_description = "Récepteurs de signaux"
+
 admin.site.register(User, CustomUserAdmin)
\ No newline at end of file
@@ -7,11 +7,8 @@ def create_default_parameters(**kwargs):
     Fonction appelée après les migrations pour créer les paramètres par défaut.
     """
     try:
-        from .models import Parametre
-        Parametre.objects.get_or_create(
-            nom_parametre='duree_expiration_reservation',
-            defaults={'valeur': '6', 'description': 'Durée en heures avant expiration des réservations'}
-        )
+        from .parametres import creer_defauts
+        creer_defauts()
     except (OperationalError, ProgrammingError):
         # La table n'existe pas encore ou autre erreur de base de données
         pass
@@ -24,3 +21,12 @@ class CantineConfig(AppConfig):
     def ready(self):
         # Connecter la création des paramètres par défaut au signal post_migrate
         post_migrate.connect(create_default_parameters, sender=self)
+
+        # Cache propre à chaque processus avec plusieurs workers (voir cantine.cache_menu)
+        from django.core import checks
+        from .cache_menu import verifier_cache_partage
+        checks.register(verifier_cache_partage, checks.Tags.caches)
+
+        # Durée des tâches Celery (voir cantine.metriques)
+        from .metriques import connecter_celery
+        connecter_celery()
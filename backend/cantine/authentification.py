@@ -0,0 +1,147 @@
+"""
+Authentification JWT sans lecture de l'utilisateur en base.
+
+Les jetons émis par l'application portent, en plus de ``user_id``, les
+revendications ``is_staff`` et ``institut`` (voir JetonRafraichissement).
+JWTAuthenticationRapide vérifie la signature du jeton d'accès et construit
+un UtilisateurJeton à partir de ces revendications : les permissions et la
+plupart des vues n'ont besoin que de l'identifiant et du rôle. La ligne
+``User`` n'est chargée qu'au premier accès à un autre attribut (email,
+date_inscription...) ou quand l'objet est utilisé comme instance de modèle
+(clé étrangère, sérialisation).
+
+simplejwt recopie les revendications du jeton de rafraîchissement dans
+chaque nouveau jeton (d'accès, et de rafraîchissement par rotation) :
+RafraichissementSerializer relit donc l'utilisateur en base à chaque
+rafraîchissement, refuse un compte désactivé et réécrit le rôle dans les
+deux jetons. Un changement de rôle ou une désactivation prend ainsi effet au
+plus tard à l'expiration du jeton d'accès en cours (ACCESS_TOKEN_LIFETIME).
+Les jetons émis avant l'ajout des revendications passent par la lecture en
+base habituelle.
+"""
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+REVENDICATIONS = ('is_staff', 'institut')
+
+
+class JetonRafraichissement(RefreshToken):
+    """Jeton de rafraîchissement dont les jetons d'accès portent le rôle de l'utilisateur."""
+
+    @classmethod
+    def for_user(cls, user):
+        jeton = super().for_user(user)
+        for revendication in REVENDICATIONS:
+            jeton[revendication] = getattr(user, revendication)
+        return jeton
+
+
+class RafraichissementSerializer(TokenRefreshSerializer):
+    """
+    Rafraîchissement qui relit l'utilisateur en base, une fois, pour refuser
+    un compte désactivé et porter son rôle actuel dans les nouveaux jetons.
+    """
+    token_class = JetonRafraichissement
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        try:
+            user = get_user_model().objects.get(
+                **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+            )
+        except get_user_model().DoesNotExist:
+            user = None
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        for revendication in REVENDICATIONS:
+            refresh[revendication] = getattr(user, revendication)
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                # Mettre l'ancien jeton en liste noire (sans effet si l'application n'est pas installée)
+                getattr(refresh, 'blacklist', lambda: None)()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            getattr(refresh, 'outstand', lambda: None)()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class UtilisateurJeton(SimpleLazyObject):
+    """
+    Utilisateur construit depuis les revendications d'un jeton validé.
+
+    ``id``, ``pk``, ``is_staff`` et ``institut`` sont lus dans le jeton ; tout
+    autre attribut charge l'utilisateur en base, une seule fois par requête.
+    """
+
+    def __init__(self, jeton):
+        # simplejwt sérialise l'identifiant en chaîne
+        utilisateur_id = get_user_model()._meta.pk.to_python(jeton[api_settings.USER_ID_CLAIM])
+
+        def charger():
+            try:
+                return get_user_model().objects.get(**{api_settings.USER_ID_FIELD: utilisateur_id})
+            except get_user_model().DoesNotExist:
+                raise AuthenticationFailed("Utilisateur introuvable.", code='user_not_found')
+
+        super().__init__(charger)
+        self.__dict__['_revendications'] = {
+            'pk': utilisateur_id,
+            'id': utilisateur_id,
+            **{revendication: jeton[revendication] for revendication in REVENDICATIONS},
+        }
+
+    def _revendication(self, nom):
+        # Une fois chargé, l'utilisateur en base fait foi
+        if self._wrapped is not empty:
+            return getattr(self._wrapped, nom)
+        return self.__dict__['_revendications'][nom]
+
+    pk = property(lambda self: self._revendication('pk'))
+    id = property(lambda self: self._revendication('id'))
+    is_staff = property(lambda self: self._revendication('is_staff'))
+    institut = property(lambda self: self._revendication('institut'))
+
+    is_authenticated = True
+    is_anonymous = False
+
+    # IsAuthenticated teste ``request.user`` : ne pas charger pour autant
+    def __bool__(self):
+        return True
+
+    def __eq__(self, autre):
+        if isinstance(autre, UtilisateurJeton):
+            return self.pk == autre.pk
+        return isinstance(autre, get_user_model()) and autre.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    @property
+    def est_charge(self):
+        return self._wrapped is not empty
+
+    def __repr__(self):
+        if self._wrapped is empty:
+            return f"<UtilisateurJeton: {self.pk}>"
+        return repr(self._wrapped)
+
+
+class JWTAuthenticationRapide(JWTAuthentication):
+    """JWTAuthentication sans lecture en base pour les jetons portant le rôle."""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Le jeton ne contient pas d'identifiant utilisateur.")
+        if any(revendication not in validated_token for revendication in REVENDICATIONS):
+            return super().get_user(validated_token)
+        return UtilisateurJeton(validated_token)
@@ -0,0 +1,174 @@
+"""
+Cache en lecture des menus (plats et emplois du temps).
+
+Les données sérialisées sont conservées dans un LRU local au processus,
+devant le cache partagé de Django (Redis en production). Les clés incluent
+des numéros de version : une modification d'un plat ou d'un emploi du temps
+change la version concernée (semaine ISO, liste complète ou plats) et les
+anciennes entrées ne sont plus jamais lues.
+
+Sans cache partagé (LocMemCache, un par processus, quand REDIS_URL n'est
+pas défini), une modification ne change la version que dans le processus
+qui l'a faite. Les versions y expirent alors au bout de DUREE_VERSION_LOCALE
+secondes : les autres workers reconstruisent leurs entrées au plus tard
+après ce délai.
+
+Les places disponibles changent à chaque réservation sans passer par les
+signaux : elles ne sont pas mises en cache mais relues en base à chaque
+requête et superposées aux données du cache.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+VERSION_PLATS = 'menu:version:plats'
+VERSION_EMPLOIS = 'menu:version:emplois'
+DUREE_CACHE = 24 * 3600
+DUREE_VERSION_LOCALE = 30
+CACHES_LOCAUX = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cle_version_semaine(semaine):
+    return f'menu:version:semaine:{semaine}'
+
+
+def semaine_iso(jour):
+    """Retourne la semaine ISO d'une date sous la forme '2025-W20'."""
+    annee, semaine, _ = jour.isocalendar()
+    return f"{annee}-W{semaine:02d}"
+
+
+def lundi_de_semaine(semaine):
+    """Convertit '2025-W20' en date du lundi correspondant."""
+    try:
+        annee, numero = semaine.split('-W')
+        return date.fromisocalendar(int(annee), int(numero), 1)
+    except ValueError:
+        raise ValidationError({'semaine': ["Semaine invalide, format attendu : AAAA-Wss."]})
+
+
+class CacheLRU:
+    """Petit cache LRU thread-safe, local au processus."""
+
+    def __init__(self, taille_max=256):
+        self.taille_max = taille_max
+        self._donnees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle):
+        with self._verrou:
+            try:
+                self._donnees.move_to_end(cle)
+                return self._donnees[cle]
+            except KeyError:
+                return None
+
+    def set(self, cle, valeur):
+        with self._verrou:
+            self._donnees[cle] = valeur
+            self._donnees.move_to_end(cle)
+            while len(self._donnees) > self.taille_max:
+                self._donnees.popitem(last=False)
+
+    def clear(self):
+        with self._verrou:
+            self._donnees.clear()
+
+
+cache_local = CacheLRU()
+
+
+def duree_version():
+    """Durée de vie des versions : illimitée si le cache est partagé entre processus."""
+    return DUREE_VERSION_LOCALE if settings.CACHES['default']['BACKEND'] in CACHES_LOCAUX else None
+
+
+def verifier_cache_partage(app_configs, **kwargs):
+    """Vérification système : plusieurs workers gunicorn (WEB_CONCURRENCY) sans cache partagé."""
+    try:
+        workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    except ValueError:
+        workers = 1
+    if workers > 1 and duree_version() is not None:
+        return [checks.Warning(
+            f"{workers} workers sans cache partagé : une modification des menus ou des paramètres "
+            f"n'est vue des autres workers qu'après {DUREE_VERSION_LOCALE} s.",
+            hint="Définir REDIS_URL.",
+            id='cantine.W001',
+        )]
+    return []
+
+
+def versions(*cles):
+    """
+    Lit les versions courantes dans le cache partagé. Une version absente
+    (cache vidé ou évincé) est initialisée à l'horodatage courant, jamais à
+    une valeur déjà utilisée.
+    """
+    valeurs = cache.get_many(cles)
+    manquantes = [cle for cle in cles if cle not in valeurs]
+    for cle in manquantes:
+        cache.add(cle, time.time_ns(), duree_version())
+    if manquantes:
+        valeurs.update(cache.get_many(manquantes))
+    return valeurs
+
+
+def invalider(*cles):
+    """Change les versions données une fois la transaction validée."""
+    def changer():
+        cache.set_many({cle: time.time_ns() for cle in cles}, duree_version())
+    transaction.on_commit(changer)
+
+
+def lire(cle, construire):
+    """Lit ``cle`` dans le LRU local, puis le cache partagé, sinon la construit."""
+    valeur = cache_local.get(cle)
+    if valeur is None:
+        valeur = cache.get(cle)
+        if valeur is None:
+            valeur = construire()
+            cache.set(cle, valeur, DUREE_CACHE)
+        cache_local.set(cle, valeur)
+    return valeur
+
+
+def etag(*parties):
+    empreinte = hashlib.sha1(repr(parties).encode()).hexdigest()
+    return f'"{empreinte}"'
+
+
+def reponse_conditionnelle(request, valeur_etag, donnees):
+    """
+    Retourne 304 si le client possède déjà cette version, sinon les données.
+    ``donnees`` est un appelable évalué seulement si nécessaire.
+    """
+    if valeur_etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(donnees())
+    response['ETag'] = valeur_etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def semaines_concernees(*dates):
+    return {cle_version_semaine(semaine_iso(jour)) for jour in dates if jour}
+
+
+def bornes_semaine(lundi):
+    return lundi, lundi + timedelta(days=6)
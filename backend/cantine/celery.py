@@ -11,6 +11,7 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'expirer-reservations': {
         'task': 'cantine.tasks.expirer_reservations',
-        'schedule': crontab(minute=0, hour='*/1'),  # Toutes les heures
+        # Balayage incrémental : une lecture du cache tant qu'aucune échéance n'est passée
+        'schedule': crontab(),  # Toutes les minutes
     },
 }
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Consommateurs WebSocket : places disponibles et notifications en direct.
+
+Le client se connecte à ``/ws/cantine/?token=<jeton d'accès JWT>`` puis
+s'abonne aux semaines affichées :
+
+    {"action": "abonner", "semaine": "2025-W20"}
+    {"action": "desabonner", "semaine": "2025-W20"}
+
+Messages reçus :
+
+    {"type": "places", "places": {"<id emploi du temps>": quantite, ...}}
+    {"type": "notification", "notification": {...}}
+
+Les places sont envoyées en entier à l'abonnement, puis seulement les
+créneaux modifiés (voir cantine.temps_reel).
+"""
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.middleware import BaseMiddleware
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from . import cache_menu
+from .authentification import JWTAuthenticationRapide
+from .models import EmploiDuTemps
+from .temps_reel import GROUPE_DIFFUSIONS, groupe_notifications, relais
+
+logger = logging.getLogger(__name__)
+
+MAX_ABONNEMENTS = 8
+
+
+@database_sync_to_async
+def utilisateur_depuis_jeton(jeton):
+    # Lecture en base seulement pour les anciens jetons, sans revendications
+    authentification = JWTAuthenticationRapide()
+    try:
+        return authentification.get_user(authentification.get_validated_token(jeton))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authentifie la connexion WebSocket par le jeton d'accès passé en
+    paramètre ``token`` ; sans jeton valide, l'utilisateur de la session
+    (AuthMiddlewareStack) est conservé.
+    """
+
+    async def __call__(self, scope, receive, send):
+        jeton = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        if jeton:
+            utilisateur = await utilisateur_depuis_jeton(jeton)
+            if utilisateur is not None:
+                scope = dict(scope, user=utilisateur)
+        return await super().__call__(scope, receive, send)
+
+
+class CantineConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        self.utilisateur = self.scope.get('user')
+        if self.utilisateur is None or not self.utilisateur.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.semaines = set()
+        self.groupes = [groupe_notifications(self.utilisateur.pk)]
+        if not self.utilisateur.is_staff:
+            self.groupes.append(GROUPE_DIFFUSIONS)
+        for groupe in self.groupes:
+            await self.channel_layer.group_add(groupe, self.channel_name)
+
+        self._places_en_attente = {}
+        self._envoi = None
+        await relais.demarrer()
+        await self.accept()
+
+    async def disconnect(self, code):
+        if not hasattr(self, 'semaines'):
+            return
+        relais.desabonner(self)
+        for groupe in self.groupes:
+            await self.channel_layer.group_discard(groupe, self.channel_name)
+        if self._envoi:
+            self._envoi.cancel()
+
+    async def receive_json(self, contenu, **kwargs):
+        action = contenu.get('action')
+        try:
+            semaine = cache_menu.semaine_iso(cache_menu.lundi_de_semaine(str(contenu.get('semaine', ''))))
+        except ValidationError:
+            await self.send_json({'type': 'erreur', 'detail': "Semaine invalide, format attendu : AAAA-Wss."})
+            return
+
+        if action == 'abonner':
+            if semaine not in self.semaines and len(self.semaines) >= MAX_ABONNEMENTS:
+                await self.send_json({'type': 'erreur', 'detail': "Trop d'abonnements."})
+                return
+            self.semaines.add(semaine)
+            relais.abonner(self, semaine)
+            places = await database_sync_to_async(self.places_de_semaine)(semaine)
+            await self.send_json({'type': 'places', 'semaine': semaine, 'places': places})
+        elif action == 'desabonner':
+            self.semaines.discard(semaine)
+            relais.desabonner(self, semaine)
+        else:
+            await self.send_json({'type': 'erreur', 'detail': "Action inconnue."})
+
+    @staticmethod
+    def places_de_semaine(semaine):
+        lundi = cache_menu.lundi_de_semaine(semaine)
+        return {
+            str(emploi_id): quantite
+            for emploi_id, quantite in EmploiDuTemps.objects.filter(
+                date__range=cache_menu.bornes_semaine(lundi)
+            ).values_list('id', 'quantite_disponible')
+        }
+
+    def pousser_places(self, places):
+        """
+        Appelé par le relais. Les valeurs en attente sont fusionnées : une
+        socket lente reçoit directement la dernière quantité de chaque créneau.
+        """
+        self._places_en_attente.update(places)
+        if self._envoi is None or self._envoi.done():
+            self._envoi = asyncio.get_running_loop().create_task(self._envoyer_places())
+
+    async def _envoyer_places(self):
+        while self._places_en_attente:
+            places, self._places_en_attente = self._places_en_attente, {}
+            await self.send_json({'type': 'places', 'places': {str(k): v for k, v in places.items()}})
+
+    async def notification_nouvelle(self, event):
+        await self.send_json({'type': 'notification', 'notification': event['notification']})
@@ -0,0 +1,247 @@
+"""
+Couche de canaux multi-processus, partitionnée sur plusieurs serveurs Redis.
+
+La couche en mémoire de Channels ne franchit pas les limites d'un processus.
+Celle-ci s'appuie sur Redis (ou sur cantine.courtier_local, qui en parle le
+protocole) :
+
+- chaque processus lit une seule liste Redis, partagée par tous ses canaux
+  (``specific.<processus>!<canal>``) et démultiplexée localement ;
+- un groupe est un ensemble trié (membre, date d'ajout) ;
+- ``group_send`` regroupe les membres par processus destinataire : un seul
+  message porte la liste des canaux visés, et les écritures sont envoyées
+  par pipeline, un par serveur, en parallèle. Un groupe de 3000 sockets
+  réparties sur 4 processus coûte 4 écritures, pas 3000 ;
+- les clés (groupes, listes de processus) sont réparties entre les serveurs
+  de ``hotes`` par hachage de leur nom : les groupes d'utilisateurs ou de
+  créneaux se répartissent d'eux-mêmes.
+
+Les messages sont sérialisés en JSON. La capacité d'un canal est appliquée
+à la réception, dans le processus destinataire : au-delà, les messages de
+ce canal sont abandonnés et signalés dans les logs.
+
+Configuration (settings.CHANNEL_LAYERS) :
+
+    'BACKEND': 'cantine.couche_canaux.CoucheCanauxPartitionnee',
+    'CONFIG': {'hotes': ['redis://r1:6379/2', 'redis://r2:6379/2']},
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+import zlib
+from collections import defaultdict
+
+import redis.asyncio as redis
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+
+class CoucheCanauxPartitionnee(BaseChannelLayer):
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, hotes=('redis://localhost:6379/0',), prefixe='canaux', expiry=60,
+                 group_expiry=86400, capacity=100, channel_capacity=None, delai_lecture=5,
+                 regrouper=True, connexions_max=100):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.hotes = list(hotes)
+        self.prefixe = prefixe
+        self.group_expiry = group_expiry
+        self.delai_lecture = delai_lecture
+        self.regrouper = regrouper
+        self.connexions_max = connexions_max
+        self.nom_client = uuid.uuid4().hex[:12]
+        # Les clients redis.asyncio sont liés à une boucle d'événements
+        self._clients = {}
+        self._files = {}
+        self._lecteur = None
+        self.abandonnes = 0
+
+    # Répartition
+
+    def _fragment(self, cle):
+        return zlib.crc32(cle.encode()) % len(self.hotes)
+
+    def _client(self, index):
+        boucle = asyncio.get_running_loop()
+        clients = self._clients.get(boucle)
+        if clients is None:
+            for ancienne in [b for b in self._clients if b.is_closed()]:
+                del self._clients[ancienne]
+            # RESP2 : compris par toutes les versions de Redis et par le courtier local.
+            # Pool bloquant : une rafale de group_add attend une connexion libre
+            # au lieu d'échouer.
+            clients = self._clients[boucle] = [
+                redis.Redis.from_pool(redis.BlockingConnectionPool.from_url(
+                    hote, protocol=2, max_connections=self.connexions_max, timeout=None,
+                ))
+                for hote in self.hotes
+            ]
+        return clients[index]
+
+    def _cle_canal(self, canal):
+        return f"{self.prefixe}:c:{self.non_local_name(canal)}"
+
+    def _cle_groupe(self, groupe):
+        return f"{self.prefixe}:g:{groupe}"
+
+    # API des couches de canaux
+
+    async def new_channel(self, prefix='specific'):
+        return f"{prefix}.{self.nom_client}!{uuid.uuid4().hex[:12]}"
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.valid_channel_name(channel)
+        cle = self._cle_canal(channel)
+        client = self._client(self._fragment(cle))
+        # Les canaux de processus sont bornés à la réception (voir _lire_processus)
+        if "!" not in channel and await client.llen(cle) >= self.get_capacity(channel):
+            raise ChannelFull(channel)
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.rpush(cle, self._encoder([channel], message))
+            pipe.expire(cle, self.expiry)
+            await pipe.execute()
+
+    async def receive(self, channel):
+        self.valid_channel_name(channel)
+        if "!" not in channel:
+            # Canal ordinaire (runworker) : lecture directe de sa liste
+            cle = self._cle_canal(channel)
+            while True:
+                resultat = await self._client(self._fragment(cle)).blpop(cle, timeout=self.delai_lecture)
+                if resultat:
+                    _, message = self._decoder(resultat[1])
+                    return message
+
+        self._demarrer_lecteur()
+        file = self._files.setdefault(channel, asyncio.Queue())
+        try:
+            return await file.get()
+        except asyncio.CancelledError:
+            # Consommateur arrêté : son tampon n'a plus de lecteur
+            if file.empty():
+                self._files.pop(channel, None)
+            raise
+
+    def _demarrer_lecteur(self):
+        boucle = asyncio.get_running_loop()
+        if self._lecteur is None or self._lecteur.done() or self._lecteur.get_loop() is not boucle:
+            self._lecteur = boucle.create_task(self._lire_processus())
+
+    async def _lire_processus(self):
+        """Lit la liste du processus et distribue les messages aux canaux locaux."""
+        cle = self._cle_canal(f"specific.{self.nom_client}!")
+        client = self._client(self._fragment(cle))
+        # Aucune exception ne doit arrêter la tâche : les consommateurs bloqués
+        # dans file.get() ne la relanceraient pas (seul receive() le fait)
+        while True:
+            try:
+                resultat = await client.blpop(cle, timeout=self.delai_lecture)
+            except Exception:
+                # Connexion perdue, délai dépassé... : nouvel essai après une pause
+                logger.exception("Lecture de la couche de canaux interrompue")
+                await asyncio.sleep(1)
+                continue
+            if not resultat:
+                continue
+            try:
+                canaux, message = self._decoder(resultat[1])
+            except (ValueError, KeyError, TypeError):
+                logger.exception("Message illisible sur %s, ignoré", cle)
+                continue
+            for canal in canaux:
+                file = self._files.setdefault(canal, asyncio.Queue())
+                if file.qsize() >= self.get_capacity(canal):
+                    self.abandonnes += 1
+                    logger.warning("Canal %s plein, message abandonné", canal)
+                    continue
+                file.put_nowait(message)
+
+    async def group_add(self, group, channel):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        cle = self._cle_groupe(group)
+        async with self._client(self._fragment(cle)).pipeline(transaction=False) as pipe:
+            pipe.zadd(cle, {channel: time.time()})
+            pipe.expire(cle, self.group_expiry)
+            await pipe.execute()
+
+    async def group_discard(self, group, channel):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        cle = self._cle_groupe(group)
+        await self._client(self._fragment(cle)).zrem(cle, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.valid_group_name(group)
+        cle = self._cle_groupe(group)
+        async with self._client(self._fragment(cle)).pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(cle, 0, time.time() - self.group_expiry)
+            pipe.zrangebyscore(cle, 0, '+inf')
+            _, membres = await pipe.execute()
+        if not membres:
+            return
+
+        # Un message par liste destinataire, portant tous ses canaux
+        destinations = defaultdict(list)
+        for membre in membres:
+            canal = membre.decode()
+            destinations[self._cle_canal(canal)].append(canal)
+
+        par_fragment = defaultdict(list)
+        for cle_canal, canaux in destinations.items():
+            if self.regrouper:
+                par_fragment[self._fragment(cle_canal)].append((cle_canal, self._encoder(canaux, message)))
+            else:
+                for canal in canaux:
+                    par_fragment[self._fragment(cle_canal)].append((cle_canal, self._encoder([canal], message)))
+
+        await asyncio.gather(*(
+            self._ecrire(index, ecritures) for index, ecritures in par_fragment.items()
+        ))
+
+    async def _ecrire(self, index, ecritures):
+        async with self._client(index).pipeline(transaction=False) as pipe:
+            for cle, donnees in ecritures:
+                pipe.rpush(cle, donnees)
+                pipe.expire(cle, self.expiry)
+            await pipe.execute()
+
+    async def flush(self):
+        for index in range(len(self.hotes)):
+            client = self._client(index)
+            cles = await client.keys(f"{self.prefixe}:*")
+            if cles:
+                await client.delete(*cles)
+        self._files.clear()
+
+    async def close(self):
+        boucle = asyncio.get_running_loop()
+        if self._lecteur is not None and self._lecteur.get_loop() is boucle:
+            self._lecteur.cancel()
+            try:
+                await self._lecteur
+            except asyncio.CancelledError:
+                pass
+            self._lecteur = None
+        clients = self._clients.pop(boucle, [])
+        for client in clients:
+            await client.aclose()
+
+    # Sérialisation
+
+    @staticmethod
+    def _encoder(canaux, message):
+        return json.dumps({'canaux': canaux, 'message': message}, separators=(',', ':'))
+
+    @staticmethod
+    def _decoder(donnees):
+        contenu = json.loads(donnees)
+        return contenu['canaux'], contenu['message']
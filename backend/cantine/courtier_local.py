@@ -0,0 +1,246 @@
+"""
+Courtier local pour la couche de canaux, sans service externe.
+
+Petit serveur asyncio sur socket Unix (ou TCP) qui parle le protocole Redis
+(RESP2) pour le seul sous-ensemble de commandes utilisé par
+cantine.couche_canaux : listes, ensembles triés, expiration, BLPOP. Il
+remplace Redis en développement et dans les bancs d'essai multi-processus :
+
+    python manage.py courtier_local --socket /tmp/cantine-canaux.sock
+    CANAUX_HOTES=unix:///tmp/cantine-canaux.sock python manage.py runserver
+
+Tout est en mémoire, sans persistance ni réplication.
+"""
+import asyncio
+import fnmatch
+import logging
+import time
+from bisect import insort
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class ErreurCommande(Exception):
+    pass
+
+
+class CourtierLocal:
+
+    def __init__(self):
+        self.listes = {}
+        self.ensembles = {}  # cle -> {membre: score}
+        self.expirations = {}
+        self.attentes = defaultdict(deque)  # cle -> futures de BLPOP
+
+    # Expiration paresseuse, à chaque accès
+
+    def _vivante(self, cle):
+        echeance = self.expirations.get(cle)
+        if echeance is not None and echeance <= time.monotonic():
+            self._supprimer(cle)
+        return cle in self.listes or cle in self.ensembles
+
+    def _supprimer(self, cle):
+        existait = self.listes.pop(cle, None) is not None
+        existait = self.ensembles.pop(cle, None) is not None or existait
+        self.expirations.pop(cle, None)
+        return existait
+
+    async def _purger(self, intervalle=1.0):
+        while True:
+            await asyncio.sleep(intervalle)
+            for cle in list(self.expirations):
+                self._vivante(cle)
+
+    # Commandes
+
+    def cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_rpush(self, cle, *valeurs):
+        self._vivante(cle)
+        liste = self.listes.setdefault(cle, deque())
+        liste.extend(valeurs)
+        taille = len(liste)
+        # Servir d'abord les BLPOP en attente, dans l'ordre d'arrivée
+        attentes = self.attentes.get(cle)
+        while attentes and liste:
+            future = attentes.popleft()
+            if not future.done():
+                future.set_result((cle, liste.popleft()))
+        if not liste:
+            self._supprimer(cle)
+        return taille
+
+    def cmd_lpop(self, cle):
+        if not self._vivante(cle) or cle not in self.listes:
+            return None
+        liste = self.listes[cle]
+        valeur = liste.popleft()
+        if not liste:
+            self._supprimer(cle)
+        return valeur
+
+    def cmd_llen(self, cle):
+        return len(self.listes[cle]) if self._vivante(cle) and cle in self.listes else 0
+
+    def cmd_expire(self, cle, secondes):
+        if not self._vivante(cle):
+            return 0
+        self.expirations[cle] = time.monotonic() + int(secondes)
+        return 1
+
+    def cmd_del(self, *cles):
+        return sum(1 for cle in cles if self._vivante(cle) and self._supprimer(cle))
+
+    def cmd_keys(self, motif):
+        return [cle for cle in list(self.listes) + list(self.ensembles)
+                if self._vivante(cle) and fnmatch.fnmatchcase(cle.decode(), motif.decode())]
+
+    def cmd_zadd(self, cle, *paires):
+        self._vivante(cle)
+        ensemble = self.ensembles.setdefault(cle, {})
+        ajoutes = 0
+        for i in range(0, len(paires), 2):
+            membre = paires[i + 1]
+            ajoutes += membre not in ensemble
+            ensemble[membre] = float(paires[i])
+        return ajoutes
+
+    def cmd_zrem(self, cle, *membres):
+        if not self._vivante(cle) or cle not in self.ensembles:
+            return 0
+        ensemble = self.ensembles[cle]
+        retires = sum(1 for membre in membres if ensemble.pop(membre, None) is not None)
+        if not ensemble:
+            self._supprimer(cle)
+        return retires
+
+    @staticmethod
+    def _borne(valeur):
+        valeur = valeur.decode()
+        if valeur in ('-inf', '+inf', 'inf'):
+            return float(valeur)
+        return float(valeur.lstrip('('))
+
+    def cmd_zrangebyscore(self, cle, minimum, maximum):
+        if not self._vivante(cle) or cle not in self.ensembles:
+            return []
+        bas, haut = self._borne(minimum), self._borne(maximum)
+        tries = []
+        for membre, score in self.ensembles[cle].items():
+            if bas <= score <= haut:
+                insort(tries, (score, membre))
+        return [membre for _, membre in tries]
+
+    def cmd_zremrangebyscore(self, cle, minimum, maximum):
+        membres = self.cmd_zrangebyscore(cle, minimum, maximum)
+        return self.cmd_zrem(cle, *membres) if membres else 0
+
+    def cmd_client(self, *args):
+        return 'OK'
+
+    async def cmd_blpop(self, *args):
+        *cles, delai = args
+        for cle in cles:
+            valeur = self.cmd_lpop(cle)
+            if valeur is not None:
+                return [cle, valeur]
+        future = asyncio.get_running_loop().create_future()
+        for cle in cles:
+            self.attentes[cle].append(future)
+        try:
+            delai = float(delai)
+            cle, valeur = await asyncio.wait_for(future, delai or None)
+            return [cle, valeur]
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            for cle in cles:
+                attentes = self.attentes.get(cle)
+                if attentes is not None:
+                    try:
+                        attentes.remove(future)
+                    except ValueError:
+                        pass
+                    if not attentes:
+                        del self.attentes[cle]
+
+    # Protocole RESP2
+
+    async def servir_client(self, lecteur, ecrivain):
+        try:
+            while True:
+                commande = await self._lire_commande(lecteur)
+                if commande is None:
+                    break
+                try:
+                    methode = getattr(self, f'cmd_{commande[0].decode().lower()}', None)
+                    if methode is None:
+                        raise ErreurCommande(f"ERR unknown command '{commande[0].decode()}'")
+                    reponse = methode(*commande[1:])
+                    if asyncio.iscoroutine(reponse):
+                        reponse = await reponse
+                    ecrivain.write(self._encoder(reponse))
+                except ErreurCommande as e:
+                    ecrivain.write(f"-{e}\r\n".encode())
+                except (TypeError, ValueError, IndexError):
+                    ecrivain.write(b"-ERR syntax error\r\n")
+                await ecrivain.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            ecrivain.close()
+
+    @staticmethod
+    async def _lire_commande(lecteur):
+        ligne = await lecteur.readline()
+        if not ligne:
+            return None
+        if not ligne.startswith(b'*'):
+            # Commande en ligne (telnet, redis-cli --no-raw)
+            return ligne.split()
+        arguments = []
+        for _ in range(int(ligne[1:])):
+            entete = await lecteur.readline()
+            taille = int(entete[1:])
+            donnees = await lecteur.readexactly(taille + 2)
+            arguments.append(donnees[:-2])
+        return arguments
+
+    def _encoder(self, valeur):
+        if valeur is None:
+            return b"$-1\r\n"
+        if isinstance(valeur, bool):
+            valeur = int(valeur)
+        if isinstance(valeur, int):
+            return f":{valeur}\r\n".encode()
+        if isinstance(valeur, str):
+            return f"+{valeur}\r\n".encode()
+        if isinstance(valeur, bytes):
+            return b"$%d\r\n%s\r\n" % (len(valeur), valeur)
+        if isinstance(valeur, list):
+            return b"*%d\r\n" % len(valeur) + b"".join(self._encoder(v) for v in valeur)
+        raise TypeError(valeur)
+
+
+async def demarrer(socket=None, hote='127.0.0.1', port=None):
+    """Démarre un courtier et retourne le serveur asyncio."""
+    courtier = CourtierLocal()
+    if socket:
+        serveur = await asyncio.start_unix_server(courtier.servir_client, path=socket)
+    else:
+        serveur = await asyncio.start_server(courtier.servir_client, hote, port)
+    asyncio.get_running_loop().create_task(courtier._purger())
+    return serveur
+
+
+def executer(socket=None, hote='127.0.0.1', port=None):
+    """Point d'entrée bloquant (commande courtier_local, bancs d'essai)."""
+    async def principal():
+        serveur = await demarrer(socket, hote, port)
+        logger.info("Courtier local en écoute sur %s", socket or f"{hote}:{port}")
+        async with serveur:
+            await serveur.serve_forever()
+    asyncio.run(principal())
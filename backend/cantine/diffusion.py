@@ -0,0 +1,63 @@
+"""
+Diffusion des notifications à l'ensemble des étudiants.
+
+Une diffusion est stockée une seule fois dans ``NotificationDiffusee`` au
+lieu d'être copiée pour chaque étudiant : l'envoi coûte une insertion quelle
+que soit la taille de la population. L'état lu / supprimé de chaque étudiant
+est écrit à la demande dans ``EtatNotificationDiffusee``.
+"""
+import logging
+
+from django.db.models import Exists, OuterRef
+
+from .models import NotificationDiffusee, EtatNotificationDiffusee
+
+logger = logging.getLogger(__name__)
+
+
+def diffuser_notification(titre, contenu, lien, cle=None):
+    """
+    Enregistre une notification visible par tous les étudiants.
+
+    Si ``cle`` est fournie, une seule diffusion existe pour cette clé : les
+    appels suivants retournent la diffusion existante sans en créer d'autre.
+    """
+    if cle:
+        diffusion, creee = NotificationDiffusee.objects.get_or_create(
+            cle=cle,
+            defaults={'titre': titre, 'contenu': contenu, 'lien': lien},
+        )
+    else:
+        diffusion, creee = NotificationDiffusee.objects.create(
+            titre=titre, contenu=contenu, lien=lien
+        ), True
+    if creee:
+        logger.info("Diffusion '%s' enregistrée", titre)
+    return diffusion
+
+
+def notifications_diffusees(utilisateur):
+    """
+    Diffusions visibles par ``utilisateur``, annotées de ``est_lue``.
+
+    Les diffusions s'adressent aux étudiants : le personnel n'en reçoit pas.
+    Celles que l'étudiant a supprimées sont exclues.
+    """
+    if utilisateur.is_staff:
+        return NotificationDiffusee.objects.none()
+    etats = EtatNotificationDiffusee.objects.filter(
+        notification=OuterRef('pk'), utilisateur=utilisateur
+    )
+    return (
+        NotificationDiffusee.objects
+        .filter(date_envoi__gte=utilisateur.date_inscription)
+        .exclude(Exists(etats.filter(est_supprimee=True)))
+        .annotate(est_lue=Exists(etats.filter(est_lue=True)))
+    )
+
+
+def modifier_etat(diffusion, utilisateur, **champs):
+    """Crée ou met à jour l'état de ``diffusion`` pour ``utilisateur``."""
+    EtatNotificationDiffusee.objects.update_or_create(
+        notification=diffusion, utilisateur=utilisateur, defaults=champs
+    )
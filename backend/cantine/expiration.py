@@ -0,0 +1,196 @@
+"""
+Expiration des réservations en attente.
+
+Une réservation en attente depuis plus de ``duree_expiration_reservation``
+heures est expirée, que la transition soit écrite en base ou non :
+
+- en lecture, ``annoter`` ajoute ``statut_effectif`` (calculé par la base à
+  partir de ``statut`` et ``date_reservation``) et ``q_statuts`` filtre sur
+  ce statut avec l'index (statut, date_reservation) ; les serializers
+  affichent ``statut_de(reservation)`` ;
+- en écriture, ``expirer`` persiste les transitions (cantine.transitions,
+  qui rend les places au créneau) et notifie les étudiants, par lots ;
+- ``balayer`` (tâche Celery) ne parcourt la table que lorsque la prochaine
+  échéance est passée. Cette échéance, gardée dans le cache partagé, est
+  celle de la plus ancienne réservation en attente : les réservations
+  créées ensuite expirent forcément plus tard. Sans réservation en attente,
+  rien ne peut expirer avant ``maintenant + durée``.
+
+Une lecture qui constate que l'échéance est passée déclenche le balayage
+(``declencher_si_echu``) : les places retenues par des réservations expirées
+sont rendues sans attendre le passage suivant de Celery beat.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from . import transitions
+from .models import Notification, Parametre, Reservation
+from .temps_reel import creer_notifications
+
+logger = logging.getLogger(__name__)
+
+# Nombre de réservations traitées par transaction
+TAILLE_LOT = 2000
+# Durée de vie de l'échéance en cache : au pire, un balayage complet par heure
+DUREE_ECHEANCE = 3600
+CLE_BALAYAGE = 'expiration:balayage_en_cours'
+# Intervalle minimal entre deux lancements du balayage depuis les requêtes
+DUREE_BALAYAGE = 60
+
+
+def _cle_echeance(duree):
+    # La durée fait partie de la clé : la modifier invalide l'échéance
+    return f'expiration:prochaine_echeance:{duree}'
+
+
+def limite(maintenant=None):
+    """Date de réservation avant laquelle une réservation en attente est expirée."""
+    return (maintenant or timezone.now()) - timedelta(hours=Parametre.get_duree_expiration())
+
+
+def expression_statut(limite_expiration=None):
+    return Case(
+        When(statut='en_attente', date_reservation__lt=limite_expiration or limite(), then=Value('expire')),
+        default=F('statut'),
+        output_field=models.CharField(),
+    )
+
+
+def annoter(queryset, limite_expiration=None):
+    """Ajoute ``statut_effectif`` aux réservations de ``queryset``."""
+    return queryset.annotate(statut_effectif=expression_statut(limite_expiration))
+
+
+def q_statuts(statuts, limite_expiration=None):
+    """Condition sur le statut effectif, exprimée sur les colonnes indexées."""
+    limite_expiration = limite_expiration or limite()
+    condition = Q(pk__in=[])
+    for statut in statuts:
+        if statut == 'expire':
+            condition |= Q(statut='expire') | Q(statut='en_attente', date_reservation__lt=limite_expiration)
+        elif statut == 'en_attente':
+            condition |= Q(statut='en_attente', date_reservation__gte=limite_expiration)
+        else:
+            condition |= Q(statut=statut)
+    return condition
+
+
+def statut_de(reservation, limite_expiration=None):
+    """Statut effectif d'une réservation, annotée ou non, sans requête."""
+    statut = getattr(reservation, 'statut_effectif', None)
+    if statut is not None:
+        return statut
+    if reservation.statut == 'en_attente' and reservation.date_reservation \
+            and reservation.date_reservation < (limite_expiration or limite()):
+        return 'expire'
+    return reservation.statut
+
+
+def expirables(limite_expiration):
+    """Réservations en attente depuis avant ``limite_expiration``."""
+    return Reservation.objects.filter(
+        statut='en_attente',
+        date_reservation__lt=limite_expiration,
+    )
+
+
+def _expirer_lot(echues, duree, apres_id, taille_lot):
+    """
+    Expire un lot de réservations échues d'id > ``apres_id``.
+
+    Le passage au statut 'expire', la restitution des places (voir
+    cantine.transitions) et les notifications sont écrits dans la même
+    transaction : un lot est soit entièrement traité, soit pas du tout.
+
+    Retourne ``(nombre_expirees, dernier_id)`` ; ``dernier_id`` vaut None
+    lorsqu'il ne reste plus rien à traiter.
+    """
+    with transaction.atomic():
+        expirees = transitions.transitionner(echues.filter(pk__gt=apres_id), 'expire', limite=taille_lot)
+        if not expirees:
+            return 0, None
+        creer_notifications([
+            Notification(
+                destinataire_id=t.etudiant_id,
+                titre="Réservation expirée",
+                contenu=f"Votre réservation pour {t.nom_plat} a expiré automatiquement après {duree} heures.",
+                lien=f"/reservations/{t.id}"
+            )
+            for t in expirees
+        ], batch_size=taille_lot)
+    return len(expirees), expirees[-1].id
+
+
+def expirer(taille_lot=TAILLE_LOT, **filtres):
+    """
+    Persiste l'expiration des réservations échues (restreintes par
+    ``filtres``, toutes par défaut) et retourne leur nombre.
+    """
+    duree = Parametre.get_duree_expiration()
+    echues = expirables(limite()).filter(**filtres)
+    # Cas courant (rien d'échu) : une lecture d'index, sans transaction
+    if not echues.exists():
+        return 0
+
+    total = 0
+    dernier_id = 0
+    while dernier_id is not None:
+        expirees, dernier_id = _expirer_lot(echues, duree, dernier_id, taille_lot)
+        total += expirees
+    return total
+
+
+def prochaine_echeance(maintenant=None):
+    """Échéance de la plus ancienne réservation en attente (une lecture d'index)."""
+    maintenant = maintenant or timezone.now()
+    premiere = (
+        Reservation.objects.filter(statut='en_attente')
+        .order_by('date_reservation')
+        .values_list('date_reservation', flat=True)
+        .first()
+    )
+    return (premiere or maintenant) + timedelta(hours=Parametre.get_duree_expiration())
+
+
+def echeance_passee():
+    echeance = cache.get(_cle_echeance(Parametre.get_duree_expiration()))
+    return echeance is None or echeance <= timezone.now()
+
+
+def balayer(taille_lot=TAILLE_LOT):
+    """Expire les réservations échues si la prochaine échéance est passée."""
+    if not echeance_passee():
+        return 0
+    maintenant = timezone.now()
+    total = expirer(taille_lot=taille_lot)
+    cache.set(_cle_echeance(Parametre.get_duree_expiration()), prochaine_echeance(maintenant), DUREE_ECHEANCE)
+    if total:
+        logger.info("%s réservation(s) expirée(s)", total)
+    return total
+
+
+def declencher_si_echu():
+    """
+    Lance le balayage en arrière-plan si une échéance est passée (une lecture
+    du cache). Sans broker configuré, la tâche s'exécute dans la requête
+    (mode eager) et écrit l'échéance suivante.
+    """
+    if not echeance_passee() or not cache.add(CLE_BALAYAGE, True, DUREE_BALAYAGE):
+        return False
+    from .tasks import expirer_reservations
+
+    def lancer():
+        try:
+            expirer_reservations.delay()
+        except OperationalError as e:
+            # CLE_BALAYAGE est gardée jusqu'à son expiration : une seule
+            # tentative par DUREE_BALAYAGE, pas une attente du broker par requête
+            logger.warning("Broker Celery injoignable, balayage des expirations reporté : %s", e)
+    transaction.on_commit(lancer)
+    return True
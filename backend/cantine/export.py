@@ -0,0 +1,354 @@
+"""
+Exports des réservations.
+
+Export PDF de l'historique d'un étudiant, généré hors requête : le PDF est
+produit par une tâche Celery et rangé dans le stockage des médias sous un
+nom dérivé de la version de l'ensemble des réservations de l'étudiant.
+Tant que cet ensemble ne change pas, les téléchargements suivants servent
+le fichier existant sans rien recalculer. La réponse est diffusée par blocs
+et accepte les requêtes partielles (en-tête Range).
+
+Extraction CSV ou NDJSON de toutes les réservations (personnel) : les
+lignes sont lues en tuples par curseur côté serveur (``iterator``), écrites
+par blocs d'environ TAILLE_BLOC octets et éventuellement compressées en
+gzip à la volée. La mémoire reste constante quel que soit le nombre de
+lignes ; voir ``flux_extraction``.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Q, TextField
+from django.db.models.functions import Cast
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from xhtml2pdf import pisa
+
+from . import expiration
+from .models import Reservation, User
+
+logger = logging.getLogger(__name__)
+
+# À changer si le gabarit reservations_export.html évolue
+VERSION_GABARIT = 1
+TAILLE_BLOC = 64 * 1024
+
+
+def cle_export(utilisateur):
+    """
+    Empreinte de l'ensemble des réservations de l'utilisateur, calculée en
+    une requête : nombre de réservations, dernières modifications des
+    réservations et des plats affichés, et réservations échues pas encore
+    écrites expirées (leur statut affiché change sans modification).
+    """
+    etat = Reservation.objects.filter(etudiant_id=utilisateur.pk).aggregate(
+        nombre=Count('id'),
+        maj_reservations=Max('updated_at'),
+        maj_plats=Max('plat__updated_at'),
+        echues=Count('id', filter=Q(statut='en_attente', date_reservation__lt=expiration.limite())),
+    )
+    brut = (
+        f"{VERSION_GABARIT}|{utilisateur.pk}|{etat['nombre']}|{etat['maj_reservations']}"
+        f"|{etat['maj_plats']}|{etat['echues']}"
+    )
+    return hashlib.sha256(brut.encode()).hexdigest()[:32]
+
+
+def chemin_export(utilisateur_id, cle):
+    return f"exports/{utilisateur_id}/{cle}.pdf"
+
+
+def contexte_export(utilisateur):
+    """Prépare les données du gabarit en parcourant les réservations par lots."""
+    reservations = (
+        expiration.annoter(Reservation.objects.filter(etudiant_id=utilisateur.pk))
+        .select_related('plat', 'emploi_du_temps')
+        .iterator(chunk_size=500)
+    )
+    total_general = 0
+    reservations_data = []
+    for r in reservations:
+        # Calculer le total pour cette réservation
+        total_plat = r.plat.prix * r.quantite
+        supplements_total = sum(sup.get('prix', 0) * r.quantite for sup in (r.supplements or []))
+        total_reservation = total_plat + supplements_total
+        total_general += total_reservation
+
+        reservations_data.append({
+            'id': r.id,
+            'date_reservation': r.date_reservation,
+            'emploi_du_temps': {
+                'id': r.emploi_du_temps.id,
+                'date': r.emploi_du_temps.date,
+                'creneau': r.emploi_du_temps.creneau
+            },
+            'plat': {
+                'id': r.plat.id,
+                'nom_plat': r.plat.nom_plat,
+                'description': r.plat.description,
+                'prix': float(r.plat.prix)
+            },
+            'quantite': r.quantite,
+            'statut': r.statut_effectif,
+            'supplements': r.supplements or [],
+            'get_supplements_total': supplements_total,
+            'get_total_prix': total_reservation,
+            'get_statut_display': dict(Reservation.STATUT_CHOICES)[r.statut_effectif]
+        })
+
+    return {
+        'reservations': reservations_data,
+        'date_export': timezone.now().strftime("%d/%m/%Y %H:%M"),
+        'user': utilisateur,
+        'total_general': total_general
+    }
+
+
+def generer_pdf(utilisateur_id, cle):
+    """
+    Génère le PDF dans un fichier temporaire puis le range dans le stockage.
+    Les exports plus anciens du même utilisateur sont supprimés.
+    """
+    chemin = chemin_export(utilisateur_id, cle)
+    if default_storage.exists(chemin):
+        return chemin
+
+    utilisateur = User.objects.get(pk=utilisateur_id)
+    html_string = render_to_string('reservations_export.html', contexte_export(utilisateur))
+
+    # xhtml2pdf met en page le document entier : le résultat est écrit sur
+    # disque plutôt qu'en mémoire, puis copié par blocs dans le stockage.
+    with tempfile.TemporaryFile() as fichier:
+        resultat = pisa.CreatePDF(html_string, dest=fichier)
+        if resultat.err:
+            raise RuntimeError(f"Échec de la génération du PDF pour l'utilisateur {utilisateur_id}")
+        fichier.seek(0)
+        chemin = default_storage.save(chemin, File(fichier))
+
+    dossier = os.path.dirname(chemin)
+    _, fichiers = default_storage.listdir(dossier)
+    for nom in fichiers:
+        if f"{dossier}/{nom}" != chemin:
+            default_storage.delete(f"{dossier}/{nom}")
+
+    logger.info("Export PDF généré : %s", chemin)
+    return chemin
+
+
+def planifier_generation(utilisateur_id, cle):
+    """Lance la génération une seule fois par version, même si le client insiste."""
+    from .tasks import generer_export_reservations
+    if not cache.add(f"export:en_cours:{cle}", True, 600):
+        return
+    try:
+        generer_export_reservations.delay(utilisateur_id, cle)
+    except OperationalError as e:
+        # Broker injoignable : générer dans la requête (la tâche libère la clé
+        # « en cours ») plutôt que d'annoncer un export qui ne viendra pas
+        logger.warning("Broker Celery injoignable (%s), export généré dans la requête", e)
+        generer_export_reservations(utilisateur_id, cle)
+
+
+PLAGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def reponse_fichier(request, chemin, nom_fichier, content_type='application/pdf'):
+    """
+    Sert un fichier du stockage par blocs, avec prise en charge d'une plage
+    d'octets unique (``Range: bytes=debut-fin``) pour les reprises de
+    téléchargement.
+    """
+    taille = default_storage.size(chemin)
+    fichier = default_storage.open(chemin, 'rb')
+    entete = request.headers.get('Range', '')
+    correspondance = PLAGE.match(entete.strip())
+
+    if not correspondance or correspondance.groups() == ('', ''):
+        response = FileResponse(fichier, content_type=content_type)
+        response.block_size = TAILLE_BLOC
+        response['Content-Length'] = taille
+    else:
+        debut, fin = correspondance.groups()
+        if debut:
+            debut, fin = int(debut), min(int(fin) if fin else taille - 1, taille - 1)
+        else:
+            # bytes=-n : les n derniers octets
+            debut, fin = max(taille - int(fin), 0), taille - 1
+        if debut > fin or debut >= taille:
+            fichier.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{taille}"
+            return response
+        fichier.seek(debut)
+        response = FileResponse(_lire_plage(fichier, fin - debut + 1), status=206, content_type=content_type)
+        response['Content-Length'] = fin - debut + 1
+        response['Content-Range'] = f"bytes {debut}-{fin}/{taille}"
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename={nom_fichier}'
+    return response
+
+
+def _lire_plage(fichier, longueur):
+    try:
+        while longueur > 0:
+            bloc = fichier.read(min(TAILLE_BLOC, longueur))
+            if not bloc:
+                break
+            longueur -= len(bloc)
+            yield bloc
+    finally:
+        fichier.close()
+
+
+# (en-tête, champ) des colonnes de l'extraction
+COLONNES = (
+    ('id', 'id'),
+    ('date_reservation', 'date_reservation'),
+    ('statut', 'statut_effectif'),
+    ('quantite', 'quantite'),
+    ('total_prix', 'total_prix'),
+    ('supplements', 'supplements'),
+    ('emploi_du_temps_id', 'emploi_du_temps_id'),
+    ('date', 'emploi_du_temps__date'),
+    ('jour', 'emploi_du_temps__jour'),
+    ('creneau', 'emploi_du_temps__creneau'),
+    ('plat_id', 'plat_id'),
+    ('nom_plat', 'plat__nom_plat'),
+    ('type_plat', 'plat__type_plat'),
+    ('etudiant_id', 'etudiant_id'),
+    ('username', 'etudiant__username'),
+    ('email', 'etudiant__email'),
+    ('institut', 'etudiant__institut'),
+)
+ENTETES = [entete for entete, _ in COLONNES]
+DATE_RESERVATION = ENTETES.index('date_reservation')
+# Lignes lues par aller-retour avec la base
+TAILLE_LOT_EXTRACTION = 2000
+FORMATS_EXTRACTION = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def lignes_extraction(queryset, json_brut=False):
+    """
+    Tuples des COLONNES, par curseur côté serveur, sans instancier de
+    modèle. Avec ``json_brut``, les suppléments restent le texte JSON stocké
+    en base (ni décodés ni réencodés).
+    """
+    queryset = expiration.annoter(queryset)
+    champs = [champ for _, champ in COLONNES]
+    if json_brut:
+        queryset = queryset.annotate(supplements_json=Cast('supplements', TextField()))
+        champs[ENTETES.index('supplements')] = 'supplements_json'
+    return queryset.order_by('pk').values_list(*champs).iterator(chunk_size=TAILLE_LOT_EXTRACTION)
+
+
+def _json(valeur):
+    if hasattr(valeur, 'isoformat'):
+        return valeur.isoformat()
+    return str(valeur)
+
+
+def _csv(lignes):
+    tampon = io.StringIO()
+    ecrire = csv.writer(tampon).writerow
+    ecrire(ENTETES)
+    for ligne in lignes:
+        ligne = list(ligne)
+        ligne[DATE_RESERVATION] = ligne[DATE_RESERVATION].isoformat()
+        ecrire(ligne)
+        if tampon.tell() >= TAILLE_BLOC:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def _ndjson(lignes):
+    encodeur = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json)
+    bloc, taille = [], 0
+    for ligne in lignes:
+        texte = encodeur.encode(dict(zip(ENTETES, ligne)))
+        bloc.append(texte)
+        taille += len(texte) + 1
+        if taille >= TAILLE_BLOC:
+            yield '\n'.join(bloc) + '\n'
+            bloc, taille = [], 0
+    if bloc:
+        yield '\n'.join(bloc) + '\n'
+
+
+def _encoder(blocs):
+    for bloc in blocs:
+        yield bloc.encode()
+
+
+def _gzip(blocs):
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 : en-tête gzip
+    for bloc in blocs:
+        compresse = compresseur.compress(bloc)
+        if compresse:
+            yield compresse
+    yield compresseur.flush()
+
+
+def flux_extraction(queryset, sortie='csv', compresser=False):
+    """
+    Blocs d'octets de l'extraction des réservations de ``queryset`` au
+    format ``sortie`` ('csv' ou 'ndjson'), compressés en gzip si demandé.
+    Rien n'est lu en base avant la consommation du premier bloc.
+    """
+    if sortie == 'csv':
+        blocs = _encoder(_csv(lignes_extraction(queryset, json_brut=True)))
+    else:
+        blocs = _encoder(_ndjson(lignes_extraction(queryset)))
+    return _gzip(blocs) if compresser else blocs
+
+
+def nom_extraction(sortie, compresser, params):
+    periode = '_'.join(params.get(nom) for nom in ('date_debut', 'date_fin') if params.get(nom))
+    nom = f"reservations_{periode or timezone.now().strftime('%Y%m%d')}.{FORMATS_EXTRACTION[sortie][1]}"
+    return nom + '.gz' if compresser else nom
+
+
+async def _asynchrone(blocs):
+    """
+    Parcourt un itérateur synchrone bloc par bloc depuis la boucle ASGI,
+    toujours dans le même thread (celui du curseur).
+    """
+    suivant = sync_to_async(next, thread_sensitive=True)
+    fin = object()
+    try:
+        while (bloc := await suivant(blocs, fin)) is not fin:
+            yield bloc
+    finally:
+        await sync_to_async(blocs.close, thread_sensitive=True)()
+
+
+def reponse_extraction(request, queryset, sortie, compresser):
+    """Réponse diffusée en flux de l'extraction (le filtrage est déjà appliqué)."""
+    content_type = 'application/gzip' if compresser else FORMATS_EXTRACTION[sortie][0]
+    blocs = flux_extraction(queryset, sortie, compresser)
+    # Sous ASGI, Django chargerait en mémoire un itérateur synchrone entier
+    if isinstance(request, ASGIRequest):
+        blocs = _asynchrone(blocs)
+    response = StreamingHttpResponse(blocs, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={nom_extraction(sortie, compresser, request.GET)}'
+    # Pas de mise en tampon par un proxy nginx : les blocs partent au fil de l'eau
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,151 @@
+"""
+Filtres des listes de l'API, lus dans les paramètres de requête.
+
+Chaque filtre porte sur une colonne indexée ; une valeur invalide renvoie
+une erreur 400 plutôt que d'être ignorée silencieusement.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from . import expiration
+from .models import EmploiDuTemps, Reservation
+
+
+def _date(params, nom):
+    valeur = params.get(nom)
+    if not valeur:
+        return None
+    try:
+        date = parse_date(valeur)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValidationError({nom: ["Date invalide, format attendu : AAAA-MM-JJ."]})
+    return date
+
+
+def _entier(params, nom):
+    valeur = params.get(nom)
+    if not valeur:
+        return None
+    try:
+        return int(valeur)
+    except ValueError:
+        raise ValidationError({nom: ["Un nombre entier est attendu."]})
+
+
+def _booleen(params, nom):
+    valeur = params.get(nom)
+    if valeur is None or valeur == '':
+        return None
+    if valeur.lower() in ('1', 'true', 'oui'):
+        return True
+    if valeur.lower() in ('0', 'false', 'non'):
+        return False
+    raise ValidationError({nom: ["Valeur booléenne attendue (true/false)."]})
+
+
+def _debut_du_jour(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def filtrer_periode(queryset, params, champ):
+    """
+    Filtre le champ date-heure ``champ`` sur ``date_debut`` / ``date_fin``
+    (bornes incluses). Les bornes sont converties en date-heures pour que la
+    comparaison porte sur la colonne elle-même et reste indexable.
+    """
+    date_debut = _date(params, 'date_debut')
+    date_fin = _date(params, 'date_fin')
+    if date_debut:
+        queryset = queryset.filter(**{f'{champ}__gte': _debut_du_jour(date_debut)})
+    if date_fin:
+        queryset = queryset.filter(**{f'{champ}__lt': _debut_du_jour(date_fin + timedelta(days=1))})
+    return queryset
+
+
+def filtrer_reservations(queryset, params):
+    """statut (liste séparée par des virgules), emploi_du_temps, plat, date_debut, date_fin."""
+    statuts = params.get('statut')
+    if statuts:
+        # Statut effectif : une réservation en attente échue est « expire »
+        queryset = queryset.filter(expiration.q_statuts(statuts.split(',')))
+    emploi_id = _entier(params, 'emploi_du_temps')
+    if emploi_id is not None:
+        queryset = queryset.filter(emploi_du_temps_id=emploi_id)
+    plat_id = _entier(params, 'plat')
+    if plat_id is not None:
+        queryset = queryset.filter(plat_id=plat_id)
+    return filtrer_periode(queryset, params, 'date_reservation')
+
+
+def _choix(params, nom, choix):
+    """Liste de valeurs séparées par des virgules, toutes parmi ``choix``."""
+    valeur = params.get(nom)
+    if not valeur:
+        return None
+    valeurs = valeur.split(',')
+    permises = [code for code, _ in choix]
+    if any(v not in permises for v in valeurs):
+        raise ValidationError({nom: [f"Valeurs permises : {', '.join(permises)}."]})
+    return valeurs
+
+
+def filtrer_export(queryset, params):
+    """
+    Filtres de l'extraction des réservations : date_debut, date_fin (date
+    du repas), creneau et statut (listes séparées par des virgules),
+    emploi_du_temps, plat, institut.
+    """
+    date_debut = _date(params, 'date_debut')
+    date_fin = _date(params, 'date_fin')
+    if date_debut:
+        queryset = queryset.filter(emploi_du_temps__date__gte=date_debut)
+    if date_fin:
+        queryset = queryset.filter(emploi_du_temps__date__lte=date_fin)
+    creneaux = _choix(params, 'creneau', EmploiDuTemps.CRENEAU_CHOICES)
+    if creneaux:
+        queryset = queryset.filter(emploi_du_temps__creneau__in=creneaux)
+    statuts = _choix(params, 'statut', Reservation.STATUT_CHOICES)
+    if statuts:
+        queryset = queryset.filter(expiration.q_statuts(statuts))
+    emploi_id = _entier(params, 'emploi_du_temps')
+    if emploi_id is not None:
+        queryset = queryset.filter(emploi_du_temps_id=emploi_id)
+    plat_id = _entier(params, 'plat')
+    if plat_id is not None:
+        queryset = queryset.filter(plat_id=plat_id)
+    institut = params.get('institut')
+    if institut:
+        queryset = queryset.filter(etudiant__institut=institut)
+    return queryset
+
+
+def filtrer_notifications(queryset, params):
+    """est_lue, date_debut, date_fin."""
+    est_lue = _booleen(params, 'est_lue')
+    if est_lue is not None:
+        queryset = queryset.filter(est_lue=est_lue)
+    return filtrer_periode(queryset, params, 'date_envoi')
+
+
+def filtrer_avis(queryset, params):
+    """note, date_debut, date_fin (plat et approuve sont gérés par la vue)."""
+    note = _entier(params, 'note')
+    if note is not None:
+        queryset = queryset.filter(note=note)
+    return filtrer_periode(queryset, params, 'date_publication')
+
+
+def filtrer_utilisateurs(queryset, params):
+    """institut, is_staff."""
+    institut = params.get('institut')
+    if institut:
+        queryset = queryset.filter(institut=institut)
+    is_staff = _booleen(params, 'is_staff')
+    if is_staff is not None:
+        queryset = queryset.filter(is_staff=is_staff)
+    return queryset
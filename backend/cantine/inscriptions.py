@@ -0,0 +1,343 @@
+"""
+Inscription en masse des étudiants à partir d'une liste CSV ou JSON.
+
+La liste est lue en flux, puis traitée par lots de ``taille_lot`` lignes :
+
+- chaque ligne est validée comme par UserSerializer (champs obligatoires,
+  format et longueur de l'email, validateurs de mot de passe), et les
+  doublons internes au fichier sont écartés ;
+- l'unicité des emails est vérifiée en une requête par lot ;
+- les mots de passe sont hachés en parallèle sur tous les cœurs (voir
+  ``executeur``) : avec PBKDF2, c'est l'essentiel du temps d'une inscription ;
+- les comptes valides sont créés en un ``bulk_create`` par lot.
+
+Chaque ligne refusée est rapportée avec son numéro et ses erreurs ; les
+autres lignes sont inscrites. ``bulk_create`` ne déclenche pas les signaux
+de User : aucun n'a d'effet à la création d'un compte.
+
+L'API lance l'import dans une tâche Celery (``demarrer``) et publie son
+avancement dans le cache ; la commande ``importer_etudiants`` l'exécute
+directement. Sans broker configuré (mode eager), la tâche s'exécute dans la
+requête HTTP : elle n'est alors acceptée que jusqu'à LIGNES_MAX_SANS_BROKER
+lignes, les listes plus longues passant par la commande ou par un worker.
+"""
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from kombu.exceptions import OperationalError
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+CHAMPS = ('email', 'password', 'first_name', 'last_name', 'institut')
+FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'json', '.jsonl': 'json'}
+TAILLE_LOT = 1000
+TAILLE_BLOC = 64 * 1024
+# Erreurs détaillées conservées dans le rapport (les suivantes sont comptées)
+ERREURS_MAX = 1000
+DUREE_SUIVI = 24 * 3600
+# Lignes importées dans la requête HTTP quand aucun broker n'est configuré
+# (quelques secondes de hachage PBKDF2)
+LIGNES_MAX_SANS_BROKER = 200
+
+
+def _cle_suivi(identifiant):
+    return f'inscriptions:{identifiant}'
+
+
+# Lecture en flux
+
+def lire_csv(flux):
+    """(numéro de ligne, dict) de chaque enregistrement ; en-têtes sans casse ni espaces."""
+    lecteur = csv.reader(flux)
+    entetes = [entete.strip().lower() for entete in next(lecteur, [])]
+    for ligne in lecteur:
+        if any(valeur.strip() for valeur in ligne):
+            yield lecteur.line_num, dict(zip(entetes, ligne))
+
+
+def lire_json(flux):
+    """
+    (numéro, objet) d'un tableau JSON ou d'un fichier JSON Lines, décodés au
+    fil de la lecture sans charger tout le document.
+    """
+    decodeur = json.JSONDecoder()
+    tampon = ''
+    numero = 0
+    fin_du_flux = False
+    while not fin_du_flux:
+        bloc = flux.read(TAILLE_BLOC)
+        fin_du_flux = not bloc
+        tampon += bloc
+        position = 0
+        while True:
+            # Séparateurs entre objets : blancs, crochets du tableau, virgules
+            while position < len(tampon) and tampon[position] in ' \t\r\n[],':
+                position += 1
+            if position == len(tampon):
+                break
+            try:
+                objet, position_suivante = decodeur.raw_decode(tampon, position)
+            except json.JSONDecodeError as e:
+                if fin_du_flux:
+                    raise ValueError(f"JSON invalide après l'objet {numero} : {e.msg}")
+                break  # objet coupé par la fin du bloc
+            numero += 1
+            position = position_suivante
+            yield numero, objet
+        tampon = tampon[position:]
+
+
+def lire(flux_binaire, format):
+    """Enregistrements d'un fichier binaire ``format`` ('csv' ou 'json'), en UTF-8 avec ou sans BOM."""
+    texte = io.TextIOWrapper(flux_binaire, encoding='utf-8-sig', newline='')
+    return lire_csv(texte) if format == 'csv' else lire_json(texte)
+
+
+# Validation
+
+def _longueur_max(champ):
+    return User._meta.get_field(champ).max_length
+
+
+def valider(donnees, institut=None):
+    """
+    Valide un enregistrement ; retourne ``(utilisateur, mot_de_passe, erreurs)``.
+    ``institut`` s'applique aux lignes qui n'en précisent pas.
+    """
+    if not isinstance(donnees, dict):
+        return None, None, {'non_field_errors': ["Un objet est attendu."]}
+    valeurs = {
+        champ: '' if donnees.get(champ) is None else str(donnees[champ])
+        for champ in CHAMPS
+    }
+    for champ in ('email', 'first_name', 'last_name', 'institut'):
+        valeurs[champ] = valeurs[champ].strip()
+    valeurs['institut'] = valeurs['institut'] or institut or ''
+
+    erreurs = {}
+    for champ in CHAMPS:
+        if not valeurs[champ]:
+            erreurs[champ] = ["Ce champ est obligatoire."]
+        # L'email sert aussi de nom d'utilisateur
+        elif champ != 'password' and len(valeurs[champ]) > _longueur_max('username' if champ == 'email' else champ):
+            erreurs[champ] = ["Valeur trop longue."]
+    if 'email' not in erreurs:
+        try:
+            validate_email(valeurs['email'])
+        except ValidationError as e:
+            erreurs['email'] = list(e.messages)
+        valeurs['email'] = User.objects.normalize_email(valeurs['email'])
+
+    utilisateur = User(
+        username=valeurs['email'], email=valeurs['email'], first_name=valeurs['first_name'],
+        last_name=valeurs['last_name'], institut=valeurs['institut'],
+    )
+    if 'password' not in erreurs:
+        try:
+            validate_password(valeurs['password'], user=utilisateur)
+        except ValidationError as e:
+            erreurs['password'] = list(e.messages)
+    return utilisateur, valeurs['password'], erreurs
+
+
+# Hachage parallèle
+
+def _initialiser():
+    # Processus démarré par « spawn » : charger les réglages de Django
+    import django
+    django.setup()
+
+
+def executeur(processus=None):
+    """
+    Pool de hachage. Un worker Celery (prefork) est un processus démon qui
+    ne peut pas créer de processus : des threads le remplacent, PBKDF2
+    relâchant le GIL pendant le calcul.
+    """
+    processus = processus or os.cpu_count() or 1
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(processus)
+    return ProcessPoolExecutor(processus, initializer=_initialiser)
+
+
+# Import
+
+class Rapport:
+    def __init__(self):
+        self.lignes = 0
+        self.crees = 0
+        self.nombre_erreurs = 0
+        self.erreurs = []
+        self.debut = time.monotonic()
+
+    def refuser(self, numero, email, erreurs):
+        self.nombre_erreurs += 1
+        if len(self.erreurs) < ERREURS_MAX:
+            self.erreurs.append({'ligne': numero, 'email': email, 'erreurs': erreurs})
+
+    def donnees(self):
+        return {
+            'lignes': self.lignes,
+            'crees': self.crees,
+            'nombre_erreurs': self.nombre_erreurs,
+            'erreurs': sorted(self.erreurs, key=lambda erreur: erreur['ligne']),
+            'duree': round(time.monotonic() - self.debut, 1),
+        }
+
+
+def _existants(emails):
+    """Emails déjà pris (comme email ou nom d'utilisateur), en une requête."""
+    pris = set()
+    for email, username in User.objects.filter(Q(email__in=emails) | Q(username__in=emails)).values_list('email', 'username'):
+        pris.add(email)
+        pris.add(username)
+    return pris
+
+
+class Import:
+    """Import d'une liste, lot par lot ; ``simuler`` valide sans rien écrire."""
+
+    def __init__(self, institut=None, taille_lot=TAILLE_LOT, processus=None, simuler=False, progression=None):
+        self.institut = institut
+        self.taille_lot = taille_lot
+        self.processus = processus or os.cpu_count() or 1
+        self.simuler = simuler
+        self.progression = progression
+        self.rapport = Rapport()
+        self.vus = set()
+        self.pool = None
+
+    def executer(self, enregistrements):
+        lot = []
+        with nullcontext() if self.simuler else executeur(self.processus) as self.pool:
+            for enregistrement in enregistrements:
+                lot.append(enregistrement)
+                if len(lot) >= self.taille_lot:
+                    self._traiter(lot)
+                    lot = []
+            if lot:
+                self._traiter(lot)
+        return self.rapport
+
+    def _traiter(self, lot):
+        self.rapport.lignes += len(lot)
+        candidats = []
+        for numero, donnees in lot:
+            utilisateur, mot_de_passe, erreurs = valider(donnees, self.institut)
+            if not erreurs and utilisateur.email in self.vus:
+                erreurs = {'email': ["Email présent plusieurs fois dans le fichier."]}
+            if erreurs:
+                self.rapport.refuser(numero, getattr(utilisateur, 'email', None), erreurs)
+                continue
+            self.vus.add(utilisateur.email)
+            candidats.append((numero, utilisateur, mot_de_passe))
+
+        candidats = self._disponibles(candidats)
+        if candidats and not self.simuler:
+            mots_de_passe = [mot_de_passe for _, _, mot_de_passe in candidats]
+            taille = max(1, len(mots_de_passe) // (self.processus * 4))
+            for (_, utilisateur, _), hache in zip(candidats, self.pool.map(make_password, mots_de_passe, chunksize=taille)):
+                utilisateur.password = hache
+            self._inserer(candidats)
+        self.rapport.crees += len(candidats)
+        if self.progression:
+            self.progression(self.rapport)
+
+    def _disponibles(self, candidats):
+        pris = _existants([utilisateur.email for _, utilisateur, _ in candidats]) if candidats else set()
+        disponibles = []
+        for numero, utilisateur, mot_de_passe in candidats:
+            if utilisateur.email in pris:
+                self.rapport.refuser(numero, utilisateur.email, {'email': ["Un utilisateur avec cet email existe déjà."]})
+            else:
+                disponibles.append((numero, utilisateur, mot_de_passe))
+        return disponibles
+
+    def _inserer(self, candidats):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([utilisateur for _, utilisateur, _ in candidats])
+        except IntegrityError:
+            # Inscription concurrente d'un même email entre la vérification et l'insertion
+            candidats[:] = self._disponibles(candidats)
+            with transaction.atomic():
+                User.objects.bulk_create([utilisateur for _, utilisateur, _ in candidats])
+
+
+def importer(enregistrements, **options):
+    """Importe des enregistrements ``(numéro, dict)`` et retourne le Rapport."""
+    return Import(**options).executer(enregistrements)
+
+
+def suivi(identifiant):
+    return cache.get(_cle_suivi(identifiant))
+
+
+def publier(identifiant, statut, **donnees):
+    cache.set(_cle_suivi(identifiant), {'id': identifiant, 'statut': statut, **donnees}, DUREE_SUIVI)
+
+
+class ImportTropVolumineux(Exception):
+    """Liste trop longue pour être importée dans la requête, faute de broker."""
+
+    def __init__(self, lignes_max):
+        self.lignes_max = lignes_max
+        super().__init__(
+            f"Sans service d'import en arrière-plan, une liste est limitée à {lignes_max} lignes."
+        )
+
+
+def _compter(chemin, format, limite):
+    """Nombre d'enregistrements du fichier, arrêté à ``limite``."""
+    with default_storage.open(chemin, 'rb') as fichier:
+        try:
+            return sum(1 for _ in islice(lire(fichier, format), limite))
+        except ValueError:
+            # Fichier illisible : l'import en rendra compte dans son rapport
+            return 0
+
+
+def demarrer(identifiant, chemin, format, institut=None):
+    """
+    Lance l'import d'un fichier du stockage dans une tâche Celery. Retourne
+    False si le broker est injoignable : le fichier est alors supprimé et
+    l'échec publié.
+
+    Sans broker configuré, la tâche s'exécute dans la requête : au-delà de
+    LIGNES_MAX_SANS_BROKER lignes, le fichier est supprimé et
+    ImportTropVolumineux levée.
+    """
+    from .tasks import importer_etudiants
+
+    if importer_etudiants.app.conf.task_always_eager:
+        if _compter(chemin, format, LIGNES_MAX_SANS_BROKER + 1) > LIGNES_MAX_SANS_BROKER:
+            default_storage.delete(chemin)
+            raise ImportTropVolumineux(LIGNES_MAX_SANS_BROKER)
+
+    publier(identifiant, 'en_attente')
+    try:
+        importer_etudiants.delay(identifiant, chemin, format, institut)
+    except OperationalError as e:
+        logger.warning("Broker Celery injoignable, import %s abandonné : %s", identifiant, e)
+        default_storage.delete(chemin)
+        publier(identifiant, 'echec', detail="Service d'import indisponible.")
+        return False
+    return True
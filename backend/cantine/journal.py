@@ -0,0 +1,72 @@
+"""
+Journalisation non bloquante et événements structurés.
+
+FileAttenteHandler remplace le StreamHandler de la console : l'enregistrement
+est mis en forme dans le thread appelant puis déposé dans une file bornée,
+qu'un thread écrit sur la sortie d'erreur. Une requête n'attend donc jamais
+l'écriture ; si la file est pleine, l'enregistrement est perdu et compté
+plutôt que de bloquer.
+
+``evenement`` journalise un événement nommé avec des champs clé=valeur,
+échantillonné au taux JOURNAL_ECHANTILLON pour les chemins fréquents.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+
+class FileAttenteHandler(QueueHandler):
+    def __init__(self, taille=10000):
+        super().__init__(queue.Queue(taille))
+        self.perdus = 0
+        self.ecouteur = None
+        self._demarrer()
+        # Après un fork (gunicorn --preload), le thread d'écriture n'existe plus
+        os.register_at_fork(after_in_child=self._demarrer)
+        atexit.register(self._arreter)
+
+    def _demarrer(self):
+        self.ecouteur = QueueListener(self.queue, logging.StreamHandler())
+        self.ecouteur.start()
+
+    def _arreter(self):
+        if self.ecouteur is not None:
+            self.ecouteur.stop()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.perdus += 1
+
+
+class FormatStructure(logging.Formatter):
+    """Format habituel, suivi des champs ``clé=valeur`` d'un événement."""
+
+    def format(self, record):
+        texte = super().format(record)
+        champs = getattr(record, 'champs', None)
+        if champs:
+            texte += ' ' + ' '.join(f'{cle}={valeur!r}' if isinstance(valeur, str) and ' ' in valeur
+                                    else f'{cle}={valeur}' for cle, valeur in champs.items())
+        return texte
+
+
+def evenement(logger, nom, /, niveau=logging.INFO, taux=None, **champs):
+    """
+    Journalise l'événement ``nom`` avec ``champs``, pour une fraction
+    ``taux`` des appels (JOURNAL_ECHANTILLON par défaut).
+    """
+    if not logger.isEnabledFor(niveau):
+        return
+    taux = settings.JOURNAL_ECHANTILLON if taux is None else taux
+    if taux < 1 and random.random() >= taux:
+        return
+    if taux < 1:
+        champs['echantillon'] = taux
+    logger.log(niveau, nom, extra={'champs': champs})
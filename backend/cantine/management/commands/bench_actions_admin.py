@@ -0,0 +1,136 @@
+"""
+Benchmark des actions groupées de l'administration.
+
+Crée un créneau jetable et ``--reservations`` réservations en attente (une
+par étudiant), ainsi qu'autant d'avis non approuvés, puis chronomètre les
+actions « Accepter les réservations » et « Approuver les avis » appelées
+comme le ferait l'administration, sur tout le jeu de données :
+
+    python manage.py bench_actions_admin --reservations 5000
+    python manage.py bench_actions_admin --reservations 500 --mode naif   # ancienne boucle
+"""
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.admin.sites import site
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from cantine import statistiques
+from cantine.mixins import CompteurRequetes
+from cantine.models import Avis, EmploiDuTemps, Notification, Plat, Reservation, User
+
+
+def _accepter_naif(queryset):
+    # Reproduction de l'ancienne action : save() par ligne et par créneau
+    for reservation in queryset:
+        reservation.statut = 'accepte'
+        reservation.save()
+        reservation.emploi_du_temps.quantite_disponible -= reservation.quantite
+        reservation.emploi_du_temps.save()
+
+
+def _approuver_naif(queryset):
+    for avis in queryset.select_related('etudiant', 'plat'):
+        avis.est_approuve = True
+        avis.save()
+
+
+class Command(BaseCommand):
+    help = "Chronomètre l'acceptation et l'approbation groupées depuis l'administration"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservations', type=int, default=2000, help="Réservations (et avis) à traiter")
+        parser.add_argument('--mode', choices=['ensembliste', 'naif'], default='ensembliste')
+        parser.add_argument('--garder', action='store_true', help="Ne pas supprimer les données créées")
+
+    def handle(self, *args, **options):
+        prefixe = f"bench-{uuid.uuid4().hex[:8]}"
+        nombre = options['reservations']
+        plat, emploi, etudiant_ids = self._preparer(prefixe, nombre, options['mode'])
+        reservations = Reservation.objects.filter(emploi_du_temps=emploi)
+        avis = Avis.objects.filter(plat=plat)
+
+        requete = RequestFactory().post('/admin/')
+        requete.user = User(is_staff=True, is_superuser=True)
+        requete.session = {}
+        requete._messages = FallbackStorage(requete)
+        admin_reservations = site._registry[Reservation]
+        admin_avis = site._registry[Avis]
+
+        try:
+            if options['mode'] == 'naif':
+                mesures = [
+                    ("Accepter les réservations", lambda: _accepter_naif(reservations)),
+                    ("Approuver les avis", lambda: _approuver_naif(avis)),
+                ]
+            else:
+                mesures = [
+                    ("Accepter les réservations",
+                     lambda: admin_reservations.accepter_reservations(requete, reservations)),
+                    ("Approuver les avis", lambda: admin_avis.approuver_avis(requete, avis)),
+                ]
+
+            self.stdout.write(f"Mode: {options['mode']}, {nombre} lignes")
+            for nom, action in mesures:
+                compteur = CompteurRequetes()
+                with connection.execute_wrapper(compteur):
+                    debut = time.perf_counter()
+                    action()
+                    duree = time.perf_counter() - debut
+                self.stdout.write(
+                    f"  {nom:<26} {duree * 1000:8.1f} ms   {compteur.total} requêtes SQL "
+                    f"({nombre / duree:.0f} lignes/s)"
+                )
+
+            acceptees = reservations.filter(statut='accepte').count()
+            approuves = avis.filter(est_approuve=True).count()
+            notifiees = Notification.objects.filter(destinataire_id__in=etudiant_ids).count()
+            emploi.refresh_from_db()
+            self.stdout.write(
+                f"Acceptées: {acceptees}, approuvés: {approuves}, notifications: {notifiees}, "
+                f"places restantes: {emploi.quantite_disponible}"
+            )
+        finally:
+            if not options['garder']:
+                plat.delete()
+                User.objects.filter(pk__in=etudiant_ids).delete()
+
+    def _preparer(self, prefixe, nombre, mode):
+        plat = Plat.objects.create(nom_plat=prefixe, prix=1, description="Plat de benchmark")
+        jour = date(2100, 1, 4)
+        while EmploiDuTemps.objects.filter(date=jour, creneau='soir').exists():
+            jour += timedelta(days=7)
+        # Les places des réservations sont déjà retenues, comme après leur création
+        emploi = EmploiDuTemps.objects.create(
+            plat=plat, jour='lundi', creneau='soir', date=jour, quantite_disponible=nombre,
+        )
+        if mode != 'naif':
+            # L'ancienne action décrémentait le stock une seconde fois
+            EmploiDuTemps.objects.filter(pk=emploi.pk).update(quantite_disponible=0)
+
+        User.objects.bulk_create([
+            User(username=f"{prefixe}-{i}", email=f"{prefixe}-{i}@bench.local", password='!', institut=prefixe)
+            for i in range(nombre)
+        ], batch_size=1000)
+        etudiants = list(User.objects.filter(institut=prefixe).only('id', 'institut'))
+        etudiant_ids = [etudiant.id for etudiant in etudiants]
+
+        # bulk_create : ni signaux ni notifications de création ; les
+        # statistiques sont reportées comme dans ReservationViewSet.lot
+        reservations = [
+            Reservation(etudiant=etudiant, plat=plat, emploi_du_temps=emploi, quantite=1)
+            for etudiant in etudiants
+        ]
+        for reservation in reservations:
+            reservation.calculer_total_prix()
+        Reservation.objects.bulk_create(reservations, batch_size=1000)
+        statistiques.ajouter_reservations(reservations)
+        Avis.objects.bulk_create([
+            Avis(etudiant_id=etudiant_id, plat=plat, note=4, commentaire="Benchmark")
+            for etudiant_id in etudiant_ids
+        ], batch_size=1000)
+        return plat, emploi, etudiant_ids
@@ -0,0 +1,89 @@
+"""
+Microbenchmark de l'authentification JWT.
+
+Compare, sur /api/auth/me/ et /api/emploi-du-temps/, l'ancienne chaîne
+d'authentification (Token, Session puis JWT avec lecture de l'utilisateur)
+et JWTAuthenticationRapide. Les requêtes traversent toute la pile Django
+(middlewares, routage) via le client de test ; seules les classes
+d'authentification des vues changent d'une mesure à l'autre.
+
+    python manage.py bench_authentification --requetes 2000
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from cantine.authentification import JetonRafraichissement, JWTAuthenticationRapide
+from cantine.mixins import CompteurRequetes
+from cantine.models import User
+from cantine.views import EmploiDuTempsViewSet, get_user_info
+
+CHAINES = {
+    'avant': [TokenAuthentication, SessionAuthentication, JWTAuthentication],
+    'apres': [JWTAuthenticationRapide, TokenAuthentication, SessionAuthentication],
+}
+
+VUES = {
+    '/api/auth/me/': get_user_info.cls,
+    '/api/emploi-du-temps/?semaine=2100-W01': EmploiDuTempsViewSet,
+}
+
+
+@contextmanager
+def authentification(classes):
+    anciennes = {vue: vue.authentication_classes for vue in VUES.values()}
+    for vue in VUES.values():
+        vue.authentication_classes = classes
+    try:
+        yield
+    finally:
+        for vue, valeur in anciennes.items():
+            vue.authentication_classes = valeur
+
+
+class Command(BaseCommand):
+    help = "Compare le débit de l'authentification JWT avec et sans lecture de l'utilisateur"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=1000, help="Requêtes par mesure")
+
+    def handle(self, *args, **options):
+        prefixe = f"bench-{uuid.uuid4().hex[:8]}"
+        etudiant = User.objects.create(
+            username=prefixe, email=f"{prefixe}@bench.local", password='!', institut=prefixe,
+        )
+        jeton = str(JetonRafraichissement.for_user(etudiant).access_token)
+        client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f"Bearer {jeton}")
+        try:
+            for url in VUES:
+                self.stdout.write(url)
+                resultats = {}
+                for mode, classes in CHAINES.items():
+                    with authentification(classes):
+                        resultats[mode] = self._mesurer(client, url, options['requetes'])
+                    debit, requetes = resultats[mode]
+                    self.stdout.write(f"  {mode:<6} {debit:8.0f} req/s   {requetes:.1f} requêtes SQL/req")
+                gain = resultats['apres'][0] / resultats['avant'][0] - 1
+                self.stdout.write(self.style.SUCCESS(f"  gain : {gain:+.0%}"))
+        finally:
+            etudiant.delete()
+
+    @staticmethod
+    def _mesurer(client, url, nombre):
+        # Préchauffage (caches, premières compilations de requêtes)
+        for _ in range(min(50, nombre)):
+            reponse = client.get(url)
+            assert reponse.status_code == 200, reponse.status_code
+        compteur = CompteurRequetes()
+        with connection.execute_wrapper(compteur):
+            debut = time.perf_counter()
+            for _ in range(nombre):
+                client.get(url)
+            duree = time.perf_counter() - debut
+        return nombre / duree, compteur.total / nombre
@@ -0,0 +1,165 @@
+"""
+Banc d'essai de la couche de canaux partitionnée sur N processus.
+
+Chaque processus ouvre ``--canaux`` canaux répartis dans ``--groupes``
+groupes, puis le processus principal envoie ``--messages`` group_send.
+La commande mesure le débit d'émission et le nombre de messages remis par
+seconde à l'ensemble des canaux. Sans ``--hotes``, des courtiers locaux
+(cantine.courtier_local) sont lancés, un par fragment.
+
+    python manage.py bench_canaux --processus 4 --canaux 250 --messages 1000
+    python manage.py bench_canaux --sans-regroupement      # un message par canal
+    python manage.py bench_canaux --hotes redis://localhost:6379/3
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cantine import courtier_local
+from cantine.couche_canaux import CoucheCanauxPartitionnee
+
+DELAI_MAX = 120
+
+
+def _couche(hotes, options):
+    return CoucheCanauxPartitionnee(
+        hotes=hotes,
+        prefixe=options['prefixe'],
+        # Le banc mesure le débit, pas l'abandon des messages en excès
+        capacity=options['messages'] + 1,
+        regrouper=not options['sans_regroupement'],
+    )
+
+
+def _envois_par_groupe(options):
+    return [len(range(g, options['messages'], options['groupes'])) for g in range(options['groupes'])]
+
+
+def _processus_recepteur(hotes, options, barriere, resultats):
+    async def principal():
+        couche = _couche(hotes, options)
+        canaux = [await couche.new_channel() for _ in range(options['canaux'])]
+        attendus = _envois_par_groupe(options)
+        for k, canal in enumerate(canaux):
+            await couche.group_add(f"bench.{k % options['groupes']}", canal)
+        await asyncio.get_running_loop().run_in_executor(None, barriere.wait)
+
+        async def lire(k, canal):
+            for _ in range(attendus[k % options['groupes']]):
+                await couche.receive(canal)
+            return time.time()
+
+        try:
+            fins = await asyncio.wait_for(
+                asyncio.gather(*(lire(k, canal) for k, canal in enumerate(canaux))), DELAI_MAX
+            )
+            resultats.put((sum(attendus[k % options['groupes']] for k in range(len(canaux))), max(fins)))
+        except asyncio.TimeoutError:
+            resultats.put((None, time.time()))
+        await couche.close()
+
+    asyncio.run(principal())
+
+
+class Command(BaseCommand):
+    help = "Mesure le débit de group_send de la couche de canaux sur plusieurs processus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processus', type=int, default=4, help="Processus récepteurs")
+        parser.add_argument('--canaux', type=int, default=250, help="Canaux par processus")
+        parser.add_argument('--groupes', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=1000, help="Nombre de group_send")
+        parser.add_argument('--concurrence', type=int, default=16, help="group_send simultanés")
+        parser.add_argument('--fragments', type=int, default=2, help="Courtiers locaux lancés")
+        parser.add_argument('--hotes', help="Serveurs Redis existants, séparés par des virgules")
+        parser.add_argument('--sans-regroupement', action='store_true',
+                            help="Un message par canal au lieu d'un par processus")
+
+    def handle(self, *args, **options):
+        options['prefixe'] = f"bench-{uuid.uuid4().hex[:8]}"
+        contexte = multiprocessing.get_context('fork')
+        courtiers, sockets = [], []
+        if options['hotes']:
+            hotes = [hote.strip() for hote in options['hotes'].split(',')]
+        else:
+            dossier = tempfile.mkdtemp(prefix='bench-canaux-')
+            sockets = [os.path.join(dossier, f"fragment-{i}.sock") for i in range(options['fragments'])]
+            courtiers = [
+                contexte.Process(target=courtier_local.executer, args=(socket,), daemon=True)
+                for socket in sockets
+            ]
+            for courtier in courtiers:
+                courtier.start()
+            hotes = [f"unix://{socket}" for socket in sockets]
+            self._attendre_sockets(sockets)
+
+        barriere = contexte.Barrier(options['processus'] + 1)
+        resultats = contexte.Queue()
+        recepteurs = [
+            contexte.Process(target=_processus_recepteur, args=(hotes, options, barriere, resultats))
+            for _ in range(options['processus'])
+        ]
+        try:
+            for recepteur in recepteurs:
+                recepteur.start()
+            asyncio.run(self._emettre(hotes, options, barriere, resultats))
+        finally:
+            for recepteur in recepteurs:
+                recepteur.join(5)
+                if recepteur.is_alive():
+                    recepteur.terminate()
+            for courtier in courtiers:
+                courtier.terminate()
+            for socket in sockets:
+                if os.path.exists(socket):
+                    os.unlink(socket)
+
+    @staticmethod
+    def _attendre_sockets(sockets):
+        limite = time.time() + 10
+        while not all(os.path.exists(socket) for socket in sockets):
+            if time.time() > limite:
+                raise CommandError("Les courtiers locaux n'ont pas démarré")
+            time.sleep(0.05)
+
+    async def _emettre(self, hotes, options, barriere, resultats):
+        couche = _couche(hotes, options)
+        await asyncio.get_running_loop().run_in_executor(None, barriere.wait)
+
+        semaphore = asyncio.Semaphore(options['concurrence'])
+
+        async def envoyer(n):
+            async with semaphore:
+                await couche.group_send(f"bench.{n % options['groupes']}", {'type': 'bench', 'n': n})
+
+        debut = time.time()
+        await asyncio.gather(*(envoyer(n) for n in range(options['messages'])))
+        emission = time.time() - debut
+
+        boucle = asyncio.get_running_loop()
+        recus = [await boucle.run_in_executor(None, resultats.get, True, DELAI_MAX + 10)
+                 for _ in range(options['processus'])]
+        await couche.flush()
+        await couche.close()
+
+        if any(total is None for total, _ in recus):
+            raise CommandError("Des messages n'ont pas été reçus dans le délai imparti")
+        remis = sum(total for total, _ in recus)
+        duree = max(fin for _, fin in recus) - debut
+
+        mode = "un message par canal" if options['sans_regroupement'] else "regroupé par processus"
+        self.stdout.write(
+            f"{options['processus']} processus x {options['canaux']} canaux, "
+            f"{options['groupes']} groupe(s), {len(hotes)} fragment(s), {mode}"
+        )
+        self.stdout.write(
+            f"group_send : {options['messages']} en {emission:.2f}s ({options['messages'] / emission:.0f}/s)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Messages remis : {remis} en {duree:.2f}s ({remis / duree:.0f}/s)"
+        ))
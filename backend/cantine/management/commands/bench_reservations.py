@@ -0,0 +1,168 @@
+"""
+Benchmark de concurrence sur un seul créneau.
+
+Crée un emploi du temps jetable, puis lance plusieurs processus contenant
+chacun plusieurs threads qui réservent en même temps sur ce créneau. Affiche
+le débit obtenu et vérifie qu'aucune place n'a été vendue en trop.
+
+    python manage.py bench_reservations --places 500 --demandes 2000 \\
+        --processus 4 --threads 8
+    python manage.py bench_reservations --mode naif   # ancien chemin, pour comparer
+"""
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction, DatabaseError
+from django.db.models import Sum
+
+from cantine.models import EmploiDuTemps, Plat, Reservation, User
+from cantine.stock import reserver_places, StockInsuffisant
+
+
+def _reserver_atomique(etudiant_id, emploi_id, plat, quantite):
+    with transaction.atomic():
+        reserver_places(emploi_id, quantite)
+        Reservation.objects.create(
+            etudiant_id=etudiant_id,
+            plat=plat,
+            emploi_du_temps_id=emploi_id,
+            quantite=quantite,
+        )
+
+
+def _reserver_naif(etudiant_id, emploi_id, plat, quantite):
+    # Reproduction de l'ancien perform_create : lecture, test puis écriture
+    emploi = EmploiDuTemps.objects.get(pk=emploi_id)
+    if emploi.quantite_disponible < quantite:
+        raise StockInsuffisant(emploi_id, quantite, emploi.quantite_disponible)
+    Reservation.objects.create(
+        etudiant_id=etudiant_id,
+        plat=plat,
+        emploi_du_temps_id=emploi_id,
+        quantite=quantite,
+    )
+    emploi.quantite_disponible -= quantite
+    emploi.save()
+
+
+MODES = {
+    'atomique': _reserver_atomique,
+    'naif': _reserver_naif,
+}
+
+
+def _tentative(mode, etudiant_id, emploi_id, plat, quantite):
+    try:
+        MODES[mode](etudiant_id, emploi_id, plat, quantite)
+        return 'succes'
+    except StockInsuffisant:
+        return 'refus'
+    except DatabaseError:
+        return 'erreur'
+    finally:
+        connections.close_all()
+
+
+def _executer_lot(mode, etudiant_ids, emploi_id, plat_id, quantite, threads):
+    """Point d'entrée d'un processus : réserve pour ``etudiant_ids`` avec ``threads`` threads."""
+    plat = Plat.objects.get(pk=plat_id)
+    connections.close_all()
+    compteurs = {'succes': 0, 'refus': 0, 'erreur': 0}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for resultat in pool.map(
+            lambda etudiant_id: _tentative(mode, etudiant_id, emploi_id, plat, quantite),
+            etudiant_ids,
+        ):
+            compteurs[resultat] += 1
+    return compteurs
+
+
+class Command(BaseCommand):
+    help = "Mesure le débit et la survente des réservations concurrentes sur un créneau"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--places', type=int, default=500, help="Capacité initiale du créneau")
+        parser.add_argument('--demandes', type=int, default=2000, help="Nombre total de tentatives")
+        parser.add_argument('--quantite', type=int, default=1, help="Quantité par réservation")
+        parser.add_argument('--processus', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=8, help="Threads par processus")
+        parser.add_argument('--mode', choices=sorted(MODES), default='atomique')
+        parser.add_argument('--garder', action='store_true', help="Ne pas supprimer les données créées")
+
+    def handle(self, *args, **options):
+        prefixe = f"bench-{uuid.uuid4().hex[:8]}"
+        plat, emploi, etudiant_ids = self._preparer(prefixe, options)
+
+        lots = [etudiant_ids[i::options['processus']] for i in range(options['processus'])]
+        connections.close_all()
+        contexte = multiprocessing.get_context('fork')
+
+        debut = time.perf_counter()
+        with contexte.Pool(options['processus']) as pool:
+            resultats = pool.starmap(_executer_lot, [
+                (options['mode'], lot, emploi.id, plat.id, options['quantite'], options['threads'])
+                for lot in lots
+            ])
+        duree = time.perf_counter() - debut
+
+        compteurs = {'succes': 0, 'refus': 0, 'erreur': 0}
+        for resultat in resultats:
+            for cle, valeur in resultat.items():
+                compteurs[cle] += valeur
+
+        emploi.refresh_from_db()
+        vendues = Reservation.objects.filter(emploi_du_temps=emploi).aggregate(
+            total=Sum('quantite')
+        )['total'] or 0
+        survente = max(0, vendues - options['places'])
+        ecart = options['places'] - emploi.quantite_disponible - vendues
+
+        self.stdout.write(f"Mode: {options['mode']} ({options['processus']} processus x {options['threads']} threads)")
+        self.stdout.write(f"Tentatives: {options['demandes']} en {duree:.2f}s ({options['demandes'] / duree:.0f} req/s)")
+        self.stdout.write(
+            f"Succès: {compteurs['succes']}, refus stock: {compteurs['refus']}, erreurs base: {compteurs['erreur']}"
+        )
+        self.stdout.write(
+            f"Places vendues: {vendues}/{options['places']}, restantes: {emploi.quantite_disponible}"
+        )
+        if survente or ecart:
+            self.stdout.write(self.style.ERROR(
+                f"Survente: {survente} place(s), écart de stock: {ecart}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("Aucune survente, stock cohérent"))
+
+        if not options['garder']:
+            emploi.delete()
+            plat.delete()
+            User.objects.filter(pk__in=etudiant_ids).delete()
+
+    def _preparer(self, prefixe, options):
+        plat = Plat.objects.create(
+            nom_plat=prefixe, prix=1, description="Plat de benchmark"
+        )
+        # Date lointaine et libre pour respecter unique_together (jour, creneau, date)
+        jour = date(2100, 1, 4)
+        while EmploiDuTemps.objects.filter(date=jour, creneau='midi').exists():
+            jour += timedelta(days=7)
+        emploi = EmploiDuTemps.objects.create(
+            plat=plat, jour='lundi', creneau='midi', date=jour,
+            quantite_disponible=options['places'],
+        )
+        User.objects.bulk_create([
+            User(
+                username=f"{prefixe}-{i}",
+                email=f"{prefixe}-{i}@bench.local",
+                password='!',
+                institut=prefixe,
+            )
+            for i in range(options['demandes'])
+        ], batch_size=1000)
+        etudiant_ids = list(
+            User.objects.filter(institut=prefixe).values_list('id', flat=True)
+        )
+        return plat, emploi, etudiant_ids
@@ -0,0 +1,157 @@
+"""
+Test de charge des WebSockets : des milliers de sockets abonnées à la même
+semaine pendant qu'un créneau est réservé en continu.
+
+Toutes les sockets tournent dans le processus courant (couche de canaux
+configurée, en mémoire en développement). La commande vérifie que chaque
+socket reçoit la quantité finale du créneau et la notification de fin, et
+que le nombre de messages par socket reste borné par l'intervalle du relais
+et non par le nombre de réservations.
+
+    python manage.py charge_websockets --sockets 2000 --reservations 3000
+"""
+import asyncio
+import math
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from channels.auth import AuthMiddlewareStack
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.tokens import AccessToken
+
+from cantine import cache_menu, temps_reel
+from cantine.consumers import JWTAuthMiddleware
+from cantine.models import EmploiDuTemps, Notification, Plat, User
+from cantine.routing import websocket_urlpatterns
+from cantine.stock import reserver_places
+
+DELAI_RECEPTION = 30
+
+
+class Command(BaseCommand):
+    help = "Simule des milliers de sockets abonnées pendant des réservations sur un créneau"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000)
+        parser.add_argument('--reservations', type=int, default=3000)
+        parser.add_argument('--lot-connexions', type=int, default=200,
+                            help="Connexions ouvertes simultanément")
+        parser.add_argument('--garder', action='store_true', help="Ne pas supprimer les données créées")
+
+    def handle(self, *args, **options):
+        prefixe = f"charge-{uuid.uuid4().hex[:8]}"
+        plat, emploi, etudiant = self._preparer(prefixe, options)
+        try:
+            asyncio.run(self._executer(emploi, etudiant, options))
+        finally:
+            if not options['garder']:
+                emploi.delete()
+                plat.delete()
+                etudiant.delete()
+
+    def _preparer(self, prefixe, options):
+        plat = Plat.objects.create(nom_plat=prefixe, prix=1, description="Plat de test de charge")
+        jour = date(2100, 1, 4)
+        while EmploiDuTemps.objects.filter(date=jour, creneau='soir').exists():
+            jour += timedelta(days=7)
+        emploi = EmploiDuTemps.objects.create(
+            plat=plat, jour='lundi', creneau='soir', date=jour,
+            quantite_disponible=options['reservations'],
+        )
+        etudiant = User.objects.create(
+            username=prefixe, email=f"{prefixe}@charge.local", password='!', institut=prefixe,
+        )
+        return plat, emploi, etudiant
+
+    async def _executer(self, emploi, etudiant, options):
+        application = AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)))
+        jeton = str(AccessToken.for_user(etudiant))
+        semaine = cache_menu.semaine_iso(emploi.date)
+        cle = str(emploi.pk)
+
+        # Connexions et abonnements, par lots
+        debut = time.perf_counter()
+        sockets = []
+        for i in range(0, options['sockets'], options['lot_connexions']):
+            lot = [
+                WebsocketCommunicator(application, f"/ws/cantine/?token={jeton}")
+                for _ in range(min(options['lot_connexions'], options['sockets'] - i))
+            ]
+            resultats = await asyncio.gather(*(s.connect(DELAI_RECEPTION) for s in lot))
+            if not all(connecte for connecte, _ in resultats):
+                self.stdout.write(self.style.ERROR("Connexion refusée"))
+                return
+            await asyncio.gather(*(s.send_json_to({'action': 'abonner', 'semaine': semaine}) for s in lot))
+            await asyncio.gather(*(s.receive_json_from(DELAI_RECEPTION) for s in lot))
+            sockets.extend(lot)
+        self.stdout.write(f"{len(sockets)} sockets connectées en {time.perf_counter() - debut:.2f}s")
+
+        lecteurs = [asyncio.create_task(self._lire(s, cle)) for s in sockets]
+
+        # Réservations en continu sur le créneau
+        @sync_to_async
+        def reserver():
+            with transaction.atomic():
+                reserver_places(emploi.pk, 1)
+
+        debut = time.perf_counter()
+        for _ in range(options['reservations']):
+            await reserver()
+        fin_reservations = time.perf_counter()
+        duree = fin_reservations - debut
+
+        # Laisser le relais pousser l'état final, puis clore par une notification
+        await asyncio.sleep(2 * temps_reel.INTERVALLE_PLACES)
+        await sync_to_async(Notification.objects.create)(
+            destinataire=etudiant, titre="Fin du test", contenu="Fin du test de charge",
+        )
+        resultats = await asyncio.gather(*lecteurs)
+        await asyncio.gather(*(s.disconnect() for s in sockets))
+
+        attendu = 0  # toutes les places ont été réservées
+        messages = [nombre for nombre, _, _, _ in resultats]
+        finales = sum(1 for _, derniere, _, _ in resultats if derniere == attendu)
+        notifiees = sum(1 for _, _, _, notifiee in resultats if notifiee)
+        delais = sorted(recu - fin_reservations for _, _, recu, _ in resultats if recu)
+        borne = math.ceil(duree / temps_reel.INTERVALLE_PLACES) + 2
+
+        self.stdout.write(
+            f"{options['reservations']} réservations en {duree:.2f}s "
+            f"({options['reservations'] / duree:.0f}/s)"
+        )
+        self.stdout.write(
+            f"Messages de places par socket : moyenne {statistics.mean(messages):.1f}, "
+            f"max {max(messages)} (borne attendue {borne}), total {sum(messages)}"
+        )
+        if delais:
+            self.stdout.write(
+                f"Réception de l'état final après la dernière réservation : "
+                f"médiane {statistics.median(delais) * 1000:.0f} ms, max {delais[-1] * 1000:.0f} ms"
+            )
+        ok = finales == len(sockets) and notifiees == len(sockets) and max(messages) <= borne
+        style = self.style.SUCCESS if ok else self.style.ERROR
+        self.stdout.write(style(
+            f"État final reçu : {finales}/{len(sockets)}, notification reçue : {notifiees}/{len(sockets)}"
+        ))
+
+    @staticmethod
+    async def _lire(socket, cle):
+        """Lit jusqu'à la notification de fin ; retourne (messages, dernière valeur, reçue à, notifiée)."""
+        nombre, derniere, recue = 0, None, None
+        while True:
+            try:
+                message = await socket.receive_json_from(DELAI_RECEPTION)
+            except asyncio.TimeoutError:
+                return nombre, derniere, recue, False
+            if message['type'] == 'notification':
+                return nombre, derniere, recue, True
+            if message['type'] == 'places' and cle in message['places']:
+                nombre += 1
+                derniere = message['places'][cle]
+                recue = time.perf_counter()
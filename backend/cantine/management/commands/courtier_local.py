@@ -0,0 +1,28 @@
+"""
+Lance le courtier local de la couche de canaux (voir cantine.courtier_local).
+
+    python manage.py courtier_local --socket /tmp/cantine-canaux.sock
+    python manage.py courtier_local --port 6390
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from cantine import courtier_local
+
+
+class Command(BaseCommand):
+    help = "Lance un courtier compatible Redis pour la couche de canaux, sans service externe"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help="Chemin de la socket Unix")
+        parser.add_argument('--hote', default='127.0.0.1')
+        parser.add_argument('--port', type=int)
+
+    def handle(self, *args, **options):
+        if not options['socket'] and not options['port']:
+            raise CommandError("Préciser --socket ou --port")
+        adresse = options['socket'] or f"{options['hote']}:{options['port']}"
+        self.stdout.write(f"Courtier local en écoute sur {adresse} (Ctrl+C pour arrêter)")
+        try:
+            courtier_local.executer(options['socket'], options['hote'], options['port'])
+        except KeyboardInterrupt:
+            pass
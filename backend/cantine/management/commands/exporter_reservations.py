@@ -0,0 +1,61 @@
+"""
+Extraction CSV ou NDJSON des réservations, sans passer par l'API.
+
+Mêmes filtres et même format que ``/api/reservations/extraction/`` ; le
+fichier est écrit par blocs, à mémoire constante :
+
+    python manage.py exporter_reservations --date-debut 2025-01-01 --date-fin 2025-06-30 -o s1.csv.gz --gzip
+    python manage.py exporter_reservations --statut accepte --creneau midi --sortie ndjson > midi.ndjson
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from cantine import export
+from cantine.filtres import filtrer_export
+from cantine.models import Reservation
+
+FILTRES = ('date_debut', 'date_fin', 'creneau', 'statut', 'emploi_du_temps', 'plat', 'institut')
+
+
+class Command(BaseCommand):
+    help = "Exporte les réservations en CSV ou NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-debut', help="Date de repas minimale (AAAA-MM-JJ)")
+        parser.add_argument('--date-fin', help="Date de repas maximale (AAAA-MM-JJ)")
+        parser.add_argument('--creneau', help="Créneaux, séparés par des virgules")
+        parser.add_argument('--statut', help="Statuts, séparés par des virgules")
+        parser.add_argument('--emploi-du-temps', help="Identifiant d'un créneau")
+        parser.add_argument('--plat', help="Identifiant d'un plat")
+        parser.add_argument('--institut')
+        parser.add_argument('--sortie', choices=list(export.FORMATS_EXTRACTION), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compresser en gzip")
+        parser.add_argument('-o', '--fichier', help="Fichier de sortie (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        params = {nom: options[nom] for nom in FILTRES if options[nom]}
+        try:
+            reservations = filtrer_export(Reservation.objects.all(), params)
+        except ValidationError as e:
+            raise CommandError(' ; '.join(f"{nom} : {' '.join(erreurs)}" for nom, erreurs in e.detail.items()))
+
+        debut = time.perf_counter()
+        octets = 0
+        destination = open(options['fichier'], 'wb') if options['fichier'] else sys.stdout.buffer
+        try:
+            for bloc in export.flux_extraction(reservations, options['sortie'], options['gzip']):
+                destination.write(bloc)
+                octets += len(bloc)
+        finally:
+            if options['fichier']:
+                destination.close()
+            else:
+                destination.flush()
+
+        if options['fichier']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['fichier']} : {octets / 1e6:.1f} Mo en {time.perf_counter() - debut:.1f}s"
+            ))
@@ -0,0 +1,71 @@
+"""
+Inscrit en masse les étudiants d'une liste CSV ou JSON (voir cantine.inscriptions).
+
+Colonnes : email, password, first_name, last_name, institut. Le format est
+déduit de l'extension ; ``--institut`` complète les lignes sans institut :
+
+    python manage.py importer_etudiants rentree_ensp.csv --institut ENSP
+    python manage.py importer_etudiants rentree.json --simuler
+"""
+import csv
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cantine import inscriptions
+
+
+class Command(BaseCommand):
+    help = "Inscrit les étudiants d'une liste CSV ou JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Liste CSV, JSON ou JSON Lines ('-' : entrée standard, en CSV)")
+        parser.add_argument('--format', dest='format_liste', choices=['csv', 'json'], help="Format (déduit de l'extension par défaut)")
+        parser.add_argument('--institut', help="Institut des lignes qui n'en précisent pas")
+        parser.add_argument('--taille-lot', type=int, default=inscriptions.TAILLE_LOT)
+        parser.add_argument('--processus', type=int, help="Processus de hachage (tous les cœurs par défaut)")
+        parser.add_argument('--simuler', action='store_true', help="Valider la liste sans rien créer")
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        format_liste = options['format_liste'] or inscriptions.FORMATS.get(os.path.splitext(chemin)[1].lower())
+        if chemin == '-':
+            format_liste = format_liste or 'csv'
+        if format_liste is None:
+            raise CommandError(f"Format inconnu, extensions acceptées : {', '.join(inscriptions.FORMATS)}")
+
+        def progression(rapport):
+            self.stderr.write(f"{rapport.lignes} lignes, {rapport.crees} inscrits, {rapport.nombre_erreurs} refusées")
+
+        try:
+            fichier = sys.stdin.buffer if chemin == '-' else open(chemin, 'rb')
+        except OSError as e:
+            raise CommandError(e)
+        try:
+            rapport = inscriptions.importer(
+                inscriptions.lire(fichier, format_liste),
+                institut=options['institut'],
+                taille_lot=options['taille_lot'],
+                processus=options['processus'],
+                simuler=options['simuler'],
+                progression=progression,
+            )
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f"Liste illisible : {e}")
+        finally:
+            if fichier is not sys.stdin.buffer:
+                fichier.close()
+
+        for erreur in rapport.erreurs:
+            details = ' ; '.join(f"{champ} : {' '.join(messages)}" for champ, messages in erreur['erreurs'].items())
+            self.stdout.write(f"Ligne {erreur['ligne']} ({erreur['email'] or '?'}) : {details}")
+        if rapport.nombre_erreurs > len(rapport.erreurs):
+            self.stdout.write(f"... et {rapport.nombre_erreurs - len(rapport.erreurs)} autre(s) ligne(s) refusée(s)")
+
+        donnees = rapport.donnees()
+        verbe = "à inscrire" if options['simuler'] else "inscrit(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{donnees['crees']} étudiant(s) {verbe}, {donnees['nombre_erreurs']} ligne(s) refusée(s) "
+            f"sur {donnees['lignes']}, en {donnees['duree']}s"
+        ))
@@ -0,0 +1,62 @@
+"""
+Prévoit la demande des créneaux d'une semaine et suggère leurs capacités
+(voir cantine.prevision).
+
+    python manage.py prevoir_demande                      # semaine prochaine
+    python manage.py prevoir_demande --semaine 2025-W20 --niveau-service 1.5
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from cantine import prevision
+from cantine.cache_menu import lundi_de_semaine, semaine_iso
+
+
+class Command(BaseCommand):
+    help = "Suggère la capacité de chaque créneau d'une semaine à partir de l'historique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semaine', help="Semaine ISO (AAAA-Wss), la suivante par défaut")
+        parser.add_argument('--historique', type=int, default=156, help="Semaines d'historique (156)")
+        parser.add_argument('--niveau-service', default='1',
+                            help="Marge en écarts types au-dessus de la demande attendue (1)")
+
+    def handle(self, *args, **options):
+        try:
+            niveau_service = prevision.lire_niveau_service(options['niveau_service'])
+        except ValidationError as e:
+            raise CommandError(f"--niveau-service : {e.detail['niveau_service'][0]}")
+        if options['semaine']:
+            try:
+                lundi = lundi_de_semaine(options['semaine'])
+            except ValidationError:
+                raise CommandError("Semaine invalide, format attendu : AAAA-Wss.")
+        else:
+            aujourdhui = timezone.localdate()
+            lundi = aujourdhui + timedelta(days=7 - aujourdhui.weekday())
+
+        debut = time.perf_counter()
+        observations = prevision.historique(lundi, options['historique'])
+        modele = prevision.ModelePrevision().entrainer(observations, lundi)
+        duree = time.perf_counter() - debut
+        self.stdout.write(
+            f"Modèle entraîné sur {len(observations)} créneau(x) en {duree:.2f} s"
+        )
+
+        creneaux = prevision.creneaux_de_semaine(lundi)
+        if not creneaux:
+            self.stdout.write(self.style.WARNING(f"Aucun créneau à prévoir pour {semaine_iso(lundi)}"))
+            return
+
+        self.stdout.write(f"Semaine {semaine_iso(lundi)}")
+        for p in prevision.suggerer(creneaux, lundi, niveau_service, modele):
+            self.stdout.write(
+                f"{prevision.date_du_jour(lundi, p.jour)} {p.jour:<9} {p.creneau:<5} plat {p.plat_id:<5} "
+                f"demande {p.demande if p.demande is not None else '-':>6} "
+                f"± {p.ecart_type if p.ecart_type is not None else '-':>5} "
+                f"→ capacité {p.capacite:>4}  ({p.niveau}, {p.observations} obs.)"
+            )
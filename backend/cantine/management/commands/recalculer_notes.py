@@ -0,0 +1,36 @@
+"""
+Reconstruit ou vérifie les agrégats de notes des plats (voir cantine.notes).
+
+    python manage.py recalculer_notes              # reconstruit tout
+    python manage.py recalculer_notes --verifier   # compare sans rien modifier
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from cantine import notes
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les agrégats de notes à partir des avis, ou vérifie leur cohérence"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verifier', action='store_true',
+            help="Échoue si les agrégats stockés diffèrent du recalcul complet"
+        )
+
+    def handle(self, *args, **options):
+        if options['verifier']:
+            differences = notes.ecarts()
+            for modele, cle, stocke, attendu in differences:
+                champs = [champ for champ in notes.CHAMPS_AGREGAT if stocke[champ] != attendu[champ]]
+                detail = ', '.join(f"{champ} {stocke[champ]} ≠ {attendu[champ]}" for champ in champs)
+                self.stdout.write(self.style.ERROR(f"✗ {modele} {cle} : {detail}"))
+            if differences:
+                raise CommandError(f"{len(differences)} agrégat(s) incohérent(s)")
+            self.stdout.write(self.style.SUCCESS("✓ Agrégats de notes cohérents"))
+            return
+
+        plats, semaines = notes.reconstruire()
+        self.stdout.write(self.style.SUCCESS(
+            f"Agrégats reconstruits : {plats} plat(s), {semaines} semaine(s)"
+        ))
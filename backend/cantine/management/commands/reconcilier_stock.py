@@ -0,0 +1,48 @@
+"""
+Recalcule les places disponibles des créneaux à partir des réservations.
+
+Pour chaque créneau, les places attendues sont ``capacite`` moins les
+places retenues par les réservations actives (en attente ou acceptées),
+calculées en une requête groupée. Sans ``--appliquer``, la commande se
+contente de lister les écarts :
+
+    python manage.py reconcilier_stock
+    python manage.py reconcilier_stock --date-debut 2025-01-01 --appliquer
+"""
+from django.core.management.base import BaseCommand
+
+from cantine import transitions
+from cantine.models import EmploiDuTemps
+
+
+class Command(BaseCommand):
+    help = "Corrige la dérive entre les places disponibles et les réservations actives"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-debut', help="Ne traiter que les créneaux à partir de cette date (AAAA-MM-JJ)")
+        parser.add_argument('--appliquer', action='store_true', help="Écrire les corrections")
+
+    def handle(self, *args, **options):
+        emplois = EmploiDuTemps.objects.all()
+        if options['date_debut']:
+            emplois = emplois.filter(date__gte=options['date_debut'])
+
+        ecarts = transitions.ecarts(emplois)
+        sans_capacite = [e for e in ecarts if e.capacite is None]
+        derives = [e for e in ecarts if e.attendu != e.disponible]
+        for ecart in derives:
+            survendu = " (survendu)" if ecart.capacite is not None and ecart.retenues > ecart.capacite else ""
+            self.stdout.write(
+                f"Créneau {ecart.emploi_id} : {ecart.disponible} places disponibles, "
+                f"{ecart.attendu} attendues (capacité {ecart.capacite}, {ecart.retenues} retenues){survendu}"
+            )
+        if sans_capacite:
+            self.stdout.write(f"{len(sans_capacite)} créneau(x) sans capacité connue")
+
+        if not options['appliquer']:
+            self.stdout.write(f"{len(derives)} créneau(x) en écart ; relancer avec --appliquer pour corriger")
+            return
+        # Les écarts sont recalculés sous verrou au moment d'écrire
+        corriges = transitions.corriger([e.emploi_id for e in ecarts])
+        derives = [e for e in corriges if e.attendu != e.disponible]
+        self.stdout.write(self.style.SUCCESS(f"{len(derives)} créneau(x) corrigé(s)"))
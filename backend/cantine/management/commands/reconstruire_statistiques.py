@@ -0,0 +1,46 @@
+"""
+Reconstruit ou vérifie les statistiques des créneaux (voir cantine.statistiques).
+
+L'historique est recalculé par lots de créneaux : une requête groupée et une
+transaction par lot, quelle que soit la taille de la table des réservations.
+
+    python manage.py reconstruire_statistiques                       # tout l'historique
+    python manage.py reconstruire_statistiques --depuis 2025-01-01 --taille-lot 200
+    python manage.py reconstruire_statistiques --verifier            # compare sans rien modifier
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cantine import statistiques
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les statistiques de réservations à partir des réservations, ou vérifie leur cohérence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', type=date.fromisoformat,
+                            help="Premier jour à traiter (ramené au lundi, AAAA-MM-JJ)")
+        parser.add_argument('--taille-lot', type=int, default=500, help="Créneaux par lot")
+        parser.add_argument('--verifier', action='store_true',
+                            help="Échoue si les statistiques stockées diffèrent du recalcul")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        if options['verifier']:
+            differences = statistiques.ecarts(options['depuis'], options['taille_lot'])
+            for modele, cle, stocke, attendu in differences:
+                champs = [champ for champ in statistiques.CHAMPS if stocke[champ] != attendu[champ]]
+                detail = ', '.join(f"{champ} {stocke[champ]} ≠ {attendu[champ]}" for champ in champs)
+                self.stdout.write(self.style.ERROR(f"✗ {modele} {cle} : {detail}"))
+            if differences:
+                raise CommandError(f"{len(differences)} statistique(s) incohérente(s)")
+            self.stdout.write(self.style.SUCCESS("✓ Statistiques cohérentes"))
+            return
+
+        creneaux, semaines = statistiques.reconstruire(options['depuis'], options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Statistiques reconstruites : {creneaux} ligne(s) de créneaux, {semaines} semaine(s) "
+            f"en {time.perf_counter() - debut:.1f}s"
+        ))
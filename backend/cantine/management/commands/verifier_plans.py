@@ -0,0 +1,109 @@
+"""
+Vérifie les plans d'exécution des requêtes fréquentes.
+
+Chaque requête des endpoints et tâches sensibles est passée à EXPLAIN ; la
+commande échoue si l'une d'elles parcourt entièrement une table volumineuse
+au lieu d'utiliser un index. Fonctionne sous SQLite et PostgreSQL :
+
+    python manage.py verifier_plans
+    python manage.py verifier_plans --verbeux   # affiche les plans
+"""
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cantine.diffusion import notifications_diffusees
+from cantine.models import Avis, EmploiDuTemps, Notification, Reservation, User
+from cantine.expiration import expirables, q_statuts
+
+# Tables dont le parcours complet est interdit (les autres restent petites)
+TABLES_SURVEILLEES = {
+    Reservation._meta.db_table,
+    Notification._meta.db_table,
+    EmploiDuTemps._meta.db_table,
+    Avis._meta.db_table,
+}
+
+PARCOURS_COMPLET = {
+    # "SCAN table" sans index ; "SCAN table USING INDEX" reste accepté
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def requetes_frequentes():
+    """Retourne la liste ``(nom, queryset)`` des requêtes à contrôler."""
+    etudiant = User(pk=1, is_staff=False, date_inscription=timezone.now())
+    maintenant = timezone.now()
+    lundi = maintenant.date() - timedelta(days=maintenant.weekday())
+    return [
+        ("Réservations d'un étudiant",
+         Reservation.objects.filter(etudiant=etudiant)),
+        ("Réservations paginées (personnel)",
+         Reservation.objects.filter(statut='accepte', date_reservation__lt=maintenant)
+         .order_by('-date_reservation', '-id')[:50]),
+        ("Doublon de réservation",
+         Reservation.objects.filter(
+             etudiant=etudiant, emploi_du_temps_id=1, statut__in=['en_attente', 'accepte']
+         )),
+        ("Réservations d'un créneau",
+         Reservation.objects.filter(emploi_du_temps_id=1, quantite__gt=0)),
+        ("Expiration des réservations (tâche)",
+         expirables(maintenant).filter(pk__gt=0).order_by('pk')),
+        ("Prochaine échéance d'expiration",
+         Reservation.objects.filter(statut='en_attente').order_by('date_reservation')[:1]),
+        ("Réservations par statut effectif",
+         Reservation.objects.filter(q_statuts(['en_attente', 'expire'], maintenant))
+         .order_by('-date_reservation', '-id')[:50]),
+        ("Notifications d'un utilisateur",
+         Notification.objects.filter(destinataire=etudiant)),
+        ("Notifications non lues",
+         Notification.objects.filter(destinataire=etudiant, est_lue=False)),
+        ("Notifications diffusées",
+         notifications_diffusees(etudiant)),
+        ("Emplois du temps de la semaine",
+         EmploiDuTemps.objects.filter(date__range=(lundi, lundi + timedelta(days=6)))),
+        ("Avis approuvés d'un plat",
+         Avis.objects.filter(plat_id=1, est_approuve=True)),
+        ("Avis paginés",
+         Avis.objects.filter(date_publication__lt=maintenant).order_by('-date_publication', '-id')[:50]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Échoue si une requête fréquente parcourt entièrement une table volumineuse"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbeux', action='store_true', help="Affiche chaque plan")
+
+    def handle(self, *args, **options):
+        motif = PARCOURS_COMPLET.get(connection.vendor)
+        if motif is None:
+            raise CommandError(f"Base non prise en charge : {connection.vendor}")
+
+        echecs = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Sur des tables peu remplies, PostgreSQL préfère le parcours
+                # séquentiel : on le défavorise pour vérifier qu'un index existe.
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for nom, queryset in requetes_frequentes():
+                plan = queryset.explain()
+                tables = set(motif.findall(plan)) & TABLES_SURVEILLEES
+                if options['verbeux']:
+                    self.stdout.write(f"--- {nom}\n{plan}")
+                if tables:
+                    echecs.append(nom)
+                    self.stdout.write(self.style.ERROR(
+                        f"✗ {nom} : parcours complet de {', '.join(sorted(tables))}"
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"✓ {nom}"))
+
+        if echecs:
+            raise CommandError(f"{len(echecs)} requête(s) sans index adapté")
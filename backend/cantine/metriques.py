@@ -0,0 +1,342 @@
+"""
+Métriques de performance, exposées au format texte de Prometheus sur /metrics.
+
+Sont mesurés :
+
+- chaque requête HTTP (MetriquesMiddleware) : durée par vue et méthode,
+  nombre de réponses par statut, nombre et durée des requêtes SQL (wrapper
+  d'exécution de la connexion, comme BudgetRequetesMixin) ;
+- chaque récepteur de signal de cantine.models (décorateur ``recepteur``,
+  qui remplace ``@receiver``) ;
+- chaque tâche Celery (signaux task_prerun / task_postrun).
+
+Chaque processus (worker gunicorn ou Celery) agrège ses mesures en mémoire
+et les écrit au plus une fois par INTERVALLE_ECRITURE dans son propre
+fichier de METRIQUES_DOSSIER, par remplacement atomique. /metrics additionne
+les fichiers de tous les processus ; ceux des processus terminés sont
+fusionnés dans ``archive.json`` pour que les compteurs ne reculent pas. Le
+dossier doit être local à la machine (un dossier par hôte).
+"""
+import atexit
+import fcntl
+import functools
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.dispatch import receiver
+
+INTERVALLE_ECRITURE = 1.0  # secondes
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BORNES_SQL = (1, 2, 5, 10, 20, 50, 100)
+
+# nom : (type, aide, bornes des histogrammes)
+DEFINITIONS = {
+    'cantine_http_requetes_total': ('counter', "Réponses HTTP par vue, méthode et statut", None),
+    'cantine_http_duree_secondes': ('histogram', "Durée des requêtes HTTP jusqu'à la réponse", BORNES_DUREE),
+    'cantine_sql_requetes': ('histogram', "Requêtes SQL par requête HTTP", BORNES_SQL),
+    'cantine_sql_duree_secondes_total': ('counter', "Temps passé dans les requêtes SQL, par vue", None),
+    'cantine_signal_duree_secondes': ('histogram', "Durée des récepteurs de signaux", BORNES_DUREE),
+    'cantine_tache_duree_secondes': ('histogram', "Durée des tâches Celery, par tâche et état", BORNES_DUREE),
+}
+
+
+def _dossier():
+    return settings.METRIQUES_DOSSIER
+
+
+class Registre:
+    """Mesures du processus courant."""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.compteurs = defaultdict(float)
+        # (nom, labels) -> [effectif par borne..., effectif au-delà, somme]
+        self.histogrammes = {}
+        self.fichier = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        self.ecrit_a = 0.0
+        self.modifie = False
+
+    def incrementer(self, nom, valeur=1, **labels):
+        with self.verrou:
+            self.compteurs[(nom, tuple(sorted(labels.items())))] += valeur
+            self.modifie = True
+
+    def observer(self, nom, valeur, **labels):
+        bornes = DEFINITIONS[nom][2]
+        cle = (nom, tuple(sorted(labels.items())))
+        with self.verrou:
+            seaux = self.histogrammes.get(cle)
+            if seaux is None:
+                seaux = self.histogrammes[cle] = [0] * (len(bornes) + 1) + [0.0]
+            for i, borne in enumerate(bornes):
+                if valeur <= borne:
+                    seaux[i] += 1
+                    break
+            else:
+                seaux[len(bornes)] += 1
+            seaux[-1] += valeur
+            self.modifie = True
+
+    def donnees(self):
+        with self.verrou:
+            return {
+                'compteurs': [[nom, list(labels), valeur] for (nom, labels), valeur in self.compteurs.items()],
+                'histogrammes': [[nom, list(labels), list(seaux)] for (nom, labels), seaux in self.histogrammes.items()],
+            }
+
+    def ecrire(self):
+        """Remplace le fichier du processus par ses mesures courantes."""
+        self.ecrit_a = time.monotonic()
+        if not self.modifie:
+            return
+        self.modifie = False
+        os.makedirs(_dossier(), exist_ok=True)
+        chemin = os.path.join(_dossier(), self.fichier)
+        temporaire = f"{chemin}.{threading.get_ident()}.tmp"
+        with open(temporaire, 'w') as f:
+            json.dump(self.donnees(), f, separators=(',', ':'))
+        os.replace(temporaire, chemin)
+
+    def ecrire_si_besoin(self):
+        if time.monotonic() - self.ecrit_a >= INTERVALLE_ECRITURE:
+            try:
+                self.ecrire()
+            except OSError:
+                pass
+
+
+registre = Registre()
+
+
+def _reinitialiser():
+    # Processus enfant (fork) : repartir de zéro dans un fichier à lui
+    global registre
+    registre = Registre()
+
+
+def _ecrire_a_la_sortie():
+    try:
+        registre.ecrire()
+    except OSError:
+        pass
+
+
+os.register_at_fork(after_in_child=_reinitialiser)
+atexit.register(_ecrire_a_la_sortie)
+
+
+# Agrégation et exposition
+
+def _fusionner(total, donnees):
+    for nom, labels, valeur in donnees['compteurs']:
+        total['compteurs'][(nom, tuple(map(tuple, labels)))] += valeur
+    for nom, labels, seaux in donnees['histogrammes']:
+        cle = (nom, tuple(map(tuple, labels)))
+        cumul = total['histogrammes'].get(cle)
+        total['histogrammes'][cle] = seaux if cumul is None else [a + b for a, b in zip(cumul, seaux)]
+
+
+def _vivant(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _lire(chemin):
+    try:
+        with open(chemin) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _vide():
+    return {'compteurs': defaultdict(float), 'histogrammes': {}}
+
+
+def _serialiser(total):
+    return {
+        'compteurs': [[nom, list(labels), valeur] for (nom, labels), valeur in total['compteurs'].items()],
+        'histogrammes': [[nom, list(labels), seaux] for (nom, labels), seaux in total['histogrammes'].items()],
+    }
+
+
+def agreger():
+    """Somme des mesures de tous les processus ; archive celles des processus terminés."""
+    dossier = _dossier()
+    os.makedirs(dossier, exist_ok=True)
+    with open(os.path.join(dossier, 'verrou'), 'w') as verrou:
+        fcntl.flock(verrou, fcntl.LOCK_EX)
+        archive = _vide()
+        donnees = _lire(os.path.join(dossier, 'archive.json'))
+        if donnees:
+            _fusionner(archive, donnees)
+        total = _vide()
+        _fusionner(total, _serialiser(archive))
+        termines = []
+        for nom in os.listdir(dossier):
+            if not nom.endswith('.json') or nom == 'archive.json':
+                continue
+            donnees = _lire(os.path.join(dossier, nom))
+            if donnees is None:
+                continue
+            _fusionner(total, donnees)
+            if not _vivant(int(nom.split('-')[0])):
+                _fusionner(archive, donnees)
+                termines.append(nom)
+        if termines:
+            chemin = os.path.join(dossier, 'archive.json')
+            with open(chemin + '.tmp', 'w') as f:
+                json.dump(_serialiser(archive), f, separators=(',', ':'))
+            os.replace(chemin + '.tmp', chemin)
+            for nom in termines:
+                os.remove(os.path.join(dossier, nom))
+    return total
+
+
+def _labels(labels, **supplementaires):
+    paires = list(labels) + list(supplementaires.items())
+    if not paires:
+        return ''
+    echapper = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{echapper(v)}"' for k, v in paires) + '}'
+
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) and not valeur.is_integer() else str(int(valeur))
+
+
+def texte_prometheus(total):
+    lignes = []
+    for nom, (type_metrique, aide, bornes) in DEFINITIONS.items():
+        lignes.append(f"# HELP {nom} {aide}")
+        lignes.append(f"# TYPE {nom} {type_metrique}")
+        if type_metrique == 'counter':
+            for (n, labels), valeur in sorted(total['compteurs'].items()):
+                if n == nom:
+                    lignes.append(f"{nom}{_labels(labels)} {_nombre(valeur)}")
+            continue
+        for (n, labels), seaux in sorted(total['histogrammes'].items()):
+            if n != nom:
+                continue
+            cumul = 0
+            for borne, effectif in zip(bornes, seaux):
+                cumul += effectif
+                lignes.append(f"{nom}_bucket{_labels(labels, le=borne)} {cumul}")
+            cumul += seaux[len(bornes)]
+            lignes.append(f"{nom}_bucket{_labels(labels, le='+Inf')} {cumul}")
+            lignes.append(f"{nom}_sum{_labels(labels)} {_nombre(seaux[-1])}")
+            lignes.append(f"{nom}_count{_labels(labels)} {cumul}")
+    return '\n'.join(lignes) + '\n'
+
+
+def exposer(request):
+    """
+    Vue /metrics. Avec METRIQUES_JETON, l'en-tête ``Authorization: Bearer
+    <jeton>`` est exigé ; sans jeton configuré, la vue n'existe qu'en DEBUG.
+    """
+    jeton = settings.METRIQUES_JETON
+    if jeton:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {jeton}'):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    registre.ecrire()
+    return HttpResponse(texte_prometheus(agreger()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Instrumentation
+
+class ChronometreSQL:
+    """Wrapper d'exécution mesurant le nombre et la durée des requêtes SQL."""
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree += time.perf_counter() - debut
+            self.nombre += 1
+
+
+class MetriquesMiddleware:
+    """Durée, statut et requêtes SQL de chaque requête, par vue (nom de route)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        debut = time.perf_counter()
+        sql = ChronometreSQL()
+        with connection.execute_wrapper(sql):
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        # Le nom de route borne le nombre de séries (pas d'identifiant dans le label)
+        correspondance = getattr(request, 'resolver_match', None)
+        vue = correspondance.view_name if correspondance else 'aucune'
+        registre.observer('cantine_http_duree_secondes', duree, vue=vue, methode=request.method)
+        registre.incrementer('cantine_http_requetes_total', vue=vue, methode=request.method, statut=response.status_code)
+        registre.observer('cantine_sql_requetes', sql.nombre, vue=vue)
+        registre.incrementer('cantine_sql_duree_secondes_total', sql.duree, vue=vue)
+        registre.ecrire_si_besoin()
+        return response
+
+
+# ``courant.signaux`` : liste des récepteurs exécutés, pendant un profilage (cantine.profilage)
+courant = threading.local()
+
+
+def recepteur(signal, **options):
+    """``@receiver`` dont chaque appel est chronométré sous le nom de la fonction."""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def mesure(*args, **kwargs):
+            debut = time.perf_counter()
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                duree = time.perf_counter() - debut
+                registre.observer('cantine_signal_duree_secondes', duree, recepteur=fonction.__name__)
+                signaux = getattr(courant, 'signaux', None)
+                if signaux is not None:
+                    signaux.append((fonction.__name__, getattr(kwargs.get('sender'), '__name__', ''), debut, duree))
+        return receiver(signal, **options)(mesure)
+    return decorateur
+
+
+_taches_en_cours = {}
+
+
+def connecter_celery():
+    from celery.signals import task_postrun, task_prerun
+
+    @task_prerun.connect(weak=False)
+    def debut_tache(task_id=None, **kwargs):
+        _taches_en_cours[task_id] = time.perf_counter()
+
+    @task_postrun.connect(weak=False)
+    def fin_tache(task_id=None, task=None, state=None, **kwargs):
+        debut = _taches_en_cours.pop(task_id, None)
+        if debut is not None:
+            registre.observer(
+                'cantine_tache_duree_secondes', time.perf_counter() - debut,
+                tache=getattr(task, 'name', '?'), etat=state or '?',
+            )
+            registre.ecrire_si_besoin()
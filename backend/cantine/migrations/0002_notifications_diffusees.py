@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDiffusee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titre', models.CharField(max_length=100)),
+                ('contenu', models.TextField()),
+                ('date_envoi', models.DateTimeField(auto_now_add=True)),
+                ('lien', models.CharField(blank=True, max_length=200, null=True)),
+                ('cle', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Notification diffusée',
+                'verbose_name_plural': 'Notifications diffusées',
+                'ordering': ['-date_envoi'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EtatNotificationDiffusee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('est_lue', models.BooleanField(default=False)),
+                ('est_supprimee', models.BooleanField(default=False)),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='etats_notifications_diffusees', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='etats', to='cantine.notificationdiffusee')),
+            ],
+            options={
+                'verbose_name': 'État de notification diffusée',
+                'verbose_name_plural': 'États de notifications diffusées',
+                'unique_together': {('notification', 'utilisateur')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0002_notifications_diffusees'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(fields=['plat', 'est_approuve'], name='avis_plat_approuve_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emploidutemps',
+            index=models.Index(fields=['date', 'creneau'], name='emploi_date_creneau_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['destinataire', '-date_envoi'], name='notification_dest_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('est_lue', False)), fields=['destinataire', '-date_envoi'], name='notification_non_lue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationdiffusee',
+            index=models.Index(fields=['-date_envoi'], name='diffusion_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['etudiant', '-date_reservation'], name='reservation_etudiant_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['etudiant', 'emploi_du_temps', 'statut'], name='reservation_etud_emploi_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['statut', 'date_reservation'], name='reservation_statut_date_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0004_index_pagination'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotePlat',
+            fields=[
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('somme', models.PositiveIntegerField(default=0)),
+                ('note_1', models.PositiveIntegerField(default=0)),
+                ('note_2', models.PositiveIntegerField(default=0)),
+                ('note_3', models.PositiveIntegerField(default=0)),
+                ('note_4', models.PositiveIntegerField(default=0)),
+                ('note_5', models.PositiveIntegerField(default=0)),
+                ('nombre_approuves', models.PositiveIntegerField(default=0)),
+                ('somme_approuves', models.PositiveIntegerField(default=0)),
+                ('approuves_1', models.PositiveIntegerField(default=0)),
+                ('approuves_2', models.PositiveIntegerField(default=0)),
+                ('approuves_3', models.PositiveIntegerField(default=0)),
+                ('approuves_4', models.PositiveIntegerField(default=0)),
+                ('approuves_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('plat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notes', serialize=False, to='cantine.plat')),
+            ],
+            options={
+                'verbose_name': "Notes d'un plat",
+                'verbose_name_plural': 'Notes des plats',
+            },
+        ),
+        migrations.CreateModel(
+            name='NoteHebdoPlat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('somme', models.PositiveIntegerField(default=0)),
+                ('note_1', models.PositiveIntegerField(default=0)),
+                ('note_2', models.PositiveIntegerField(default=0)),
+                ('note_3', models.PositiveIntegerField(default=0)),
+                ('note_4', models.PositiveIntegerField(default=0)),
+                ('note_5', models.PositiveIntegerField(default=0)),
+                ('nombre_approuves', models.PositiveIntegerField(default=0)),
+                ('somme_approuves', models.PositiveIntegerField(default=0)),
+                ('approuves_1', models.PositiveIntegerField(default=0)),
+                ('approuves_2', models.PositiveIntegerField(default=0)),
+                ('approuves_3', models.PositiveIntegerField(default=0)),
+                ('approuves_4', models.PositiveIntegerField(default=0)),
+                ('approuves_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('semaine', models.DateField()),
+                ('plat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notes_hebdo', to='cantine.plat')),
+            ],
+            options={
+                'verbose_name': "Notes hebdomadaires d'un plat",
+                'verbose_name_plural': 'Notes hebdomadaires des plats',
+                'indexes': [models.Index(fields=['semaine'], name='note_hebdo_semaine_idx')],
+                'unique_together': {('plat', 'semaine')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def initialiser_capacite(apps, schema_editor):
+    # Capacité = places disponibles + places retenues par les réservations actives
+    EmploiDuTemps = apps.get_model('cantine', 'EmploiDuTemps')
+    emplois = list(
+        EmploiDuTemps.objects.annotate(
+            retenues=Sum('reservation__quantite', filter=Q(reservation__statut__in=['en_attente', 'accepte']), default=0)
+        ).only('id', 'quantite_disponible')
+    )
+    for emploi in emplois:
+        emploi.capacite = emploi.quantite_disponible + emploi.retenues
+    EmploiDuTemps.objects.bulk_update(emplois, ['capacite'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0005_agregats_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emploidutemps',
+            name='capacite',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(initialiser_capacite, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0006_capacite_emploi_du_temps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueCreneau',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_en_attente', models.PositiveIntegerField(default=0)),
+                ('nombre_accepte', models.PositiveIntegerField(default=0)),
+                ('nombre_refuse', models.PositiveIntegerField(default=0)),
+                ('nombre_expire', models.PositiveIntegerField(default=0)),
+                ('quantite_en_attente', models.PositiveIntegerField(default=0)),
+                ('quantite_accepte', models.PositiveIntegerField(default=0)),
+                ('quantite_refuse', models.PositiveIntegerField(default=0)),
+                ('quantite_expire', models.PositiveIntegerField(default=0)),
+                ('recette', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('institut', models.CharField(max_length=100)),
+                ('emploi_du_temps', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques', to='cantine.emploidutemps')),
+                ('plat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_creneaux', to='cantine.plat')),
+            ],
+            options={
+                'verbose_name': "Statistiques d'un créneau",
+                'verbose_name_plural': 'Statistiques des créneaux',
+                'unique_together': {('emploi_du_temps', 'plat', 'institut')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StatistiqueSemaine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_en_attente', models.PositiveIntegerField(default=0)),
+                ('nombre_accepte', models.PositiveIntegerField(default=0)),
+                ('nombre_refuse', models.PositiveIntegerField(default=0)),
+                ('nombre_expire', models.PositiveIntegerField(default=0)),
+                ('quantite_en_attente', models.PositiveIntegerField(default=0)),
+                ('quantite_accepte', models.PositiveIntegerField(default=0)),
+                ('quantite_refuse', models.PositiveIntegerField(default=0)),
+                ('quantite_expire', models.PositiveIntegerField(default=0)),
+                ('recette', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('semaine', models.DateField()),
+                ('institut', models.CharField(max_length=100)),
+                ('plat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_semaines', to='cantine.plat')),
+            ],
+            options={
+                'verbose_name': 'Statistiques hebdomadaires',
+                'verbose_name_plural': 'Statistiques hebdomadaires',
+                'unique_together': {('semaine', 'plat', 'institut')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cantine', '0007_statistiques_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilRequete',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('demandeur_id', models.BigIntegerField(null=True)),
+                ('methode', models.CharField(max_length=10)),
+                ('chemin', models.CharField(max_length=500)),
+                ('vue', models.CharField(blank=True, max_length=200)),
+                ('statut', models.PositiveSmallIntegerField()),
+                ('duree', models.FloatField(help_text='Secondes')),
+                ('echantillons', models.PositiveIntegerField()),
+                ('nombre_requetes_sql', models.PositiveIntegerField()),
+                ('duree_sql', models.FloatField(help_text='Secondes')),
+                ('arbre', models.JSONField(default=dict)),
+                ('sql', models.JSONField(default=list)),
+                ('signaux', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Profil de requête',
+                'verbose_name_plural': 'Profils de requêtes',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+"""
+Mixins communs aux ViewSets de la cantine.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetDepasse(AssertionError):
+    pass
+
+
+class CompteurRequetes:
+    """Wrapper d'exécution comptant les requêtes SQL (voir ``connection.execute_wrapper``)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class BudgetRequetesMixin:
+    """
+    Vérifie qu'une action ne dépasse pas un nombre fixe de requêtes SQL,
+    quelle que soit la taille de la page renvoyée.
+
+    ``budget_requetes`` associe un nom d'action à son nombre maximal de
+    requêtes (authentification comprise). Un dépassement est journalisé, et
+    lève ``BudgetDepasse`` en mode DEBUG pour être repéré dès le développement.
+    """
+    budget_requetes = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        compteur = CompteurRequetes()
+        with connection.execute_wrapper(compteur):
+            response = super().dispatch(request, *args, **kwargs)
+
+        budget = self.budget_requetes.get(getattr(self, 'action', None))
+        if budget is not None and compteur.total > budget:
+            message = (
+                f"{self.__class__.__name__}.{self.action} : {compteur.total} requêtes "
+                f"pour un budget de {budget}"
+            )
+            logger.warning(message)
+            if settings.DEBUG:
+                raise BudgetDepasse(message)
+        return response
@@ -1,7 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
-from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from .metriques import recepteur
 from django.utils import timezone
 from datetime import timedelta
 import json
@@ -18,6 +18,9 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Utilisateur"
         verbose_name_plural = "Utilisateurs"
+        indexes = [
+            models.Index(fields=['institut'], name='utilisateur_institut_idx'),
+        ]
 
 class Plat(models.Model):
     TYPE_CHOICES = [
@@ -57,11 +60,18 @@ class EmploiDuTemps(models.Model):
     creneau = models.CharField(max_length=10, choices=CRENEAU_CHOICES)
     date = models.DateField()
     quantite_disponible = models.PositiveIntegerField(default=50)
+    # Places totales : quantite_disponible + places retenues par les
+    # réservations actives (voir cantine.transitions, reconcilier_stock)
+    capacite = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('jour', 'creneau', 'date')
+        indexes = [
+            # Menus de la semaine : filtres par plage de dates
+            models.Index(fields=['date', 'creneau'], name='emploi_date_creneau_idx'),
+        ]
         verbose_name = "Emploi du temps"
         verbose_name_plural = "Emplois du temps"
 
@@ -91,11 +101,38 @@ class Reservation(models.Model):
         verbose_name = "Réservation"
         verbose_name_plural = "Réservations"
         ordering = ['-date_reservation']
+        constraints = [
+            # Une seule réservation active (en attente ou acceptée) par créneau
+            models.UniqueConstraint(
+                fields=['etudiant', 'emploi_du_temps'],
+                condition=~models.Q(statut__in=['refuse', 'expire']),
+                name='unique_active_reservation_per_slot',
+            ),
+        ]
+        indexes = [
+            # Historique d'un étudiant, trié par date
+            models.Index(fields=['etudiant', '-date_reservation'], name='reservation_etudiant_date_idx'),
+            # Liste complète paginée par curseur (personnel)
+            models.Index(fields=['-date_reservation', '-id'], name='reservation_date_idx'),
+            # Contrôle de doublon (étudiant, créneau, statut actif)
+            models.Index(fields=['etudiant', 'emploi_du_temps', 'statut'], name='reservation_etud_emploi_idx'),
+            # Expiration et filtres par statut sur une période
+            models.Index(fields=['statut', 'date_reservation'], name='reservation_statut_date_idx'),
+        ]
     
     def clean(self):
         super().clean()
+        if self.pk:
+            from django.core.exceptions import ValidationError
+            from .transitions import TransitionInterdite, verifier
+            ancien = Reservation.objects.filter(pk=self.pk).values_list('statut', flat=True).first()
+            try:
+                verifier(ancien or self.statut, self.statut)
+            except TransitionInterdite as e:
+                raise ValidationError({'statut': str(e)})
 
-    def save(self, *args, **kwargs):
+    def calculer_total_prix(self):
+        """Calcule total_prix ; appelé par save() et avant un bulk_create."""
         from decimal import Decimal
         
         # Initialiser le prix total avec le prix du plat multiplié par la quantité
@@ -118,7 +155,19 @@ class Reservation(models.Model):
                 if isinstance(sup, dict) and 'prix' in sup
             )
             self.total_prix += supplements_price
-        super().save(*args, **kwargs)
+
+    # Les places sont reportées sur le stock par les récepteurs pre_save et
+    # pre_delete (voir reporter_statut_sur_stock, retirer_reservation) :
+    # l'écriture de la ligne se fait dans la même transaction, pour qu'un
+    # échec (contrainte unique...) annule aussi le mouvement de stock.
+    def save(self, *args, **kwargs):
+        self.calculer_total_prix()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.etudiant.username} - {self.plat.nom_plat} ({self.get_statut_display()})"
@@ -135,10 +184,59 @@ class Notification(models.Model):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
         ordering = ['-date_envoi']
+        indexes = [
+            models.Index(fields=['destinataire', '-date_envoi'], name='notification_dest_date_idx'),
+            # Notifications non lues uniquement
+            models.Index(
+                fields=['destinataire', '-date_envoi'],
+                condition=models.Q(est_lue=False),
+                name='notification_non_lue_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.titre} - {self.destinataire.username}"
 
+class NotificationDiffusee(models.Model):
+    """
+    Notification adressée à tous les étudiants, stockée une seule fois.
+
+    L'état par étudiant (lue, supprimée) n'est créé que lorsqu'il change,
+    dans EtatNotificationDiffusee. Un étudiant voit les diffusions envoyées
+    depuis son inscription.
+    """
+    titre = models.CharField(max_length=100)
+    contenu = models.TextField()
+    date_envoi = models.DateTimeField(auto_now_add=True)
+    lien = models.CharField(max_length=200, blank=True, null=True)
+    # Clé de déduplication facultative (ex. semaine de l'emploi du temps)
+    cle = models.CharField(max_length=100, unique=True, blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Notification diffusée"
+        verbose_name_plural = "Notifications diffusées"
+        ordering = ['-date_envoi']
+        indexes = [
+            models.Index(fields=['-date_envoi'], name='diffusion_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.titre
+
+class EtatNotificationDiffusee(models.Model):
+    notification = models.ForeignKey(NotificationDiffusee, on_delete=models.CASCADE, related_name='etats')
+    utilisateur = models.ForeignKey(User, on_delete=models.CASCADE, related_name='etats_notifications_diffusees')
+    est_lue = models.BooleanField(default=False)
+    est_supprimee = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "État de notification diffusée"
+        verbose_name_plural = "États de notifications diffusées"
+        unique_together = ('notification', 'utilisateur')
+
+    def __str__(self):
+        return f"{self.notification.titre} - {self.utilisateur.username}"
+
 class Parametre(models.Model):
     nom_parametre = models.CharField(max_length=50, unique=True)
     valeur = models.TextField()
@@ -152,15 +250,22 @@ class Parametre(models.Model):
     def __str__(self):
         return self.nom_parametre
 
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from . import parametres
+        try:
+            parametres.convertir(self.nom_parametre, self.valeur)
+        except ValueError as e:
+            raise ValidationError({'valeur': str(e)})
+
     @classmethod
     def get_duree_expiration(cls):
-        try:
-            return int(cls.objects.get(nom_parametre='duree_expiration_reservation').valeur)
-        except (cls.DoesNotExist, ValueError):
-            return 6  # Valeur par défaut de 6 heures
+        # Lu dans l'instantané du registre, sans requête (voir cantine.parametres)
+        from . import parametres
+        return parametres.valeur('duree_expiration_reservation')
 
 # Signaux pour les notifications automatiques
-@receiver(post_save, sender=Reservation)
+@recepteur(post_save, sender=Reservation)
 def gerer_notifications_reservation(sender, instance, created, **kwargs):
     if created:
         # Détails de la réservation
@@ -225,18 +330,38 @@ def gerer_notifications_reservation(sender, instance, created, **kwargs):
     else:
         pass
 
-@receiver(post_save, sender=Plat)
+def notifier_reservations_groupees(etudiant, reservations):
+    """
+    Notification unique récapitulant une réservation groupée, à la place
+    de celle que gerer_notifications_reservation crée pour chaque réservation.
+    """
+    lignes = "\n".join(
+        f"• {r.plat.nom_plat} - {r.emploi_du_temps.date} ({r.emploi_du_temps.get_jour_display()}, "
+        f"{r.emploi_du_temps.get_creneau_display()}) x{r.quantite}"
+        for r in reservations
+    )
+    Notification.objects.create(
+        destinataire=etudiant,
+        titre=f"✅ {len(reservations)} réservation(s) enregistrée(s)",
+        contenu=(
+            f"Vos réservations ont bien été enregistrées.\n\n"
+            f"Détails :\n{lignes}\n\n"
+            f"Vous recevrez une notification dès qu'elles seront traitées."
+        ),
+        lien="/reservations"
+    )
+
+@recepteur(post_save, sender=Plat)
 def gerer_notifications_modification_plat(sender, instance, created, **kwargs):
     if not created:  # Notification uniquement lors de la modification
-        for etudiant in User.objects.filter(is_staff=False):
-            Notification.objects.create(
-                destinataire=etudiant,
-                titre="Plat modifié",
-                contenu=f"Le plat '{instance.nom_plat}' a été mis à jour.",
-                lien=f"/plats/{instance.id}"
-            )
+        from .diffusion import diffuser_notification
+        diffuser_notification(
+            titre="Plat modifié",
+            contenu=f"Le plat '{instance.nom_plat}' a été mis à jour.",
+            lien=f"/plats/{instance.id}"
+        )
 
-# @receiver(post_save, sender=EmploiDuTemps)
+# @recepteur(post_save, sender=EmploiDuTemps)
 # def notifier_emploi_du_temps(sender, instance, created, **kwargs):
   #   if created:
     #     for etudiant in User.objects.filter(is_staff=False):
@@ -247,51 +372,66 @@ def gerer_notifications_modification_plat(sender, instance, created, **kwargs):
               #   lien="/emploi-du-temps/"
             # )
 
-@receiver(post_save, sender=EmploiDuTemps)
+@recepteur(post_save, sender=EmploiDuTemps)
 def notifier_emploi_du_temps_complet(sender, instance, created, **kwargs):
     # Ne pas notifier si c'est une mise à jour de quantité disponible uniquement
     if not created:
         # Vérifier si c'est une réservation (mise à jour de la quantité disponible)
-        from django.db.models import F
         reservations = Reservation.objects.filter(emploi_du_temps=instance, quantite__gt=0)
         if reservations.exists():
             return
         
-    # Vérifier si l'emploi du temps est complet pour la semaine
-    # Récupérer l'année et le numéro de semaine de la date de l'emploi du temps
-    annee = instance.date.isocalendar()[0]
-    semaine = instance.date.isocalendar()[1]
-    
-    # Vérifier si la semaine est complète (5 jours, 2 créneaux)
-    emplois_du_temps = EmploiDuTemps.objects.filter(
-        date__year=annee, date__week=semaine
+    # Vérifier si la semaine est complète (5 jours, 2 créneaux) en une requête.
+    # Une plage de dates (plutôt que date__week) permet d'utiliser l'index.
+    lundi = instance.date - timedelta(days=instance.date.weekday())
+    programmes = set(
+        EmploiDuTemps.objects.filter(date__range=(lundi, lundi + timedelta(days=6)))
+        .values_list('jour', 'creneau')
+        .distinct()
     )
+    if semaine_complete(programmes):
+        diffuser_semaine_disponible(lundi)
 
-    jours_programmes = emplois_du_temps.values_list('jour', flat=True).distinct()
-    creneaux_programmes = emplois_du_temps.values_list('creneau', flat=True).distinct()
+def semaine_complete(programmes):
+    """``programmes`` : ensemble des couples (jour, créneau) programmés dans la semaine."""
+    jours_programmes = {jour for jour, _ in programmes}
+    creneaux_programmes = {creneau for _, creneau in programmes}
+    return (
+        jours_programmes == {'lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi'}
+        and creneaux_programmes == {'midi', 'soir'}
+    )
 
-    if set(jours_programmes) == {'lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi'} and set(creneaux_programmes) == {'midi', 'soir'}:
-        # Vérifier si la notification n'existe pas déjà pour cette semaine
-        date_debut = instance.date - timedelta(days=instance.date.weekday())
-        date_fin = date_debut + timedelta(days=6)
-        
-        for etudiant in User.objects.filter(is_staff=False):
-            # Vérifier si une notification existe déjà pour cette semaine
-            notification_existante = Notification.objects.filter(
-                destinataire=etudiant,
-                titre="Emploi du temps disponible",
-                date_envoi__date__range=(date_debut, date_fin)
-            ).exists()
-            
-            if not notification_existante:
-                Notification.objects.create(
-                    destinataire=etudiant,
-                    titre="Emploi du temps disponible",
-                    contenu="L'emploi du temps des repas pour cette semaine est disponible.",
-                    lien="/emploi-du-temps/"
-                )
-
-@receiver(post_save, sender=EmploiDuTemps)
+def diffuser_semaine_disponible(lundi):
+    """Une seule diffusion par semaine, identifiée par sa clé."""
+    annee, semaine, _ = lundi.isocalendar()
+    from .diffusion import diffuser_notification
+    diffuser_notification(
+        titre="Emploi du temps disponible",
+        contenu="L'emploi du temps des repas pour cette semaine est disponible.",
+        lien=f"/emploi-du-temps/?semaine={annee}-W{semaine:02d}",
+        cle=f"emploi-du-temps-{annee}-W{semaine:02d}",
+    )
+
+@recepteur(pre_save, sender=EmploiDuTemps)
+def memoriser_emploi_du_temps_precedent(sender, instance, **kwargs):
+    """Conserve l'état en base avant modification pour notifier_modification_emploi_du_temps."""
+    instance._etat_precedent = None
+    if instance.pk:
+        instance._etat_precedent = (
+            EmploiDuTemps.objects.select_related('plat').filter(pk=instance.pk).first()
+        )
+
+@recepteur(pre_save, sender=EmploiDuTemps)
+def maintenir_capacite(sender, instance, **kwargs):
+    """Une modification manuelle des places disponibles change d'autant la capacité."""
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent is None:
+        if instance.capacite is None:
+            instance.capacite = instance.quantite_disponible
+    elif precedent.capacite is not None:
+        instance.capacite = precedent.capacite + instance.quantite_disponible - precedent.quantite_disponible
+
+@recepteur(post_save, sender=EmploiDuTemps)
 def notifier_modification_emploi_du_temps(sender, instance, created, **kwargs):
     """
     Notifie les utilisateurs des modifications importantes apportées à un emploi du temps.
@@ -301,78 +441,137 @@ def notifier_modification_emploi_du_temps(sender, instance, created, **kwargs):
         # Ne pas notifier pour les créations
         return
         
-    try:
-        # Récupérer l'ancienne version de l'emploi du temps
-        old_instance = EmploiDuTemps.objects.get(pk=instance.pk)
-        
-        # Vérifier si des champs importants ont changé (hors quantite_disponible)
-        fields_to_check = ['jour', 'creneau', 'date', 'plat']
-        has_important_changes = any(
-            getattr(instance, field) != getattr(old_instance, field)
-            for field in fields_to_check
-        )
-        
-        # Si aucun champ important n'a changé, vérifier si c'est juste quantite_disponible
-        if not has_important_changes:
-            # Ne pas notifier si seul le champ quantite_disponible a changé
-            return
-            
-        # Préparer le message de notification
-        message = f"L'emploi du temps a été modifié pour le plat '{instance.plat.nom_plat}':\n"
+    # Ancienne version de l'emploi du temps, lue avant l'enregistrement
+    old_instance = getattr(instance, '_etat_precedent', None)
+    if old_instance is None:
+        return
+
+    # Vérifier si des champs importants ont changé (hors quantite_disponible)
+    fields_to_check = ['jour', 'creneau', 'date', 'plat_id']
+    has_important_changes = any(
+        getattr(instance, field) != getattr(old_instance, field)
+        for field in fields_to_check
+    )
+    
+    # Ne pas notifier si seul le champ quantite_disponible a changé
+    if not has_important_changes:
+        return
         
-        # Vérifier les champs qui ont changé
-        if instance.jour != old_instance.jour:
-            message += f"- Jour: {old_instance.get_jour_display()} → {instance.get_jour_display()}\n"
-        if instance.creneau != old_instance.creneau:
-            message += f"- Créneau: {old_instance.get_creneau_display()} → {instance.get_creneau_display()}\n"
-        if instance.date != old_instance.date:
-            message += f"- Date: {old_instance.date} → {instance.date}\n"
-        if instance.plat != old_instance.plat:
-            message += f"- Plat: {old_instance.plat.nom_plat} → {instance.plat.nom_plat}\n"
-            
-        # Ajouter la quantité disponible actuelle
-        message += f"\nPlaces disponibles: {instance.quantite_disponible}"
+    # Préparer le message de notification
+    message = f"L'emploi du temps a été modifié pour le plat '{instance.plat.nom_plat}':\n"
+    
+    # Vérifier les champs qui ont changé
+    if instance.jour != old_instance.jour:
+        message += f"- Jour: {old_instance.get_jour_display()} → {instance.get_jour_display()}\n"
+    if instance.creneau != old_instance.creneau:
+        message += f"- Créneau: {old_instance.get_creneau_display()} → {instance.get_creneau_display()}\n"
+    if instance.date != old_instance.date:
+        message += f"- Date: {old_instance.date} → {instance.date}\n"
+    if instance.plat_id != old_instance.plat_id:
+        message += f"- Plat: {old_instance.plat.nom_plat} → {instance.plat.nom_plat}\n"
         
-        # Envoyer la notification à tous les utilisateurs
-        for etudiant in User.objects.filter(is_staff=False):
-            Notification.objects.create(
-                destinataire=etudiant,
-                titre="Modification de l'emploi du temps",
-                contenu=message,
-                lien="/reservation"
-            )
-            
-    except EmploiDuTemps.DoesNotExist:
-        # Cas où c'est une création (ne devrait pas arriver avec created=True)
-        pass
-@receiver(pre_save, sender=Reservation)
+    # Ajouter la quantité disponible actuelle
+    message += f"\nPlaces disponibles: {instance.quantite_disponible}"
+    
+    # Envoyer la notification à tous les utilisateurs
+    from .diffusion import diffuser_notification
+    diffuser_notification(
+        titre="Modification de l'emploi du temps",
+        contenu=message,
+        lien="/reservation"
+    )
+
+# Invalidation du cache des menus (voir cantine.cache_menu)
+@recepteur([post_save, post_delete], sender=Plat)
+def invalider_cache_menu_plat(sender, instance, **kwargs):
+    from .cache_menu import invalider, VERSION_PLATS
+    invalider(VERSION_PLATS)
+
+@recepteur([post_save, post_delete], sender=EmploiDuTemps)
+def invalider_cache_menu_emploi(sender, instance, **kwargs):
+    from .cache_menu import invalider, semaines_concernees, VERSION_EMPLOIS
+    # Si la date a changé, l'ancienne semaine est aussi invalidée
+    precedent = getattr(instance, '_etat_precedent', None)
+    invalider(VERSION_EMPLOIS, *semaines_concernees(
+        instance.date, precedent.date if precedent else None
+    ))
+
+# Temps réel (voir cantine.temps_reel) : places et notifications poussées aux sockets
+@recepteur(post_save, sender=EmploiDuTemps)
+def signaler_places_emploi(sender, instance, **kwargs):
+    from .temps_reel import signaler_places
+    signaler_places([instance.pk])
+
+@recepteur(post_save, sender=Notification)
+def pousser_notification(sender, instance, created, **kwargs):
+    if created and instance.destinataire_id:
+        from .temps_reel import donnees_notification, envoyer_notification, groupe_notifications
+        envoyer_notification(groupe_notifications(instance.destinataire_id), donnees_notification(instance))
+
+@recepteur(post_save, sender=NotificationDiffusee)
+def pousser_diffusion(sender, instance, created, **kwargs):
+    if created:
+        from .temps_reel import envoyer_notification, GROUPE_DIFFUSIONS
+        envoyer_notification(GROUPE_DIFFUSIONS, {
+            'id': -instance.pk,
+            'titre': instance.titre,
+            'contenu': instance.contenu,
+            'lien': instance.lien,
+            'date_envoi': instance.date_envoi.isoformat(),
+            'est_lue': False,
+            'est_diffusee': True,
+        })
+
+@recepteur(pre_save, sender=Reservation)
 def verifier_expiration(sender, instance, **kwargs):
-    if instance.pk and instance.statut == 'en_attente':
-        duree_expiration = Parametre.get_duree_expiration()
-        delai_expiration = timezone.now() - timedelta(hours=duree_expiration)
-        
-        if instance.date_reservation < delai_expiration:
-            instance.statut = 'expire'
-            Notification.objects.create(
-                destinataire=instance.etudiant,
-                titre="Réservation expirée",
-                contenu=f"Votre réservation pour {instance.plat.nom_plat} a expiré.",
-                lien=f"/reservations/{instance.id}"
-            )
+    from . import expiration, transitions
+    if instance.pk and instance.statut == 'en_attente' and expiration.statut_de(instance) == 'expire':
+        # Transition écrite (et places rendues) une seule fois, même si le
+        # balayage est passé depuis la lecture de l'instance. La
+        # notification est envoyée par gerer_notifications_reservation.
+        transitions.transitionner(Reservation.objects.filter(pk=instance.pk), 'expire')
+        instance.statut = 'expire'
 
-# Création des paramètres par défaut
-@receiver(post_save, sender=Parametre)
-def creer_parametres_par_defaut(sender, **kwargs):
-    parametres_defaut = [
-        ('duree_expiration_reservation', '6', 'Durée en heures avant expiration des réservations'),
-        ('types_plats', 'standard,vip,vegetarien,sans_gluten', 'Types de plats autorisés'),
-    ]
-    
-    for nom, valeur, description in parametres_defaut:
-        Parametre.objects.get_or_create(
-            nom_parametre=nom,
-            defaults={'valeur': valeur, 'description': description}
+@recepteur(pre_save, sender=Reservation)
+def memoriser_reservation_precedente(sender, instance, **kwargs):
+    """État en base avant l'enregistrement, pour le stock et les statistiques."""
+    from .statistiques import etat_en_base
+    # Création : les places sont prises par la vue (cantine.stock)
+    instance._etat_precedent = etat_en_base(instance.pk) if instance.pk else None
+
+@recepteur(pre_save, sender=Reservation)
+def reporter_statut_sur_stock(sender, instance, **kwargs):
+    """Reporte sur le stock un changement de statut, de quantité ou de créneau fait par save()."""
+    from . import transitions
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent is not None:
+        transitions.reporter_sur_stock(
+            (precedent.statut, precedent.emploi_du_temps_id, precedent.quantite),
+            (instance.statut, instance.emploi_du_temps_id, instance.quantite),
+        )
+
+@recepteur(pre_delete, sender=Reservation)
+def retirer_reservation(sender, instance, origin=None, **kwargs):
+    """Rend les places et retire la réservation des statistiques."""
+    from . import statistiques, transitions
+    # Suppression en cascade d'un créneau (ou du plat de ses créneaux) : ses
+    # places et ses statistiques disparaissent avec lui
+    if isinstance(origin, (EmploiDuTemps, Plat)) or getattr(origin, 'model', None) in (EmploiDuTemps, Plat):
+        return
+    precedent = statistiques.etat_en_base(instance.pk)
+    if precedent is not None:
+        transitions.reporter_sur_stock(
+            (precedent.statut, precedent.emploi_du_temps_id, precedent.quantite), (None, None, 0)
         )
+        deltas = statistiques.Deltas()
+        deltas.ajouter(*precedent, signe=-1)
+        deltas.appliquer()
+
+@recepteur([post_save, post_delete], sender=Parametre)
+def invalider_parametres(sender, **kwargs):
+    from . import parametres
+    parametres.invalider()
+
 class Avis(models.Model):
     etudiant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='avis_donnes')
     plat = models.ForeignKey(Plat, on_delete=models.CASCADE, related_name='avis_recus')
@@ -385,12 +584,16 @@ class Avis(models.Model):
         verbose_name = "Avis"
         verbose_name_plural = "Avis"
         ordering = ['-date_publication']
+        indexes = [
+            models.Index(fields=['plat', 'est_approuve'], name='avis_plat_approuve_idx'),
+            models.Index(fields=['-date_publication', '-id'], name='avis_date_idx'),
+        ]
 
     def __str__(self):
         return f"Avis de {self.etudiant} sur {self.plat} - {self.note}/5"
 
 # Signal pour vérifier que l'étudiant a bien consommé le plat avant de noter
-@receiver(pre_save, sender=Avis)
+@recepteur(pre_save, sender=Avis)
 def verifier_avis(sender, instance, **kwargs):
     if not Reservation.objects.filter(
         etudiant=instance.etudiant,
@@ -400,7 +603,7 @@ def verifier_avis(sender, instance, **kwargs):
         raise ValueError("Vous ne pouvez noter que les plats que vous avez consommés.")
 
 # Signal pour notifier l'utilisateur quand son avis est approuvé
-@receiver(pre_save, sender=Avis)
+@recepteur(pre_save, sender=Avis)
 def notifier_approbation_avis(sender, instance, **kwargs):
     try:
         # Récupérer l'ancien état de l'avis
@@ -417,7 +620,7 @@ def notifier_approbation_avis(sender, instance, **kwargs):
         # C'est un nouvel avis, pas besoin de notification
         pass
 
-@receiver(post_save, sender=Avis)
+@recepteur(post_save, sender=Avis)
 def notifier_nouvel_avis(sender, instance, created, **kwargs):
     if created:
         # Notification pour l'admin
@@ -427,3 +630,217 @@ def notifier_nouvel_avis(sender, instance, created, **kwargs):
             contenu=f"Un nouvel avis a été posté pour le plat '{instance.plat.nom_plat}'.",
             lien=f"/admin/cantine/avis/{instance.id}/"
         )
+
+class AgregatNotes(models.Model):
+    """
+    Compteurs de notes tenus à jour au fil des avis (voir cantine.notes).
+    Les colonnes ``approuves_*`` ne comptent que les avis approuvés, seuls
+    visibles des étudiants.
+    """
+    nombre = models.PositiveIntegerField(default=0)
+    somme = models.PositiveIntegerField(default=0)
+    note_1 = models.PositiveIntegerField(default=0)
+    note_2 = models.PositiveIntegerField(default=0)
+    note_3 = models.PositiveIntegerField(default=0)
+    note_4 = models.PositiveIntegerField(default=0)
+    note_5 = models.PositiveIntegerField(default=0)
+    nombre_approuves = models.PositiveIntegerField(default=0)
+    somme_approuves = models.PositiveIntegerField(default=0)
+    approuves_1 = models.PositiveIntegerField(default=0)
+    approuves_2 = models.PositiveIntegerField(default=0)
+    approuves_3 = models.PositiveIntegerField(default=0)
+    approuves_4 = models.PositiveIntegerField(default=0)
+    approuves_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def moyenne(self):
+        return round(self.somme / self.nombre, 2) if self.nombre else None
+
+    @property
+    def moyenne_approuves(self):
+        return round(self.somme_approuves / self.nombre_approuves, 2) if self.nombre_approuves else None
+
+    def histogramme(self, approuves=False):
+        prefixe = 'approuves' if approuves else 'note'
+        return {note: getattr(self, f'{prefixe}_{note}') for note in range(1, 6)}
+
+class NotePlat(AgregatNotes):
+    plat = models.OneToOneField(Plat, on_delete=models.CASCADE, primary_key=True, related_name='notes')
+
+    class Meta:
+        verbose_name = "Notes d'un plat"
+        verbose_name_plural = "Notes des plats"
+
+    def __str__(self):
+        return f"Notes de {self.plat} ({self.nombre} avis)"
+
+class NoteHebdoPlat(AgregatNotes):
+    plat = models.ForeignKey(Plat, on_delete=models.CASCADE, related_name='notes_hebdo')
+    # Lundi de la semaine de publication des avis
+    semaine = models.DateField()
+
+    class Meta:
+        verbose_name = "Notes hebdomadaires d'un plat"
+        verbose_name_plural = "Notes hebdomadaires des plats"
+        unique_together = ('plat', 'semaine')
+        indexes = [
+            models.Index(fields=['semaine'], name='note_hebdo_semaine_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notes de {self.plat} semaine du {self.semaine}"
+
+# Agrégats de notes : l'état en base est lu avant l'enregistrement ou la
+# suppression pour retirer sa contribution, l'instance en mémoire pouvant
+# être périmée ; la nouvelle contribution est ensuite ajoutée.
+@recepteur([pre_save, pre_delete], sender=Avis)
+def memoriser_avis_precedent(sender, instance, **kwargs):
+    instance._etat_precedent = None
+    # Suppression en cascade d'un plat : ses agrégats disparaissent avec lui
+    origine = kwargs.get('origin')
+    if isinstance(origine, Plat) or getattr(origine, 'model', None) is Plat:
+        return
+    if instance.pk:
+        instance._etat_precedent = (
+            Avis.objects.filter(pk=instance.pk)
+            .values('plat_id', 'note', 'est_approuve', 'date_publication')
+            .first()
+        )
+
+@recepteur(post_save, sender=Avis)
+def mettre_a_jour_notes(sender, instance, **kwargs):
+    from .notes import contribution, appliquer_contributions
+    precedent = getattr(instance, '_etat_precedent', None)
+    deltas = contribution(
+        instance.plat_id, instance.note, instance.est_approuve, instance.date_publication
+    )
+    if precedent:
+        deltas.subtract(contribution(**precedent))
+    appliquer_contributions(deltas)
+
+@recepteur(post_delete, sender=Avis)
+def retirer_notes(sender, instance, **kwargs):
+    from .notes import contribution, appliquer_contributions
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent:
+        appliquer_contributions({cle: -n for cle, n in contribution(**precedent).items()})
+
+class AgregatReservations(models.Model):
+    """
+    Compteurs de réservations tenus à jour au fil des créations et des
+    changements de statut (voir cantine.statistiques) : nombre et quantité
+    par statut, recette des réservations acceptées.
+    """
+    nombre_en_attente = models.PositiveIntegerField(default=0)
+    nombre_accepte = models.PositiveIntegerField(default=0)
+    nombre_refuse = models.PositiveIntegerField(default=0)
+    nombre_expire = models.PositiveIntegerField(default=0)
+    quantite_en_attente = models.PositiveIntegerField(default=0)
+    quantite_accepte = models.PositiveIntegerField(default=0)
+    quantite_refuse = models.PositiveIntegerField(default=0)
+    quantite_expire = models.PositiveIntegerField(default=0)
+    recette = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+class StatistiqueCreneau(AgregatReservations):
+    # Une ligne par créneau, plat réservé et institut des étudiants
+    emploi_du_temps = models.ForeignKey(EmploiDuTemps, on_delete=models.CASCADE, related_name='statistiques')
+    plat = models.ForeignKey(Plat, on_delete=models.CASCADE, related_name='statistiques_creneaux')
+    institut = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = "Statistiques d'un créneau"
+        verbose_name_plural = "Statistiques des créneaux"
+        unique_together = ('emploi_du_temps', 'plat', 'institut')
+
+    def __str__(self):
+        return f"Statistiques {self.emploi_du_temps_id} / {self.plat_id} / {self.institut}"
+
+class StatistiqueSemaine(AgregatReservations):
+    # Lundi de la semaine des créneaux
+    semaine = models.DateField()
+    plat = models.ForeignKey(Plat, on_delete=models.CASCADE, related_name='statistiques_semaines')
+    institut = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = "Statistiques hebdomadaires"
+        verbose_name_plural = "Statistiques hebdomadaires"
+        unique_together = ('semaine', 'plat', 'institut')
+
+    def __str__(self):
+        return f"Statistiques semaine du {self.semaine} / {self.plat_id} / {self.institut}"
+
+# Statistiques de réservations : comme pour les stocks, l'état en base est
+# lu avant l'enregistrement (memoriser_reservation_precedente) ; sa
+# contribution est retirée et la nouvelle ajoutée après l'enregistrement.
+@recepteur(post_save, sender=Reservation)
+def mettre_a_jour_statistiques(sender, instance, **kwargs):
+    from . import statistiques
+    deltas = statistiques.Deltas()
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent:
+        deltas.ajouter(*precedent, signe=-1)
+    deltas.ajouter(*statistiques.etat(instance))
+    deltas.appliquer()
+
+@recepteur(pre_delete, sender=EmploiDuTemps)
+def retirer_statistiques_emploi(sender, instance, **kwargs):
+    # Les lignes du créneau sont supprimées en cascade ; sa semaine est corrigée ici
+    from . import statistiques
+    statistiques.deplacer_emploi(instance.pk, instance.date, None)
+
+@recepteur(post_save, sender=EmploiDuTemps)
+def deplacer_statistiques_emploi(sender, instance, created, **kwargs):
+    from . import statistiques
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent is not None and precedent.date != instance.date:
+        statistiques.deplacer_emploi(instance.pk, precedent.date, instance.date)
+
+@recepteur(pre_save, sender=User)
+def memoriser_institut_precedent(sender, instance, update_fields=None, **kwargs):
+    instance._institut_precedent = None
+    # Les enregistrements partiels (last_login...) ne touchent pas à l'institut
+    if instance.pk and (update_fields is None or 'institut' in update_fields):
+        instance._institut_precedent = User.objects.filter(pk=instance.pk).values_list('institut', flat=True).first()
+
+@recepteur(post_save, sender=User)
+def deplacer_statistiques_etudiant(sender, instance, created, **kwargs):
+    precedent = getattr(instance, '_institut_precedent', None)
+    if not created and precedent is not None and precedent != instance.institut:
+        from . import statistiques
+        statistiques.deplacer_etudiant(instance.pk, precedent, instance.institut)
+
+
+class ProfilRequete(models.Model):
+    """
+    Profil d'une requête capturée à la demande du personnel (voir
+    cantine.profilage). Seuls les PROFILS_MAX derniers sont conservés.
+    """
+    date = models.DateTimeField(auto_now_add=True)
+    demandeur_id = models.BigIntegerField(null=True)
+    methode = models.CharField(max_length=10)
+    chemin = models.CharField(max_length=500)
+    vue = models.CharField(max_length=200, blank=True)
+    statut = models.PositiveSmallIntegerField()
+    duree = models.FloatField(help_text="Secondes")
+    echantillons = models.PositiveIntegerField()
+    nombre_requetes_sql = models.PositiveIntegerField()
+    duree_sql = models.FloatField(help_text="Secondes")
+    arbre = models.JSONField(default=dict)
+    sql = models.JSONField(default=list)
+    signaux = models.JSONField(default=list)
+
+    class Meta:
+        verbose_name = "Profil de requête"
+        verbose_name_plural = "Profils de requêtes"
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.methode} {self.chemin} ({self.duree * 1000:.0f} ms)"
@@ -0,0 +1,225 @@
+"""
+Agrégats des notes des plats, par plat et par semaine.
+
+Les compteurs (nombre, somme, histogramme 1 à 5, et les mêmes pour les seuls
+avis approuvés) sont modifiés à chaque création, modification ou suppression
+d'un avis par une mise à jour relative (``F() + n``) : la moyenne d'un plat
+ou le classement se lisent sans parcourir la table des avis. La commande
+``recalculer_notes`` reconstruit ou vérifie ces compteurs à partir des avis.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast, TruncWeek
+from django.utils import timezone
+
+from .models import Avis, NoteHebdoPlat, NotePlat
+
+logger = logging.getLogger(__name__)
+
+
+def semaine_de(date_publication):
+    """Lundi de la semaine de publication, dans le fuseau courant."""
+    jour = timezone.localtime(date_publication).date()
+    return jour - timedelta(days=jour.weekday())
+
+
+def contribution(plat_id, note, est_approuve, date_publication):
+    """Contribution d'un avis, sous la forme ``{(plat, semaine, note, approuvé): 1}``."""
+    return Counter({(plat_id, semaine_de(date_publication), note, est_approuve): 1})
+
+
+def _champs(note, est_approuve, n):
+    champs = {'nombre': n, 'somme': n * note, f'note_{note}': n}
+    if est_approuve:
+        champs.update({
+            'nombre_approuves': n, 'somme_approuves': n * note, f'approuves_{note}': n,
+        })
+    return champs
+
+
+def regrouper(deltas):
+    """
+    Regroupe des contributions par ligne d'agrégat.
+
+    Retourne deux dictionnaires ``{plat_id: Counter}`` et
+    ``{(plat_id, semaine): Counter}`` des variations de chaque colonne.
+    """
+    par_plat = defaultdict(Counter)
+    par_semaine = defaultdict(Counter)
+    for (plat_id, semaine, note, est_approuve), n in deltas.items():
+        if not n:
+            continue
+        champs = _champs(note, est_approuve, n)
+        par_plat[plat_id].update(champs)
+        par_semaine[(plat_id, semaine)].update(champs)
+    return par_plat, par_semaine
+
+
+def _ajouter(modele, filtre, variations):
+    variations = {champ: n for champ, n in variations.items() if n}
+    if not variations:
+        return
+    valeurs = {champ: F(champ) + n for champ, n in variations.items()}
+    valeurs['updated_at'] = timezone.now()
+    if modele.objects.filter(**filtre).update(**valeurs):
+        return
+    if any(n < 0 for n in variations.values()):
+        # Rien à retirer d'une ligne absente (plat en cours de suppression,
+        # ou agrégats à reconstruire avec recalculer_notes)
+        logger.warning("Agrégat %s %s absent, variation ignorée", modele.__name__, filtre)
+        return
+    try:
+        with transaction.atomic():
+            modele.objects.create(**filtre, **variations)
+    except IntegrityError:
+        # Ligne créée entre-temps par une autre transaction
+        modele.objects.filter(**filtre).update(**valeurs)
+
+
+def appliquer_contributions(deltas):
+    """
+    Applique des variations de contributions aux agrégats : une mise à jour
+    par ligne concernée, quel que soit le nombre d'avis.
+    """
+    par_plat, par_semaine = regrouper(deltas)
+    with transaction.atomic():
+        for plat_id, variations in par_plat.items():
+            _ajouter(NotePlat, {'plat_id': plat_id}, variations)
+        for (plat_id, semaine), variations in par_semaine.items():
+            _ajouter(NoteHebdoPlat, {'plat_id': plat_id, 'semaine': semaine}, variations)
+
+    # La moyenne publique (avis approuvés) fait partie du menu mis en cache
+    if any(variations.get('nombre_approuves') or variations.get('somme_approuves')
+           for variations in par_plat.values()):
+        from .cache_menu import invalider, VERSION_PLATS
+        invalider(VERSION_PLATS)
+
+
+def _lundi(semaine):
+    """Date du lundi renvoyé par TruncWeek (date ou datetime selon la base)."""
+    if hasattr(semaine, 'date'):
+        return timezone.localtime(semaine).date() if timezone.is_aware(semaine) else semaine.date()
+    return semaine
+
+
+def changer_approbation(queryset, est_approuve):
+    """
+    Approuve ou désapprouve les avis de ``queryset`` sans passer par les
+    signaux, en reportant la variation sur les agrégats. Les contributions
+    sont regroupées par la base (plat, semaine, note) : le coût ne dépend
+    pas du nombre d'avis. Retourne les ids des avis réellement modifiés.
+    """
+    with transaction.atomic():
+        ids = list(
+            queryset.select_for_update()
+            .exclude(est_approuve=est_approuve)
+            .values_list('id', flat=True)
+        )
+        groupes = list(
+            Avis.objects.filter(pk__in=ids)
+            .annotate(semaine=TruncWeek('date_publication'))
+            .values_list('plat_id', 'semaine', 'note')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        Avis.objects.filter(pk__in=ids).update(est_approuve=est_approuve)
+
+        deltas = Counter()
+        for plat_id, semaine, note, n in groupes:
+            semaine = _lundi(semaine)
+            deltas[(plat_id, semaine, note, est_approuve)] += n
+            deltas[(plat_id, semaine, note, not est_approuve)] -= n
+        appliquer_contributions(deltas)
+    return ids
+
+
+def contributions_attendues():
+    """Recalcule toutes les contributions à partir des avis, en une requête groupée."""
+    lignes = (
+        Avis.objects
+        .annotate(semaine=TruncWeek('date_publication'))
+        .values('plat_id', 'semaine', 'note', 'est_approuve')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    deltas = Counter()
+    for ligne in lignes:
+        deltas[(ligne['plat_id'], _lundi(ligne['semaine']), ligne['note'], ligne['est_approuve'])] += ligne['n']
+    return deltas
+
+
+CHAMPS_AGREGAT = [
+    'nombre', 'somme', 'note_1', 'note_2', 'note_3', 'note_4', 'note_5',
+    'nombre_approuves', 'somme_approuves',
+    'approuves_1', 'approuves_2', 'approuves_3', 'approuves_4', 'approuves_5',
+]
+
+
+def ecarts():
+    """
+    Compare les agrégats stockés au recalcul complet. Retourne la liste des
+    lignes divergentes ``(modele, cle, stocke, attendu)``.
+    """
+    par_plat, par_semaine = regrouper(contributions_attendues())
+    stockes_plat = {
+        ligne.pop('plat_id'): ligne
+        for ligne in NotePlat.objects.values('plat_id', *CHAMPS_AGREGAT)
+    }
+    stockes_semaine = {
+        (ligne.pop('plat_id'), ligne.pop('semaine')): ligne
+        for ligne in NoteHebdoPlat.objects.values('plat_id', 'semaine', *CHAMPS_AGREGAT)
+    }
+
+    differences = []
+    for modele, stockes, attendus in (
+        (NotePlat, stockes_plat, par_plat),
+        (NoteHebdoPlat, stockes_semaine, par_semaine),
+    ):
+        for cle in stockes.keys() | attendus.keys():
+            attendu = {champ: attendus[cle][champ] for champ in CHAMPS_AGREGAT}
+            stocke = stockes.get(cle, dict.fromkeys(CHAMPS_AGREGAT, 0))
+            if stocke != attendu:
+                differences.append((modele.__name__, cle, stocke, attendu))
+    return differences
+
+
+def reconstruire():
+    """Remplace tous les agrégats par le recalcul complet. Retourne (plats, semaines)."""
+    par_plat, par_semaine = regrouper(contributions_attendues())
+    with transaction.atomic():
+        NotePlat.objects.all().delete()
+        NoteHebdoPlat.objects.all().delete()
+        NotePlat.objects.bulk_create(
+            [NotePlat(plat_id=plat_id, **variations) for plat_id, variations in par_plat.items()],
+            batch_size=500,
+        )
+        NoteHebdoPlat.objects.bulk_create(
+            [NoteHebdoPlat(plat_id=plat_id, semaine=semaine, **variations)
+             for (plat_id, semaine), variations in par_semaine.items()],
+            batch_size=500,
+        )
+        from .cache_menu import invalider, VERSION_PLATS
+        invalider(VERSION_PLATS)
+    return len(par_plat), len(par_semaine)
+
+
+def classement(semaine=None, approuves=True, min_avis=1):
+    """
+    Agrégats triés par moyenne décroissante, puis par nombre d'avis.
+    ``semaine`` (date du lundi) restreint le classement à une semaine.
+    """
+    nombre, somme = ('nombre_approuves', 'somme_approuves') if approuves else ('nombre', 'somme')
+    if semaine:
+        queryset = NoteHebdoPlat.objects.filter(semaine=semaine)
+    else:
+        queryset = NotePlat.objects.all()
+    return (
+        queryset.select_related('plat')
+        .filter(**{f'{nombre}__gte': max(min_avis, 1)})
+        .annotate(moyenne_classement=Cast(somme, FloatField()) / F(nombre))
+        .order_by('-moyenne_classement', f'-{nombre}', 'plat_id')
+    )
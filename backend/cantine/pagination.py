@@ -0,0 +1,110 @@
+"""
+Pagination par curseur (keyset) des listes de la cantine.
+
+Le curseur encode la position dans l'ordre de tri au lieu d'un décalage :
+chaque page est une recherche par index, quel que soit le volume de la table.
+"""
+import base64
+import heapq
+from datetime import datetime
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import NotificationDiffusee
+
+
+class PaginationCurseur(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+
+
+class PaginationReservations(PaginationCurseur):
+    ordering = ('-date_reservation', '-id')
+
+
+class PaginationAvis(PaginationCurseur):
+    ordering = ('-date_publication', '-id')
+
+
+class PaginationNotifications(PaginationCurseur):
+    """
+    Pagination du flux fusionné notifications personnelles + diffusées.
+
+    Les deux sources sont triées par (date_envoi, id exposé) décroissants,
+    l'id exposé d'une diffusion étant négatif. Le curseur contient la clé du
+    dernier élément renvoyé ; chaque source est filtrée après cette clé et
+    limitée à la taille de page avant la fusion. Seul le sens « suivant »
+    est proposé, comme un fil d'actualité.
+    """
+    ordering = ('-date_envoi', '-id')
+
+    def encoder_curseur(self, date_envoi, identifiant):
+        brut = f"{date_envoi.isoformat()}|{identifiant}"
+        return base64.urlsafe_b64encode(brut.encode()).decode()
+
+    def decoder_curseur(self, request):
+        encode = request.query_params.get(self.cursor_query_param)
+        if not encode:
+            return None
+        try:
+            date_envoi, identifiant = base64.urlsafe_b64decode(encode.encode()).decode().split('|')
+            return datetime.fromisoformat(date_envoi), int(identifiant)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginer_flux(self, personnelles, diffusees, request):
+        """Retourne la page courante du flux, une liste de Notification / NotificationDiffusee."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        curseur = self.decoder_curseur(request)
+        if curseur:
+            date_envoi, identifiant = curseur
+            personnelles = personnelles.filter(
+                Q(date_envoi__lt=date_envoi) | Q(date_envoi=date_envoi, id__lt=identifiant)
+            )
+            diffusees = diffusees.filter(
+                Q(date_envoi__lt=date_envoi) | Q(date_envoi=date_envoi, id__gt=-identifiant)
+            )
+        personnelles = personnelles.order_by('-date_envoi', '-id')[:self.page_size + 1]
+        diffusees = diffusees.order_by('-date_envoi', 'id')[:self.page_size + 1]
+
+        flux = list(heapq.merge(
+            personnelles, diffusees,
+            key=lambda n: (n.date_envoi, self.identifiant_expose(n)),
+            reverse=True,
+        ))
+        self.has_next = len(flux) > self.page_size
+        self.page = flux[:self.page_size]
+        return self.page
+
+    @staticmethod
+    def identifiant_expose(notification):
+        if isinstance(notification, NotificationDiffusee):
+            return -notification.id
+        return notification.id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        dernier = self.page[-1]
+        curseur = self.encoder_curseur(dernier.date_envoi, self.identifiant_expose(dernier))
+        return replace_query_param(self.base_url, self.cursor_query_param, parse.quote(curseur, safe='='))
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
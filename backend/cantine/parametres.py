@@ -0,0 +1,127 @@
+"""
+Registre des paramètres de l'application.
+
+Chaque paramètre est déclaré dans DEFINITIONS avec son type, sa valeur par
+défaut et sa description. Toutes les lignes ``Parametre`` sont lues en une
+requête dans un instantané local au processus, déjà converti dans les bons
+types : ``valeur('duree_expiration_reservation')`` ne fait aucune requête
+SQL dans le cas courant.
+
+Une modification d'un paramètre change un numéro de version dans le cache
+partagé (comme cantine.cache_menu). Chaque processus compare sa version au
+plus une fois par INTERVALLE_VERIFICATION et recharge son instantané si elle
+a changé ; le processus qui a fait la modification le recharge aussitôt.
+Sans cache partagé, la version expire au bout de
+cache_menu.DUREE_VERSION_LOCALE secondes : l'instantané des autres processus
+a donc au plus cet âge (plus INTERVALLE_VERIFICATION).
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.db import transaction
+
+from . import cache_menu
+
+logger = logging.getLogger(__name__)
+
+VERSION_PARAMETRES = 'parametres:version'
+INTERVALLE_VERIFICATION = 2.0  # secondes entre deux lectures de la version
+
+
+def _liste(texte):
+    return [element.strip() for element in texte.split(',') if element.strip()]
+
+
+def _entier_positif(texte):
+    valeur = int(texte)
+    if valeur <= 0:
+        raise ValueError(texte)
+    return valeur
+
+
+Definition = namedtuple('Definition', 'convertir defaut description')
+
+DEFINITIONS = {
+    'duree_expiration_reservation': Definition(
+        _entier_positif, '6', "Durée en heures avant expiration des réservations",
+    ),
+    'types_plats': Definition(
+        _liste, 'standard,vip,vegetarien,sans_gluten', "Types de plats autorisés",
+    ),
+}
+
+Instantane = namedtuple('Instantane', 'version valeurs verifie_a')
+
+_instantane = None
+_verrou = threading.Lock()
+
+
+def convertir(nom, texte):
+    """Convertit la valeur texte d'un paramètre déclaré ; lève ValueError si elle est invalide."""
+    definition = DEFINITIONS.get(nom)
+    if definition is None:
+        return texte
+    try:
+        return definition.convertir(texte)
+    except ValueError:
+        raise ValueError(f"Valeur invalide pour {nom} : {texte!r}")
+
+
+def _charger(version):
+    from .models import Parametre
+
+    valeurs = {nom: definition.convertir(definition.defaut) for nom, definition in DEFINITIONS.items()}
+    for nom, texte in Parametre.objects.values_list('nom_parametre', 'valeur'):
+        try:
+            valeurs[nom] = convertir(nom, texte)
+        except ValueError:
+            logger.warning("Paramètre %s invalide (%r), valeur par défaut utilisée", nom, texte)
+    return Instantane(version, valeurs, time.monotonic())
+
+
+def instantane():
+    """Retourne les valeurs typées de tous les paramètres."""
+    global _instantane
+    courant = _instantane
+    if courant is not None and time.monotonic() - courant.verifie_a < INTERVALLE_VERIFICATION:
+        return courant.valeurs
+
+    version = cache_menu.versions(VERSION_PARAMETRES)[VERSION_PARAMETRES]
+    with _verrou:
+        courant = _instantane
+        if courant is not None and courant.version == version:
+            _instantane = courant._replace(verifie_a=time.monotonic())
+        else:
+            _instantane = _charger(version)
+        return _instantane.valeurs
+
+
+def valeur(nom):
+    return instantane()[nom]
+
+
+def invalider():
+    """Signale une modification des paramètres, une fois la transaction validée."""
+    def changer():
+        global _instantane
+        _instantane = None
+    cache_menu.invalider(VERSION_PARAMETRES)
+    transaction.on_commit(changer)
+
+
+def creer_defauts():
+    """Crée les paramètres déclarés absents de la base, en deux requêtes."""
+    from .models import Parametre
+
+    existants = set(Parametre.objects.values_list('nom_parametre', flat=True))
+    manquants = [
+        Parametre(nom_parametre=nom, valeur=definition.defaut, description=definition.description)
+        for nom, definition in DEFINITIONS.items()
+        if nom not in existants
+    ]
+    if manquants:
+        Parametre.objects.bulk_create(manquants, ignore_conflicts=True)
+        invalider()
+    return len(manquants)
@@ -0,0 +1,105 @@
+"""
+Programmation des emplois du temps par semaines entières.
+
+Un plan (liste de créneaux ``jour``, ``creneau``, ``plat_id``) est appliqué
+à une ou plusieurs semaines consécutives. La validation se fait en deux
+requêtes : l'existence des plats, puis les créneaux déjà occupés
+(``unique_together ('jour', 'creneau', 'date')``). L'insertion passe par
+``bulk_create`` dans une seule transaction.
+
+``bulk_create`` ne déclenche pas les signaux de EmploiDuTemps : la diffusion
+« emploi du temps disponible » et l'invalidation du cache des menus sont
+faites ici, une fois par semaine programmée.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from . import cache_menu, prevision
+from .models import EmploiDuTemps, Plat, diffuser_semaine_disponible, semaine_complete
+
+logger = logging.getLogger(__name__)
+
+QUANTITE_PAR_DEFAUT = EmploiDuTemps._meta.get_field('quantite_disponible').default
+
+
+def plan_de_semaine(lundi):
+    """Plan d'une semaine existante, pour la recopier."""
+    return [
+        {'jour': jour, 'creneau': creneau, 'plat_id': plat_id}
+        for plat_id, jour, creneau in (
+            EmploiDuTemps.objects.filter(date__range=cache_menu.bornes_semaine(lundi))
+            .order_by('date', 'creneau')
+            .values_list('plat_id', 'jour', 'creneau')
+        )
+    ]
+
+
+def programmer_semaines(lundi, plan, nombre_semaines=1, avec_prevision=False):
+    """
+    Crée les créneaux de ``plan`` pour ``nombre_semaines`` semaines à partir
+    du ``lundi``. La quantité d'un créneau est, par ordre de priorité, celle
+    du plan, la capacité suggérée par cantine.prevision si ``avec_prevision``,
+    ou la valeur par défaut du modèle.
+
+    Lève ValidationError si un plat est inconnu ou si un créneau est déjà
+    programmé. Retourne les emplois du temps créés.
+    """
+    lundis = [lundi + timedelta(weeks=k) for k in range(nombre_semaines)]
+    debut, fin = lundis[0], lundis[-1] + timedelta(days=6)
+
+    plats = set(Plat.objects.filter(pk__in={c['plat_id'] for c in plan}).values_list('id', flat=True))
+    inconnus = sorted({c['plat_id'] for c in plan} - plats)
+    if inconnus:
+        raise ValidationError({'creneaux': [f"Plat(s) introuvable(s) : {', '.join(map(str, inconnus))}."]})
+
+    existants = set(
+        EmploiDuTemps.objects.filter(date__range=(debut, fin)).values_list('date', 'jour', 'creneau')
+    )
+
+    quantites = {}
+    if avec_prevision:
+        a_prevoir = [(c['plat_id'], c['jour'], c['creneau']) for c in plan if c.get('quantite_disponible') is None]
+        for suggestion in prevision.suggerer(a_prevoir, lundi):
+            quantites[(suggestion.plat_id, suggestion.jour, suggestion.creneau)] = suggestion.capacite
+
+    emplois = []
+    for semaine in lundis:
+        for c in plan:
+            quantite = c.get('quantite_disponible')
+            if quantite is None:
+                quantite = quantites.get((c['plat_id'], c['jour'], c['creneau']), QUANTITE_PAR_DEFAUT)
+            emplois.append(EmploiDuTemps(
+                plat_id=c['plat_id'], jour=c['jour'], creneau=c['creneau'],
+                date=prevision.date_du_jour(semaine, c['jour']), quantite_disponible=quantite,
+                capacite=quantite,
+            ))
+
+    conflits = [e for e in emplois if (e.date, e.jour, e.creneau) in existants]
+    if conflits:
+        raise ValidationError({'creneaux': [
+            f"Créneau déjà programmé : {e.jour} {e.creneau} {e.date}." for e in conflits
+        ]})
+
+    try:
+        with transaction.atomic():
+            emplois = EmploiDuTemps.objects.bulk_create(emplois, batch_size=500)
+
+            programmes = {}
+            for date, jour, creneau in existants:
+                programmes.setdefault(date - timedelta(days=date.weekday()), set()).add((jour, creneau))
+            for e in emplois:
+                programmes.setdefault(e.date - timedelta(days=e.date.weekday()), set()).add((e.jour, e.creneau))
+            for semaine in lundis:
+                if semaine_complete(programmes.get(semaine, set())):
+                    diffuser_semaine_disponible(semaine)
+
+            cache_menu.invalider(cache_menu.VERSION_EMPLOIS, *cache_menu.semaines_concernees(*lundis))
+    except IntegrityError:
+        # Créneau programmé entre la validation et l'insertion
+        raise ValidationError({'creneaux': ["Un créneau de ce plan vient d'être programmé, réessayez."]})
+
+    logger.info("%d créneau(x) programmé(s) à partir de la semaine %s", len(emplois), cache_menu.semaine_iso(lundi))
+    return emplois
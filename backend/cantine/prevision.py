@@ -0,0 +1,203 @@
+"""
+Prévision de la demande par créneau, pour dimensionner ``quantite_disponible``.
+
+L'historique est lu en une requête groupée : une ligne par emploi du temps
+passé avec la quantité réservée. Le modèle est une moyenne saisonnière
+pondérée, calculée à trois niveaux de détail :
+
+- le plat sur ce jour et ce créneau ;
+- le type de plat sur ce jour et ce créneau ;
+- le jour et le créneau, tous plats confondus.
+
+Les semaines récentes pèsent davantage (demi-vie réglable). Un niveau peu
+observé est rapproché du niveau supérieur (crédibilité ``n / (n + k)``), ce
+qui donne une prévision raisonnable pour un plat nouveau ou rare. La capacité
+suggérée ajoute une marge proportionnelle à l'écart type observé.
+
+L'entraînement est linéaire en nombre de créneaux (quelques milliers de
+lignes pour plusieurs années), en Python pur sans dépendance supplémentaire.
+"""
+import math
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import EmploiDuTemps, Plat
+
+# Statuts qui occupent une place
+STATUTS_DEMANDE = ('en_attente', 'accepte')
+# Un créneau complet a refusé de la demande : la quantité observée est un minimum
+MAJORATION_RUPTURE = 1.2
+DEMI_VIE_SEMAINES = 26
+# Poids (en observations) accordé au niveau supérieur
+CREDIBILITE = 4
+CAPACITE_PAR_DEFAUT = EmploiDuTemps._meta.get_field('quantite_disponible').default
+CAPACITE_MIN = 5
+CAPACITE_MAX = 500
+# Marge maximale demandée, en écarts types
+NIVEAU_SERVICE_MAX = 5
+JOURS = [jour for jour, _ in EmploiDuTemps.JOUR_CHOICES]
+
+Observation = namedtuple('Observation', 'date plat_id type_plat jour creneau demande rupture')
+Prevision = namedtuple('Prevision', 'plat_id jour creneau demande ecart_type capacite niveau observations')
+
+
+def lire_niveau_service(valeur):
+    """Convertit ``valeur`` en niveau de service entre 0 et NIVEAU_SERVICE_MAX."""
+    try:
+        niveau_service = float(valeur)
+    except (TypeError, ValueError):
+        niveau_service = math.nan
+    # float() accepte 'nan' et 'inf', que math.ceil refuse
+    if not math.isfinite(niveau_service) or not 0 <= niveau_service <= NIVEAU_SERVICE_MAX:
+        raise ValidationError({'niveau_service': [f"Nombre entre 0 et {NIVEAU_SERVICE_MAX} attendu."]})
+    return niveau_service
+
+
+def historique(avant, semaines=156):
+    """
+    Demande observée sur les créneaux des ``semaines`` précédant ``avant``,
+    en une requête groupée par emploi du temps.
+    """
+    lignes = (
+        EmploiDuTemps.objects
+        .filter(date__gte=avant - timedelta(weeks=semaines), date__lt=avant)
+        .values('date', 'plat_id', 'plat__type_plat', 'jour', 'creneau', 'quantite_disponible')
+        .annotate(demande=Coalesce(
+            Sum('reservation__quantite', filter=Q(reservation__statut__in=STATUTS_DEMANDE)), 0
+        ))
+        .order_by()
+    )
+    return [
+        Observation(
+            ligne['date'], ligne['plat_id'], ligne['plat__type_plat'], ligne['jour'],
+            ligne['creneau'], ligne['demande'], ligne['quantite_disponible'] == 0,
+        )
+        for ligne in lignes
+    ]
+
+
+class _Moments:
+    """Somme des poids, moyenne et variance pondérées (algorithme de West)."""
+    __slots__ = ('poids', 'moyenne', 's')
+
+    def __init__(self):
+        self.poids = 0.0
+        self.moyenne = 0.0
+        self.s = 0.0
+
+    def ajouter(self, valeur, poids):
+        self.poids += poids
+        ecart = valeur - self.moyenne
+        self.moyenne += poids / self.poids * ecart
+        self.s += poids * ecart * (valeur - self.moyenne)
+
+    @property
+    def variance(self):
+        return self.s / self.poids if self.poids else 0.0
+
+
+class ModelePrevision:
+    """
+    Moyennes saisonnières pondérées par (plat, jour, créneau),
+    (type de plat, jour, créneau) et (jour, créneau).
+    """
+
+    def __init__(self, demi_vie=DEMI_VIE_SEMAINES, credibilite=CREDIBILITE):
+        self.demi_vie = demi_vie
+        self.credibilite = credibilite
+        self.niveaux = {'plat': defaultdict(_Moments), 'type': defaultdict(_Moments), 'creneau': defaultdict(_Moments)}
+        self.effectifs = {'plat': defaultdict(int), 'type': defaultdict(int), 'creneau': defaultdict(int)}
+
+    def entrainer(self, observations, reference):
+        """``reference`` : date à partir de laquelle l'âge des observations est compté."""
+        for obs in observations:
+            age = (reference - obs.date).days / 7
+            poids = 0.5 ** (age / self.demi_vie)
+            demande = obs.demande * MAJORATION_RUPTURE if obs.rupture else obs.demande
+            for niveau, cle in self._cles(obs.plat_id, obs.type_plat, obs.jour, obs.creneau):
+                self.niveaux[niveau][cle].ajouter(demande, poids)
+                self.effectifs[niveau][cle] += 1
+        return self
+
+    @staticmethod
+    def _cles(plat_id, type_plat, jour, creneau):
+        return (
+            ('creneau', (jour, creneau)),
+            ('type', (type_plat, jour, creneau)),
+            ('plat', (plat_id, jour, creneau)),
+        )
+
+    def prevoir(self, plat_id, type_plat, jour, creneau, niveau_service=1.0):
+        """
+        Demande attendue et capacité suggérée : ``demande + niveau_service ×
+        écart type``, bornée à [CAPACITE_MIN, CAPACITE_MAX].
+        """
+        moyenne, variance, niveau_retenu, observations = None, 0.0, 'defaut', 0
+        for niveau, cle in self._cles(plat_id, type_plat, jour, creneau):
+            n = self.effectifs[niveau].get(cle, 0)
+            if not n:
+                continue
+            moments = self.niveaux[niveau][cle]
+            if moyenne is None:
+                moyenne, variance = moments.moyenne, moments.variance
+            else:
+                # Rapprochement du niveau plus général, d'autant moins que n est grand
+                z = n / (n + self.credibilite)
+                moyenne = z * moments.moyenne + (1 - z) * moyenne
+                variance = z * moments.variance + (1 - z) * variance
+            niveau_retenu, observations = niveau, n
+
+        if moyenne is None:
+            return Prevision(plat_id, jour, creneau, None, None, CAPACITE_PAR_DEFAUT, 'defaut', 0)
+
+        ecart_type = math.sqrt(variance)
+        capacite = math.ceil(moyenne + niveau_service * ecart_type)
+        return Prevision(
+            plat_id, jour, creneau, round(moyenne, 1), round(ecart_type, 1),
+            min(max(capacite, CAPACITE_MIN), CAPACITE_MAX), niveau_retenu, observations,
+        )
+
+
+def entrainer(avant, semaines=156):
+    """Modèle entraîné sur l'historique précédant la date ``avant``."""
+    return ModelePrevision().entrainer(historique(avant, semaines), avant)
+
+
+def suggerer(creneaux, lundi, niveau_service=1.0, modele=None):
+    """
+    Capacités suggérées pour les ``creneaux`` de la semaine commençant le
+    ``lundi``. ``creneaux`` est une liste de ``(plat_id, jour, creneau)``.
+    """
+    modele = modele or entrainer(lundi)
+    types = dict(
+        Plat.objects.filter(pk__in={plat_id for plat_id, _, _ in creneaux})
+        .values_list('id', 'type_plat')
+    )
+    return [
+        modele.prevoir(plat_id, types.get(plat_id), jour, creneau, niveau_service)
+        for plat_id, jour, creneau in creneaux
+    ]
+
+
+def date_du_jour(lundi, jour):
+    return lundi + timedelta(days=JOURS.index(jour))
+
+
+def creneaux_de_semaine(lundi):
+    """
+    Créneaux ``(plat_id, jour, creneau)`` programmés la semaine du ``lundi`` ;
+    à défaut, ceux de la semaine précédente.
+    """
+    for debut in (lundi, lundi - timedelta(weeks=1)):
+        creneaux = list(
+            EmploiDuTemps.objects.filter(date__range=(debut, debut + timedelta(days=6)))
+            .order_by('date', 'creneau')
+            .values_list('plat_id', 'jour', 'creneau')
+        )
+        if creneaux:
+            return creneaux
+    return []
@@ -0,0 +1,209 @@
+"""
+Profilage à la demande d'une requête réelle, pour le personnel.
+
+Un membre du personnel obtient un jeton signé (``/api/profilage/jeton/``,
+valable DUREE_JETON secondes) et le joint à la requête à examiner, dans
+l'en-tête ``X-Profilage`` seulement : un paramètre d'URL finirait dans les
+journaux d'accès, l'historique et le profil enregistré. Pour cette requête
+seulement, ProfilageMiddleware :
+
+- échantillonne la pile du thread de la requête toutes les INTERVALLE
+  secondes depuis un thread à part, pour construire l'arbre d'appels ;
+- enregistre chaque requête SQL (début, durée, texte) par un wrapper
+  d'exécution ;
+- note les récepteurs de signaux exécutés (voir cantine.metriques.recepteur).
+
+Le profil est enregistré dans ProfilRequete, qui ne garde que les
+PROFILS_MAX derniers (tampon circulaire), et se consulte dans l'admin ;
+son identifiant est renvoyé dans l'en-tête ``X-Profil``. Sans jeton, le
+middleware ne fait que tester la présence de l'en-tête.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.core import signing
+from django.db import connection
+
+from . import metriques
+
+logger = logging.getLogger(__name__)
+
+SEL = 'cantine.profilage'
+ENTETE = 'HTTP_X_PROFILAGE'
+# Ancien paramètre d'URL du jeton : ignoré, et retiré du chemin enregistré
+PARAMETRE = 'profilage'
+DUREE_JETON = 3600
+INTERVALLE = 0.002
+PROFILS_MAX = 50
+REQUETES_SQL_MAX = 1000
+# Nœuds de l'arbre sous cette part des échantillons regroupés dans leur parent
+PART_MIN = 0.005
+
+
+def jeton(utilisateur):
+    return signing.dumps({'demandeur': utilisateur.pk}, salt=SEL)
+
+
+def demandeur(valeur):
+    """Identifiant du membre du personnel ayant émis ``valeur``, ou None si le jeton est invalide."""
+    try:
+        return signing.loads(valeur, salt=SEL, max_age=DUREE_JETON)['demandeur']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+class Echantillonneur(threading.Thread):
+    """Relève la pile d'un autre thread à intervalle fixe."""
+
+    def __init__(self, cible, intervalle=INTERVALLE):
+        super().__init__(name='profilage', daemon=True)
+        self.cible = cible
+        self.intervalle = intervalle
+        self.arret = threading.Event()
+        self.piles = Counter()
+
+    def run(self):
+        while not self.arret.wait(self.intervalle):
+            frame = sys._current_frames().get(self.cible)
+            pile = []
+            while frame is not None:
+                code = frame.f_code
+                pile.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if pile:
+                self.piles[tuple(reversed(pile))] += 1
+
+    def arreter(self):
+        self.arret.set()
+        self.join()
+
+
+def arbre(piles, racine):
+    """
+    Arbre d'appels ``{nom, fichier, n, enfants}`` à partir des piles
+    relevées, en partant de l'appel ``racine`` (code du middleware).
+    """
+    total = {'nom': 'requête', 'fichier': '', 'n': 0, 'enfants': {}}
+    for pile, n in piles.items():
+        # Ne garder que ce qui est appelé sous le middleware
+        for i, (nom, fichier, ligne) in enumerate(pile):
+            if (fichier, ligne) == racine:
+                pile = pile[i + 1:]
+                break
+        else:
+            continue
+        # Relevés pris pendant l'arrêt de l'échantillonneur
+        if not pile or pile[0][1] == __file__:
+            continue
+        total['n'] += n
+        noeud = total
+        for nom, fichier, ligne in pile:
+            cle = (nom, fichier, ligne)
+            enfant = noeud['enfants'].get(cle)
+            if enfant is None:
+                enfant = noeud['enfants'][cle] = {'nom': nom, 'fichier': f"{fichier}:{ligne}", 'n': 0, 'enfants': {}}
+            enfant['n'] += n
+            noeud = enfant
+
+    seuil = max(1, total['n'] * PART_MIN)
+
+    def elaguer(noeud):
+        enfants = sorted(noeud['enfants'].values(), key=lambda e: -e['n'])
+        noeud['enfants'] = [elaguer(e) for e in enfants if e['n'] >= seuil]
+        return noeud
+    return elaguer(total)
+
+
+class JournalSQL:
+    """Wrapper d'exécution notant le début, la durée et le texte de chaque requête SQL."""
+
+    def __init__(self, origine):
+        self.origine = origine
+        self.requetes = []
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duree = time.perf_counter() - debut
+            self.nombre += 1
+            self.duree += duree
+            if len(self.requetes) < REQUETES_SQL_MAX:
+                self.requetes.append({
+                    'debut': round((debut - self.origine) * 1000, 3),
+                    'duree': round(duree * 1000, 3),
+                    'sql': sql[:2000],
+                    'many': many,
+                })
+
+
+def chemin(request):
+    """Chemin et paramètres de la requête, sans un éventuel jeton en paramètre."""
+    parametres = request.GET.copy()
+    parametres.pop(PARAMETRE, None)
+    return f"{request.path}?{parametres.urlencode()}" if parametres else request.path
+
+
+class ProfilageMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        valeur = request.META.get(ENTETE)
+        if valeur is None:
+            return self.get_response(request)
+        demandeur_id = demandeur(valeur)
+        if demandeur_id is None:
+            logger.warning("Jeton de profilage invalide ou expiré pour %s", request.path)
+            return self.get_response(request)
+        return self.profiler(request, demandeur_id)
+
+    def profiler(self, request, demandeur_id):
+        from .models import ProfilRequete
+
+        debut = time.perf_counter()
+        echantillonneur = Echantillonneur(threading.get_ident())
+        journal_sql = JournalSQL(debut)
+        metriques.courant.signaux = signaux = []
+        echantillonneur.start()
+        try:
+            with connection.execute_wrapper(journal_sql):
+                response = self.get_response(request)
+        finally:
+            echantillonneur.arreter()
+            metriques.courant.signaux = None
+        duree = time.perf_counter() - debut
+
+        correspondance = getattr(request, 'resolver_match', None)
+        try:
+            profil = ProfilRequete.objects.create(
+                demandeur_id=demandeur_id,
+                methode=request.method,
+                chemin=chemin(request)[:500],
+                vue=correspondance.view_name if correspondance else '',
+                statut=response.status_code,
+                duree=duree,
+                echantillons=sum(echantillonneur.piles.values()),
+                nombre_requetes_sql=journal_sql.nombre,
+                duree_sql=journal_sql.duree,
+                arbre=arbre(echantillonneur.piles, (self.profiler.__code__.co_filename, self.profiler.__code__.co_firstlineno)),
+                sql=journal_sql.requetes,
+                signaux=[
+                    {'recepteur': nom, 'sender': sender, 'debut': round((t - debut) * 1000, 3), 'duree': round(d * 1000, 3)}
+                    for nom, sender, t, d in signaux
+                ],
+            )
+            # Tampon circulaire : ne garder que les PROFILS_MAX derniers
+            seuil = ProfilRequete.objects.order_by('-id').values_list('id', flat=True)[PROFILS_MAX:PROFILS_MAX + 1].first()
+            if seuil is not None:
+                ProfilRequete.objects.filter(id__lte=seuil).delete()
+            response['X-Profil'] = str(profil.pk)
+        except Exception:
+            logger.exception("Impossible d'enregistrer le profil de %s", request.path)
+        return response
@@ -1,8 +1,12 @@
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
-from .models import Plat, Reservation, EmploiDuTemps, Avis, Notification, Parametre
+from .models import Plat, Reservation, EmploiDuTemps, Avis, Notification, NotificationDiffusee, Parametre, NotePlat
+from . import expiration, parametres, statistiques
 from rest_framework.fields import IntegerField
 
 User = get_user_model()
@@ -57,11 +61,49 @@ class UserInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'email', 'is_staff', 'first_name', 'last_name', 'institut']
 
 class PlatSerializer(serializers.ModelSerializer):
+    # Moyenne des avis approuvés, lue dans l'agrégat NotePlat (select_related('notes'))
+    note_moyenne = serializers.SerializerMethodField()
+    nombre_avis = serializers.SerializerMethodField()
+
     class Meta:
         model = Plat
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
 
+    def _notes(self, obj):
+        try:
+            return obj.notes
+        except NotePlat.DoesNotExist:
+            return None
+
+    def get_note_moyenne(self, obj):
+        notes = self._notes(obj)
+        return notes.moyenne_approuves if notes else None
+
+    def get_nombre_avis(self, obj):
+        notes = self._notes(obj)
+        return notes.nombre_approuves if notes else 0
+
+class NotePlatSerializer(serializers.Serializer):
+    """Ligne du classement des plats (agrégat NotePlat ou NoteHebdoPlat)."""
+    plat_id = serializers.IntegerField()
+    nom_plat = serializers.CharField(source='plat.nom_plat')
+    nombre = serializers.SerializerMethodField()
+    moyenne = serializers.SerializerMethodField()
+    histogramme = serializers.SerializerMethodField()
+
+    def _approuves(self):
+        return self.context.get('approuves', True)
+
+    def get_nombre(self, obj):
+        return obj.nombre_approuves if self._approuves() else obj.nombre
+
+    def get_moyenne(self, obj):
+        return obj.moyenne_approuves if self._approuves() else obj.moyenne
+
+    def get_histogramme(self, obj):
+        return obj.histogramme(approuves=self._approuves())
+
 class EmploiDuTempsSerializer(serializers.ModelSerializer):
     plat = PlatSerializer(read_only=True)
     plat_id = serializers.PrimaryKeyRelatedField(
@@ -89,12 +131,103 @@ class ReservationSerializer(serializers.ModelSerializer):
         write_only=True
     )
     etudiant = UserSerializer(read_only=True)
+    statut = serializers.SerializerMethodField()
 
     class Meta:
         model = Reservation
         fields = '__all__'
         read_only_fields = ('total_prix', 'date_reservation', 'statut', 'created_at', 'updated_at')
 
+    def get_statut(self, obj):
+        return expiration.statut_de(obj)
+
+class EmploiDuTempsCompactSerializer(serializers.ModelSerializer):
+    """Emploi du temps sans le plat imbriqué (déjà présent dans la réservation)."""
+    class Meta:
+        model = EmploiDuTemps
+        fields = ('id', 'plat', 'jour', 'creneau', 'date', 'quantite_disponible')
+        read_only_fields = fields
+
+class ReservationListSerializer(serializers.ModelSerializer):
+    """
+    Représentation allégée pour les listes de réservations : le plat n'est
+    sérialisé qu'une fois par ligne et l'étudiant sans les champs d'écriture.
+    """
+    plat = PlatSerializer(read_only=True)
+    emploi_du_temps = EmploiDuTempsCompactSerializer(read_only=True)
+    etudiant = UserInfoSerializer(read_only=True)
+    statut = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Reservation
+        fields = (
+            'id', 'plat', 'emploi_du_temps', 'etudiant', 'quantite', 'supplements',
+            'total_prix', 'date_reservation', 'statut', 'created_at', 'updated_at'
+        )
+        read_only_fields = fields
+
+    def get_statut(self, obj):
+        return expiration.statut_de(obj)
+
+class ReservationLotItemSerializer(serializers.Serializer):
+    """Élément d'une réservation groupée ; le plat est celui de l'emploi du temps."""
+    emploi_du_temps_id = serializers.IntegerField()
+    quantite = serializers.IntegerField(min_value=1, default=1)
+    supplements = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+
+class CreneauPlanSerializer(serializers.Serializer):
+    """Créneau d'un plan de semaine ; les plats sont vérifiés ensemble par cantine.planification."""
+    jour = serializers.ChoiceField(choices=EmploiDuTemps.JOUR_CHOICES)
+    creneau = serializers.ChoiceField(choices=EmploiDuTemps.CRENEAU_CHOICES)
+    plat_id = serializers.IntegerField()
+    quantite_disponible = serializers.IntegerField(min_value=0, required=False)
+
+class ProgrammationSemaineSerializer(serializers.Serializer):
+    """
+    Programmation d'une ou plusieurs semaines : soit un plan explicite
+    (``creneaux``), soit la copie d'une semaine existante (``copier_depuis``).
+    """
+    semaine = serializers.RegexField(r'^\d{4}-W\d{2}$')
+    nombre_semaines = serializers.IntegerField(min_value=1, max_value=26, default=1)
+    creneaux = CreneauPlanSerializer(many=True, required=False)
+    copier_depuis = serializers.RegexField(r'^\d{4}-W\d{2}$', required=False)
+    prevision = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if ('creneaux' in data) == ('copier_depuis' in data):
+            raise serializers.ValidationError("Fournir soit 'creneaux', soit 'copier_depuis'.")
+        cles = [(c['jour'], c['creneau']) for c in data.get('creneaux', [])]
+        if len(cles) != len(set(cles)):
+            raise serializers.ValidationError({'creneaux': ["Un même créneau apparaît plusieurs fois."]})
+        return data
+
+class RapportStatistiquesSerializer(serializers.Serializer):
+    """Paramètres d'un rapport de statistiques (voir cantine.statistiques.rapport)."""
+    debut = serializers.DateField(required=False)
+    fin = serializers.DateField(required=False)
+    grouper = serializers.ChoiceField(choices=list(statistiques.DIMENSIONS), default='jour')
+    plat = serializers.IntegerField(required=False)
+    type_plat = serializers.ChoiceField(choices=Plat.TYPE_CHOICES, required=False)
+    institut = serializers.CharField(required=False)
+    creneau = serializers.ChoiceField(choices=EmploiDuTemps.CRENEAU_CHOICES, required=False)
+
+    # Au-delà, regrouper par semaine
+    JOURS_MAX = 3660
+
+    def validate(self, data):
+        data.setdefault('fin', timezone.localdate())
+        data.setdefault('debut', data['fin'] - timedelta(days=29))
+        if data['debut'] > data['fin']:
+            raise serializers.ValidationError({'debut': ["La date de début doit précéder la date de fin."]})
+        if (data['fin'] - data['debut']).days > self.JOURS_MAX:
+            raise serializers.ValidationError({'debut': [f"Période limitée à {self.JOURS_MAX} jours."]})
+        return data
+
+class ExtractionReservationsSerializer(serializers.Serializer):
+    """Format de l'extraction des réservations (les filtres sont lus par cantine.filtres)."""
+    sortie = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    gzip = serializers.BooleanField(default=False)
+
 class AvisSerializer(serializers.ModelSerializer):
     etudiant = serializers.StringRelatedField(read_only=True)
     plat = serializers.StringRelatedField(read_only=True)
@@ -123,7 +256,7 @@ class AvisSerializer(serializers.ModelSerializer):
         plat = data.get('plat')
         
         if not Reservation.objects.filter(
-            etudiant=user,
+            etudiant_id=user.pk,
             plat=plat,
             statut='accepte'
         ).exists():
@@ -134,16 +267,59 @@ class AvisSerializer(serializers.ModelSerializer):
         return data
 
 class NotificationSerializer(serializers.ModelSerializer):
+    est_diffusee = serializers.SerializerMethodField()
+
     class Meta:
         model = Notification
         fields = '__all__'
         read_only_fields = ('date_envoi',)
 
+    def get_est_diffusee(self, obj):
+        return False
+
+class NotificationDiffuseeSerializer(serializers.ModelSerializer):
+    """
+    Présente une diffusion comme une notification personnelle.
+
+    L'identifiant est négatif pour ne pas entrer en collision avec ceux des
+    notifications personnelles dans le flux commun.
+    """
+    id = serializers.SerializerMethodField()
+    destinataire = serializers.SerializerMethodField()
+    est_lue = serializers.BooleanField(read_only=True)
+    est_diffusee = serializers.SerializerMethodField()
+
+    class Meta:
+        model = NotificationDiffusee
+        fields = ('id', 'destinataire', 'titre', 'contenu', 'date_envoi', 'est_lue', 'lien', 'est_diffusee')
+        read_only_fields = fields
+
+    def get_id(self, obj):
+        return -obj.id
+
+    def get_destinataire(self, obj):
+        return self.context['request'].user.id
+
+    def get_est_diffusee(self, obj):
+        return True
+
 class ParametreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Parametre
         fields = '__all__'
         read_only_fields = ('date_modification',)
 
+    def validate(self, data):
+        # Les paramètres déclarés doivent rester lisibles par le registre,
+        # y compris quand seul le nom change (renommage vers un nom déclaré)
+        nom = data.get('nom_parametre', getattr(self.instance, 'nom_parametre', None))
+        valeur = data.get('valeur', getattr(self.instance, 'valeur', None))
+        if valeur is not None and ('valeur' in data or 'nom_parametre' in data):
+            try:
+                parametres.convertir(nom, valeur)
+            except ValueError as e:
+                raise serializers.ValidationError({'valeur': [str(e)]})
+        return data
+
 class LogoutSerializer(serializers.Serializer):
     refresh_token = serializers.CharField(required=True)
\ No newline at end of file
@@ -0,0 +1,421 @@
+"""
+Statistiques de fréquentation et de recette des créneaux.
+
+Deux tables de synthèse sont tenues à jour par incréments, dans la
+transaction qui modifie les réservations :
+
+- StatistiqueCreneau : une ligne par (créneau, plat réservé, institut) ;
+- StatistiqueSemaine : une ligne par (lundi, plat réservé, institut).
+
+Chaque ligne compte les réservations et les places par statut, et la recette
+des réservations acceptées. Une création ajoute la contribution de la
+réservation, un changement de statut (cantine.transitions, ``save()``)
+retire l'ancienne et ajoute la nouvelle, une suppression la retire. Les
+variations d'une opération sont regroupées par ligne puis appliquées en un
+INSERT des lignes manquantes et un UPDATE ... CASE par table : accepter tout
+un créneau coûte le même nombre de requêtes qu'une seule réservation.
+
+Les rapports (``rapport``) lisent ces tables et la capacité des créneaux,
+jamais la table des réservations. La commande ``reconstruire_statistiques``
+recalcule l'historique par lots. Le statut est celui écrit en base : une
+réservation échue compte comme expirée après le passage du balayage (voir
+cantine.expiration).
+"""
+import logging
+import operator
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import EmploiDuTemps, Plat, Reservation, StatistiqueCreneau, StatistiqueSemaine
+
+logger = logging.getLogger(__name__)
+
+STATUTS = [statut for statut, _ in Reservation.STATUT_CHOICES]
+CHAMPS = [f'nombre_{statut}' for statut in STATUTS] + [f'quantite_{statut}' for statut in STATUTS] + ['recette']
+CLES = {
+    StatistiqueCreneau: ('emploi_du_temps_id', 'plat_id', 'institut'),
+    StatistiqueSemaine: ('semaine', 'plat_id', 'institut'),
+}
+
+# Contribution d'une réservation : de quoi retrouver ses lignes et ses compteurs
+Etat = namedtuple('Etat', 'emploi_du_temps_id date plat_id institut statut quantite total_prix')
+
+
+def lundi(jour):
+    return jour - timedelta(days=jour.weekday())
+
+
+def etat_en_base(reservation_id):
+    """État enregistré d'une réservation (une requête), ou None."""
+    ligne = Reservation.objects.filter(pk=reservation_id).values_list(
+        'emploi_du_temps_id', 'emploi_du_temps__date', 'plat_id', 'etudiant__institut',
+        'statut', 'quantite', 'total_prix',
+    ).first()
+    return Etat(*ligne) if ligne else None
+
+
+def etat(reservation):
+    """État d'une instance en mémoire (créneau et étudiant déjà chargés en général)."""
+    return Etat(
+        reservation.emploi_du_temps_id, reservation.emploi_du_temps.date, reservation.plat_id,
+        reservation.etudiant.institut, reservation.statut, reservation.quantite, reservation.total_prix,
+    )
+
+
+def compteurs(statut, nombre, quantite, total_prix):
+    champs = Counter({f'nombre_{statut}': nombre, f'quantite_{statut}': quantite})
+    if statut == 'accepte':
+        champs['recette'] = Decimal(total_prix or 0)
+    return champs
+
+
+class Deltas:
+    """Variations des compteurs, regroupées par ligne de synthèse."""
+
+    def __init__(self):
+        self.creneaux = defaultdict(Counter)
+        self.semaines = defaultdict(Counter)
+
+    def ajouter(self, emploi_du_temps_id, date, plat_id, institut, statut, quantite, total_prix,
+                signe=1, nombre=1):
+        champs = compteurs(statut, signe * nombre, signe * quantite, signe * Decimal(total_prix or 0))
+        self.creneaux[(emploi_du_temps_id, plat_id, institut)].update(champs)
+        self.semaines[(lundi(date), plat_id, institut)].update(champs)
+
+    def appliquer(self):
+        with transaction.atomic(savepoint=False):
+            _appliquer(StatistiqueCreneau, self.creneaux)
+            _appliquer(StatistiqueSemaine, self.semaines)
+
+
+def _condition(modele, cle):
+    return Q(**dict(zip(CLES[modele], cle)))
+
+
+def _ajouter(modele, variations):
+    """Mise à jour relative des lignes existantes parmi ``variations`` ; retourne leur nombre."""
+    noms = sorted({champ for champs in variations.values() for champ in champs})
+    return modele.objects.filter(reduce(operator.or_, (_condition(modele, cle) for cle in variations))).update(
+        **{
+            nom: F(nom) + Case(
+                *[When(_condition(modele, cle), then=Value(champs[nom]))
+                  for cle, champs in variations.items() if nom in champs],
+                default=Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2) if nom == 'recette' else IntegerField(),
+            )
+            for nom in noms
+        },
+        updated_at=timezone.now(),
+    )
+
+
+def _appliquer(modele, variations):
+    """
+    Applique ``{clé: variations}`` à ``modele`` en deux requêtes : création
+    à zéro des lignes manquantes (conflits ignorés, sans risque si une autre
+    transaction crée la même ligne), puis mise à jour relative de toutes.
+    """
+    variations = {
+        cle: {champ: n for champ, n in champs.items() if n}
+        for cle, champs in variations.items()
+    }
+    variations = {cle: champs for cle, champs in variations.items() if champs}
+    if not variations:
+        return
+
+    # Une variation négative porte sur une ligne qui existe déjà
+    modele.objects.bulk_create(
+        [
+            modele(**dict(zip(CLES[modele], cle)))
+            for cle, champs in variations.items()
+            if all(n > 0 for n in champs.values())
+        ],
+        ignore_conflicts=True,
+    )
+    if _ajouter(modele, variations) != len(variations):
+        logger.warning("Statistiques %s incomplètes, à reconstruire", modele.__name__)
+
+
+def _creer(modele, lignes):
+    modele.objects.bulk_create(
+        [modele(**dict(zip(CLES[modele], cle)), **champs) for cle, champs in lignes.items()],
+        batch_size=500,
+    )
+
+
+def ajouter_reservations(reservations):
+    """Ajoute des réservations créées sans signaux (``bulk_create``)."""
+    deltas = Deltas()
+    for reservation in reservations:
+        deltas.ajouter(*etat(reservation))
+    deltas.appliquer()
+
+
+def reporter_transitions(transitions, cible):
+    """Reporte des changements de statut appliqués par cantine.transitions."""
+    deltas = Deltas()
+    for t in transitions:
+        deltas.ajouter(t.emploi_du_temps_id, t.date, t.plat_id, t.institut, t.ancien_statut,
+                       t.quantite, t.total_prix, signe=-1)
+        deltas.ajouter(t.emploi_du_temps_id, t.date, t.plat_id, t.institut, cible, t.quantite, t.total_prix)
+    deltas.appliquer()
+
+
+def deplacer_emploi(emploi_id, ancienne_date, nouvelle_date):
+    """
+    Reporte les statistiques d'un créneau de la semaine de ``ancienne_date``
+    sur celle de ``nouvelle_date`` (date modifiée), ou les retire de sa
+    semaine si ``nouvelle_date`` vaut None (créneau supprimé).
+    """
+    if nouvelle_date is not None and lundi(ancienne_date) == lundi(nouvelle_date):
+        return
+    semaines = defaultdict(Counter)
+    for ligne in StatistiqueCreneau.objects.filter(emploi_du_temps_id=emploi_id).values('plat_id', 'institut', *CHAMPS):
+        champs = Counter({champ: ligne[champ] for champ in CHAMPS})
+        semaines[(lundi(ancienne_date), ligne['plat_id'], ligne['institut'])].subtract(champs)
+        if nouvelle_date is not None:
+            semaines[(lundi(nouvelle_date), ligne['plat_id'], ligne['institut'])].update(champs)
+    with transaction.atomic():
+        _appliquer(StatistiqueSemaine, semaines)
+
+
+def deplacer_etudiant(etudiant_id, ancien_institut, nouvel_institut):
+    """Reporte les réservations d'un étudiant changé d'institut, en une requête groupée."""
+    deltas = Deltas()
+    for emploi_id, date, plat_id, statut, nombre, quantite, total_prix in _groupes(
+        Reservation.objects.filter(etudiant_id=etudiant_id), 'emploi_du_temps_id', 'emploi_du_temps__date',
+        'plat_id', 'statut',
+    ):
+        deltas.ajouter(emploi_id, date, plat_id, ancien_institut, statut, quantite, total_prix,
+                       signe=-1, nombre=nombre)
+        deltas.ajouter(emploi_id, date, plat_id, nouvel_institut, statut, quantite, total_prix, nombre=nombre)
+    deltas.appliquer()
+
+
+def _groupes(reservations, *champs):
+    """Nombre, quantité et montant des réservations, groupés par ``champs``."""
+    return (
+        reservations.values_list(*champs)
+        .annotate(nombre=Count('id'), quantite=Sum('quantite'), montant=Sum('total_prix'))
+        .order_by()
+    )
+
+
+# Reconstruction ---------------------------------------------------------
+
+def attendues(emploi_ids):
+    """Recalcule les lignes StatistiqueCreneau des créneaux ``emploi_ids``, en une requête groupée."""
+    lignes = defaultdict(Counter)
+    dates = {}
+    for emploi_id, date, plat_id, institut, statut, nombre, quantite, montant in _groupes(
+        Reservation.objects.filter(emploi_du_temps_id__in=emploi_ids),
+        'emploi_du_temps_id', 'emploi_du_temps__date', 'plat_id', 'etudiant__institut', 'statut',
+    ):
+        lignes[(emploi_id, plat_id, institut)].update(compteurs(statut, nombre, quantite, montant))
+        dates[emploi_id] = date
+    return lignes, dates
+
+
+def _par_semaine(lignes, dates):
+    semaines = defaultdict(Counter)
+    for (emploi_id, plat_id, institut), champs in lignes.items():
+        semaines[(lundi(dates[emploi_id]), plat_id, institut)].update(champs)
+    return semaines
+
+
+def _lots_emplois(depuis, taille_lot):
+    emplois = EmploiDuTemps.objects.order_by('id')
+    if depuis:
+        emplois = emplois.filter(date__gte=depuis)
+    ids = list(emplois.values_list('id', flat=True))
+    for debut in range(0, len(ids), taille_lot):
+        yield ids[debut:debut + taille_lot]
+
+
+def reconstruire(depuis=None, taille_lot=500):
+    """
+    Recalcule les statistiques des créneaux à partir du lundi de ``depuis``
+    (tout l'historique par défaut), par lots de ``taille_lot`` créneaux : une
+    requête groupée et une transaction par lot. Les semaines sont remplacées
+    à la fin. Les réservations modifiées pendant la reconstruction peuvent
+    être mal comptées : relancer avec ``ecarts`` pour vérifier.
+
+    Retourne ``(creneaux, semaines)``, le nombre de lignes écrites.
+    """
+    depuis = lundi(depuis) if depuis else None
+    semaines = defaultdict(Counter)
+    total = 0
+    for lot in _lots_emplois(depuis, taille_lot):
+        lignes, dates = attendues(lot)
+        with transaction.atomic():
+            StatistiqueCreneau.objects.filter(emploi_du_temps_id__in=lot).delete()
+            _creer(StatistiqueCreneau, lignes)
+        for cle, champs in _par_semaine(lignes, dates).items():
+            semaines[cle].update(champs)
+        total += len(lignes)
+
+    with transaction.atomic():
+        anciennes = StatistiqueSemaine.objects.all()
+        if depuis:
+            anciennes = anciennes.filter(semaine__gte=depuis)
+        anciennes.delete()
+        _creer(StatistiqueSemaine, semaines)
+    return total, len(semaines)
+
+
+def ecarts(depuis=None, taille_lot=500):
+    """Compare les statistiques stockées au recalcul, par lots. Retourne ``[(modèle, clé, stocké, attendu)]``."""
+    depuis = lundi(depuis) if depuis else None
+    differences = []
+    semaines = defaultdict(Counter)
+
+    def comparer(modele, attendu, stockees):
+        for cle in attendu.keys() | stockees.keys():
+            valeurs_attendues = {champ: attendu[cle][champ] for champ in CHAMPS} if cle in attendu \
+                else dict.fromkeys(CHAMPS, 0)
+            valeurs_stockees = stockees.get(cle, dict.fromkeys(CHAMPS, 0))
+            if valeurs_attendues != valeurs_stockees:
+                differences.append((modele.__name__, cle, valeurs_stockees, valeurs_attendues))
+
+    def stockees(queryset, modele):
+        return {
+            tuple(ligne.pop(champ) for champ in CLES[modele]): ligne
+            for ligne in queryset.values(*CLES[modele], *CHAMPS)
+        }
+
+    for lot in _lots_emplois(depuis, taille_lot):
+        lignes, dates = attendues(lot)
+        comparer(StatistiqueCreneau, lignes,
+                 stockees(StatistiqueCreneau.objects.filter(emploi_du_temps_id__in=lot), StatistiqueCreneau))
+        for cle, champs in _par_semaine(lignes, dates).items():
+            semaines[cle].update(champs)
+
+    stockees_semaine = StatistiqueSemaine.objects.all()
+    if depuis:
+        stockees_semaine = stockees_semaine.filter(semaine__gte=depuis)
+    comparer(StatistiqueSemaine, semaines, stockees(stockees_semaine, StatistiqueSemaine))
+    return differences
+
+
+# Rapports ---------------------------------------------------------------
+
+# Dimensions de regroupement : champ sur StatistiqueCreneau, sur
+# StatistiqueSemaine (None : lignes par créneau uniquement) et sur
+# EmploiDuTemps pour la capacité (None : capacité non définie)
+DIMENSIONS = {
+    'jour': ('emploi_du_temps__date', None, 'date'),
+    'semaine': ('emploi_du_temps__date', 'semaine', 'date'),  # dates ramenées au lundi
+    'creneau': ('emploi_du_temps__creneau', None, 'creneau'),
+    'emploi_du_temps': ('emploi_du_temps_id', None, 'id'),
+    'plat': ('plat_id', 'plat_id', 'plat_id'),
+    'type_plat': ('plat__type_plat', 'plat__type_plat', 'plat__type_plat'),
+    'institut': ('institut', 'institut', None),
+}
+# Filtres : champ sur les tables de statistiques, puis sur EmploiDuTemps
+FILTRES = {
+    'plat': ('plat_id', 'plat_id'),
+    'type_plat': ('plat__type_plat', 'plat__type_plat'),
+    'institut': ('institut', None),
+    'creneau': ('emploi_du_temps__creneau', 'creneau'),
+}
+
+
+def _taux(numerateur, denominateur):
+    return round(numerateur / denominateur, 4) if denominateur else None
+
+
+def _synthese(champs, capacite):
+    nombre = sum(champs[f'nombre_{statut}'] for statut in STATUTS)
+    places_retenues = champs['quantite_en_attente'] + champs['quantite_accepte']
+    return {
+        'nombre_reservations': nombre,
+        'nombre_par_statut': {statut: champs[f'nombre_{statut}'] for statut in STATUTS},
+        'quantite_par_statut': {statut: champs[f'quantite_{statut}'] for statut in STATUTS},
+        'places_retenues': places_retenues,
+        'capacite': capacite,
+        'recette': str(Decimal(champs['recette']).quantize(Decimal('0.01'))),
+        'taux_occupation': _taux(places_retenues, capacite),
+        'taux_acceptation': _taux(champs['nombre_accepte'], nombre),
+        'taux_refus': _taux(champs['nombre_refuse'], nombre),
+        'taux_expiration': _taux(champs['nombre_expire'], nombre),
+    }
+
+
+def rapport(debut, fin, grouper='jour', filtres=None):
+    """
+    Statistiques des créneaux du ``debut`` au ``fin`` inclus, regroupées
+    selon ``grouper`` (une clé de DIMENSIONS) et restreintes par
+    ``filtres`` (clés de FILTRES).
+
+    Les semaines entières sont lues dans StatistiqueSemaine lorsque le
+    regroupement le permet (une ligne par semaine, plat et institut) ; un
+    regroupement par semaine étend la période aux semaines entières. La
+    capacité, et donc le taux d'occupation, n'est pas définie par institut.
+    """
+    filtres = {nom: valeur for nom, valeur in (filtres or {}).items() if valeur not in (None, '')}
+    champ_creneau, champ_semaine, champ_capacite = DIMENSIONS[grouper]
+    par_semaine = champ_semaine is not None and 'creneau' not in filtres and (
+        grouper == 'semaine' or (debut.weekday() == 0 and fin.weekday() == 6)
+    )
+    if grouper == 'semaine':
+        debut, fin = lundi(debut), lundi(fin) + timedelta(days=6)
+    convertir = lundi if grouper == 'semaine' else (lambda cle: cle)
+
+    if par_semaine:
+        lignes = StatistiqueSemaine.objects.filter(semaine__range=(debut, fin))
+        champ = champ_semaine
+    else:
+        lignes = StatistiqueCreneau.objects.filter(emploi_du_temps__date__range=(debut, fin))
+        champ = champ_creneau
+    for nom, valeur in filtres.items():
+        lignes = lignes.filter(**{FILTRES[nom][0]: valeur})
+
+    totaux = defaultdict(Counter)
+    for cle, *valeurs in lignes.values_list(champ).annotate(*[Sum(nom) for nom in CHAMPS]).order_by():
+        totaux[convertir(cle)].update(dict(zip(CHAMPS, valeurs)))
+
+    # Capacité des créneaux de la période : une ligne par créneau, index sur la date
+    capacites = None
+    if champ_capacite is not None and 'institut' not in filtres:
+        capacites = Counter()
+        emplois = EmploiDuTemps.objects.filter(date__range=(debut, fin))
+        for nom, valeur in filtres.items():
+            emplois = emplois.filter(**{FILTRES[nom][1]: valeur})
+        for cle, capacite in (
+            emplois.values_list(champ_capacite)
+            .annotate(total=Sum(Coalesce('capacite', 'quantite_disponible')))
+            .order_by()
+        ):
+            capacites[convertir(cle)] += capacite
+
+    cles = sorted(totaux.keys() | (capacites or {}).keys(), key=lambda cle: (cle is None, cle))
+    noms_plats = {}
+    if grouper == 'plat':
+        noms_plats = dict(Plat.objects.filter(pk__in=cles).values_list('id', 'nom_plat'))
+
+    resultat = []
+    for cle in cles:
+        ligne = {grouper: cle}
+        if grouper == 'plat':
+            ligne['nom_plat'] = noms_plats.get(cle)
+        ligne.update(_synthese(totaux.get(cle, Counter()), capacites.get(cle, 0) if capacites is not None else None))
+        resultat.append(ligne)
+
+    total = Counter()
+    for champs in totaux.values():
+        total.update(champs)
+    return {
+        'debut': debut,
+        'fin': fin,
+        'grouper': grouper,
+        'source': 'semaines' if par_semaine else 'creneaux',
+        'lignes': resultat,
+        'total': _synthese(total, sum(capacites.values()) if capacites is not None else None),
+    }
@@ -0,0 +1,126 @@
+"""
+Gestion atomique du stock de places des emplois du temps.
+
+Le décrément de ``EmploiDuTemps.quantite_disponible`` se fait par un UPDATE
+conditionnel exécuté par la base : la condition ``quantite_disponible >= n``
+et la soustraction sont évaluées sur la ligne verrouillée, ce qui empêche
+toute survente même quand des centaines de requêtes visent le même créneau.
+"""
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .models import EmploiDuTemps
+from .temps_reel import signaler_places
+
+
+class StockInsuffisant(Exception):
+    """Levée quand le créneau n'a plus assez de places pour la demande."""
+
+    def __init__(self, emploi_id, quantite_demandee, quantite_disponible):
+        self.emploi_id = emploi_id
+        self.quantite_demandee = quantite_demandee
+        self.quantite_disponible = quantite_disponible
+        super().__init__(
+            f"Quantité non disponible. Il ne reste que {quantite_disponible} place(s)."
+        )
+
+
+class ConflitStock(Exception):
+    """Le stock a changé pendant une allocation groupée ; la demande peut être rejouée."""
+
+
+def reserver_places(emploi_id, quantite):
+    """
+    Décrémente atomiquement le stock du créneau et retourne le nombre de
+    places restantes.
+
+    À appeler dans un ``transaction.atomic()`` englobant la création de la
+    réservation, afin que le stock soit rendu si l'insertion échoue. L'UPDATE
+    est la première écriture du bloc : sous SQLite le verrou d'écriture est
+    pris immédiatement (et attend ``timeout``) au lieu d'échouer lors d'une
+    promotion de verrou.
+    """
+    mis_a_jour = EmploiDuTemps.objects.filter(
+        pk=emploi_id,
+        quantite_disponible__gte=quantite,
+    ).update(
+        quantite_disponible=F('quantite_disponible') - quantite,
+        updated_at=timezone.now(),
+    )
+    restant = (
+        EmploiDuTemps.objects.filter(pk=emploi_id)
+        .values_list('quantite_disponible', flat=True)
+        .first()
+    )
+    if not mis_a_jour:
+        raise StockInsuffisant(emploi_id, quantite, restant or 0)
+    signaler_places([emploi_id])
+    return restant
+
+
+def reserver_places_lot(quantites):
+    """
+    Réserve en une seule écriture les places de plusieurs créneaux.
+
+    ``quantites`` associe un id d'emploi du temps à la quantité demandée.
+    Les créneaux sont verrouillés (dans l'ordre des clés pour éviter les
+    interblocages), ceux qui ont assez de places sont servis par un unique
+    UPDATE ... CASE, les autres sont laissés intacts. À appeler dans un
+    ``transaction.atomic()``.
+
+    Retourne ``(restants, disponibles)`` : places restantes des créneaux
+    servis, et places disponibles lues avant l'allocation pour tous.
+    """
+    disponibles = dict(
+        EmploiDuTemps.objects.select_for_update()
+        .filter(pk__in=quantites)
+        .order_by('pk')
+        .values_list('id', 'quantite_disponible')
+    )
+    servis = {
+        emploi_id: quantite
+        for emploi_id, quantite in quantites.items()
+        if disponibles.get(emploi_id, 0) >= quantite
+    }
+    if servis:
+        delta = Case(
+            *[When(pk=emploi_id, then=Value(quantite)) for emploi_id, quantite in servis.items()],
+            output_field=PositiveIntegerField(),
+        )
+        # La condition reste dans l'UPDATE : sans verrou de ligne (SQLite),
+        # un écart signale une écriture concurrente et annule la transaction.
+        mis_a_jour = EmploiDuTemps.objects.filter(
+            pk__in=servis, quantite_disponible__gte=delta
+        ).update(
+            quantite_disponible=F('quantite_disponible') - delta,
+            updated_at=timezone.now(),
+        )
+        if mis_a_jour != len(servis):
+            raise ConflitStock()
+        signaler_places(servis)
+    restants = {
+        emploi_id: disponibles[emploi_id] - quantite
+        for emploi_id, quantite in servis.items()
+    }
+    return restants, disponibles
+
+
+def liberer_places(quantites):
+    """
+    Rend au stock les places de réservations sorties de l'état actif.
+
+    ``quantites`` associe un id d'emploi du temps au nombre de places à
+    rendre ; un seul UPDATE ... CASE, dans la transaction de l'appelant.
+    """
+    quantites = {emploi_id: quantite for emploi_id, quantite in quantites.items() if quantite}
+    if not quantites:
+        return
+    delta = Case(
+        *[When(pk=emploi_id, then=Value(quantite)) for emploi_id, quantite in quantites.items()],
+        output_field=PositiveIntegerField(),
+    )
+    EmploiDuTemps.objects.filter(pk__in=quantites).update(
+        quantite_disponible=F('quantite_disponible') + delta,
+        updated_at=timezone.now(),
+    )
+    signaler_places(quantites)
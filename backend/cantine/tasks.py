@@ -1,26 +1,56 @@
+import logging
+
 from celery import shared_task
-from django.utils import timezone
-from datetime import timedelta
-from .models import Reservation, Parametre, Notification
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import DatabaseError
+from . import expiration, export, inscriptions
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def expirer_reservations(taille_lot=expiration.TAILLE_LOT):
+    """
+    Persiste les expirations échues et rend leurs places ; ne parcourt la
+    table que si la prochaine échéance est passée (voir cantine.expiration).
+    """
+    try:
+        total = expiration.balayer(taille_lot)
+    finally:
+        cache.delete(expiration.CLE_BALAYAGE)
+    return f"{total} réservations expirées"
+
 
 @shared_task
-def expirer_reservations():
-    duree_expiration = Parametre.get_duree_expiration()
-    delai_expiration = timezone.now() - timedelta(hours=duree_expiration)
-    
-    reservations = Reservation.objects.filter(
-        statut='en_attente',
-        date_reservation__lt=delai_expiration
-    )
-    
-    for reservation in reservations:
-        reservation.statut = 'expire'
-        reservation.save()
-        Notification.objects.create(
-            destinataire=reservation.etudiant,
-            titre="Réservation expirée",
-            contenu=f"Votre réservation pour {reservation.plat.nom_plat} a expiré automatiquement après {duree_expiration} heures.",
-            lien=f"/reservations/{reservation.id}"
-        )
-    
-    return f"{reservations.count()} réservations expirées"
\ No newline at end of file
+def generer_export_reservations(utilisateur_id, cle):
+    """Génère l'export PDF des réservations d'un utilisateur (voir cantine.export)."""
+    try:
+        return export.generer_pdf(utilisateur_id, cle)
+    finally:
+        cache.delete(f"export:en_cours:{cle}")
+
+
+@shared_task
+def importer_etudiants(identifiant, chemin, format, institut=None):
+    """Inscrit les étudiants d'une liste déposée dans le stockage (voir cantine.inscriptions)."""
+    def progression(rapport):
+        inscriptions.publier(identifiant, 'en_cours', **rapport.donnees())
+
+    try:
+        with default_storage.open(chemin, 'rb') as fichier:
+            rapport = inscriptions.importer(
+                inscriptions.lire(fichier, format), institut=institut, progression=progression
+            )
+        inscriptions.publier(identifiant, 'termine', **rapport.donnees())
+        return f"{rapport.crees} étudiants inscrits, {rapport.nombre_erreurs} lignes refusées"
+    except Exception as e:
+        logger.exception("Échec de l'import %s", identifiant)
+        inscriptions.publier(identifiant, 'echec', detail=str(e))
+        raise
+    finally:
+        default_storage.delete(chemin)
@@ -0,0 +1,201 @@
+"""
+Diffusion en temps réel des places disponibles et des notifications.
+
+Places : chaque modification du stock marque le créneau comme modifié ;
+rien n'est envoyé à ce moment-là. Dans chaque processus ASGI, un relais
+relève les créneaux modifiés toutes les ``INTERVALLE_PLACES`` secondes, relit
+leurs quantités en une requête et les pousse aux sockets locales abonnées à
+la semaine concernée. Un créneau très demandé produit donc au plus un message
+par intervalle et par socket, quel que soit le nombre de réservations.
+
+Les processus sans socket (WSGI, Celery) transmettent les créneaux modifiés
+aux relais par le groupe ``places.relais`` de la couche de canaux ; avec la
+couche en mémoire (développement), seul le processus courant est concerné.
+
+Notifications : une notification personnelle est envoyée au groupe de son
+destinataire, une diffusion au groupe des étudiants.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.db import transaction
+
+from . import cache_menu
+from .models import EmploiDuTemps, Notification
+
+logger = logging.getLogger(__name__)
+
+INTERVALLE_PLACES = 0.5
+GROUPE_RELAIS = 'places.relais'
+GROUPE_DIFFUSIONS = 'notifications.etudiants'
+
+
+def groupe_notifications(utilisateur_id):
+    return f'notifications.{utilisateur_id}'
+
+
+class RelaisPlaces:
+    """
+    Regroupe les créneaux modifiés et les pousse aux consommateurs locaux.
+    Une instance par processus, attachée à la boucle d'événements ASGI.
+    """
+
+    def __init__(self, intervalle=INTERVALLE_PLACES):
+        self.intervalle = intervalle
+        self.abonnes = defaultdict(set)  # semaine ISO -> consommateurs
+        self._modifies = set()
+        self._verrou = threading.Lock()
+        self._boucle = None
+        self._taches = []
+
+    @property
+    def actif(self):
+        return self._boucle is not None and not self._boucle.is_closed()
+
+    def marquer(self, ids):
+        """Appelable depuis n'importe quel thread."""
+        with self._verrou:
+            self._modifies.update(ids)
+
+    async def demarrer(self):
+        boucle = asyncio.get_running_loop()
+        if self._boucle is boucle:
+            return
+        # Nouvelle boucle (serveur redémarré, tests) : repartir de zéro
+        self.abonnes.clear()
+        self._boucle = boucle
+        self._taches = [boucle.create_task(self._relever())]
+        couche = get_channel_layer()
+        if couche is not None and not isinstance(couche, InMemoryChannelLayer):
+            canal = await couche.new_channel()
+            await couche.group_add(GROUPE_RELAIS, canal)
+            self._taches.append(boucle.create_task(self._ecouter(couche, canal)))
+
+    def abonner(self, consommateur, semaine):
+        self.abonnes[semaine].add(consommateur)
+
+    def desabonner(self, consommateur, semaine=None):
+        semaines = [semaine] if semaine else list(self.abonnes)
+        for s in semaines:
+            self.abonnes[s].discard(consommateur)
+            if not self.abonnes[s]:
+                del self.abonnes[s]
+
+    async def _ecouter(self, couche, canal):
+        while True:
+            message = await couche.receive(canal)
+            self.marquer(message.get('ids', []))
+
+    async def _relever(self):
+        while True:
+            await asyncio.sleep(self.intervalle)
+            try:
+                await self.pousser()
+            except Exception:
+                logger.exception("Échec de la diffusion des places")
+
+    async def pousser(self):
+        with self._verrou:
+            ids, self._modifies = self._modifies, set()
+        if not ids or not self.abonnes:
+            return
+        lignes = await database_sync_to_async(_lire_places)(ids)
+        par_semaine = defaultdict(dict)
+        for emploi_id, date, quantite in lignes:
+            par_semaine[cache_menu.semaine_iso(date)][emploi_id] = quantite
+        for semaine, places in par_semaine.items():
+            for consommateur in list(self.abonnes.get(semaine, ())):
+                consommateur.pousser_places(places)
+
+
+def _lire_places(ids):
+    return list(EmploiDuTemps.objects.filter(pk__in=ids).values_list('id', 'date', 'quantite_disponible'))
+
+
+relais = RelaisPlaces()
+
+
+def signaler_places(ids):
+    """
+    Signale des créneaux dont le stock a changé, après validation de la
+    transaction en cours.
+    """
+    ids = list(ids)
+
+    def envoyer():
+        if relais.actif:
+            relais.marquer(ids)
+        couche = get_channel_layer()
+        if couche is None or isinstance(couche, InMemoryChannelLayer):
+            return
+        try:
+            async_to_sync(couche.group_send)(GROUPE_RELAIS, {'type': 'places.modifiees', 'ids': ids})
+        except Exception:
+            # La transaction est validée : un relais injoignable ne doit pas
+            # faire échouer la requête qui a modifié le stock
+            logger.warning("Échec du relais des places %s", ids, exc_info=True)
+
+    transaction.on_commit(envoyer)
+
+
+def donnees_notification(notification):
+    return {
+        'id': notification.pk,
+        'titre': notification.titre,
+        'contenu': notification.contenu,
+        'lien': notification.lien,
+        'date_envoi': notification.date_envoi.isoformat(),
+        'est_lue': notification.est_lue,
+        'est_diffusee': False,
+    }
+
+
+def envoyer_notification(groupe, donnees):
+    """Envoie une notification à un groupe après validation de la transaction."""
+    def envoyer():
+        couche = get_channel_layer()
+        if couche is None:
+            return
+        try:
+            async_to_sync(couche.group_send)(groupe, {'type': 'notification.nouvelle', 'notification': donnees})
+        except Exception:
+            # Le temps réel est un complément : l'API reste la référence
+            logger.exception("Échec de l'envoi en temps réel au groupe %s", groupe)
+
+    transaction.on_commit(envoyer)
+
+
+def creer_notifications(notifications, batch_size=1000):
+    """
+    Crée des notifications personnelles en INSERT groupés et les pousse à
+    leurs destinataires après validation de la transaction, en un seul
+    passage sur la couche de canaux (``bulk_create`` ne déclenche pas
+    ``pousser_notification``).
+    """
+    notifications = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    messages = [
+        (groupe_notifications(n.destinataire_id), donnees_notification(n))
+        for n in notifications if n.destinataire_id and n.pk
+    ]
+
+    async def envoyer_tout(couche):
+        resultats = await asyncio.gather(*[
+            couche.group_send(groupe, {'type': 'notification.nouvelle', 'notification': donnees})
+            for groupe, donnees in messages
+        ], return_exceptions=True)
+        echecs = sum(isinstance(resultat, Exception) for resultat in resultats)
+        if echecs:
+            logger.warning("Échec de l'envoi en temps réel de %s notification(s) sur %s", echecs, len(messages))
+
+    def envoyer():
+        couche = get_channel_layer()
+        if couche is not None and messages:
+            async_to_sync(envoyer_tout)(couche)
+
+    transaction.on_commit(envoyer)
+    return notifications
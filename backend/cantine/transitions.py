@@ -0,0 +1,234 @@
+"""
+Transitions de statut des réservations et mouvements de stock associés.
+
+Une réservation active (en attente ou acceptée) retient ses places dans
+``EmploiDuTemps.quantite_disponible`` depuis sa création (voir
+cantine.stock). Les seules transitions permises sont :
+
+    en_attente -> accepte      (places conservées)
+    en_attente -> refuse       (places rendues)
+    en_attente -> expire       (places rendues)
+    accepte    -> refuse       (places rendues)
+
+``transitionner`` applique une transition à un ensemble de réservations :
+un UPDATE conditionnel sur le statut, puis un unique UPDATE ... CASE
+rendant au stock les places de tous les créneaux concernés, dans la même
+transaction, avec la mise à jour des statistiques (cantine.statistiques).
+Toute écriture de statut doit passer par ici (ou par
+``Reservation.save()``, dont le signal pre_save reporte le changement sur
+le stock) ; ``queryset.update(statut=...)`` ferait dériver le stock.
+
+La commande ``reconcilier_stock`` recalcule les places à partir des
+réservations actives pour corriger une dérive passée.
+"""
+from collections import Counter, namedtuple
+
+from django.db import transaction
+from django.db.models import Case, PositiveIntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import statistiques
+from .models import EmploiDuTemps, Notification, Reservation
+from .stock import liberer_places, reserver_places
+from .temps_reel import creer_notifications, signaler_places
+
+STATUTS_ACTIFS = ('en_attente', 'accepte')
+
+TRANSITIONS = {
+    'en_attente': ('accepte', 'refuse', 'expire'),
+    'accepte': ('refuse',),
+}
+
+Transition = namedtuple(
+    'Transition',
+    'id etudiant_id emploi_du_temps_id quantite ancien_statut nom_plat date creneau total_prix plat_id institut',
+)
+
+
+class TransitionInterdite(ValueError):
+    def __init__(self, ancien, nouveau):
+        self.ancien = ancien
+        self.nouveau = nouveau
+        super().__init__(f"Transition interdite : {ancien} -> {nouveau}")
+
+
+def sources(cible):
+    """Statuts depuis lesquels ``cible`` est atteignable."""
+    return [statut for statut, cibles in TRANSITIONS.items() if cible in cibles]
+
+
+def verifier(ancien, nouveau):
+    if ancien != nouveau and nouveau not in TRANSITIONS.get(ancien, ()):
+        raise TransitionInterdite(ancien, nouveau)
+
+
+def places_rendues(transitions, cible):
+    """Places à rendre par créneau pour des réservations passant à ``cible``."""
+    places = Counter()
+    if cible not in STATUTS_ACTIFS:
+        for t in transitions:
+            if t.ancien_statut in STATUTS_ACTIFS:
+                places[t.emploi_du_temps_id] += t.quantite
+    return places
+
+
+def transitionner(reservations, cible, limite=None):
+    """
+    Fait passer à ``cible`` les réservations de ``reservations`` pour
+    lesquelles la transition est permise (les autres sont ignorées), et
+    rend les places au stock. Au plus ``limite`` réservations, par id
+    croissant.
+
+    Les signaux de Reservation ne sont pas déclenchés. Retourne la liste
+    des ``Transition`` appliquées.
+    """
+    depuis = sources(cible)
+    if not depuis:
+        raise TransitionInterdite('*', cible)
+
+    with transaction.atomic():
+        lignes = (
+            reservations.filter(statut__in=depuis)
+            .select_for_update(of=('self',))
+            .order_by('pk')
+            .values_list(
+                'id', 'etudiant_id', 'emploi_du_temps_id', 'quantite', 'statut',
+                'plat__nom_plat', 'emploi_du_temps__date', 'emploi_du_temps__creneau', 'total_prix',
+                'plat_id', 'etudiant__institut',
+            )
+        )
+        if limite:
+            lignes = lignes[:limite]
+        appliquees = [Transition(*ligne) for ligne in lignes]
+        if not appliquees:
+            return []
+
+        ids = [t.id for t in appliquees]
+        maintenant = timezone.now()
+        mises_a_jour = Reservation.objects.filter(pk__in=ids, statut__in=depuis).update(
+            statut=cible, updated_at=maintenant
+        )
+        if mises_a_jour != len(ids):
+            # Sans verrou de ligne (SQLite), une autre écriture a pu passer
+            # entre la lecture et l'UPDATE : ne compter que nos transitions.
+            nos_ids = set(
+                Reservation.objects.filter(pk__in=ids, statut=cible, updated_at=maintenant)
+                .values_list('id', flat=True)
+            )
+            appliquees = [t for t in appliquees if t.id in nos_ids]
+
+        liberer_places(places_rendues(appliquees, cible))
+        statistiques.reporter_transitions(appliquees, cible)
+    return appliquees
+
+
+def reporter_sur_stock(ancienne, nouvelle):
+    """
+    Mouvement de stock d'une réservation enregistrée par ``save()``.
+
+    ``ancienne`` est l'état en base ``(statut, emploi_du_temps_id, quantite)``
+    et ``nouvelle`` celui qui va être écrit : les places retenues par
+    l'ancien état sont rendues, celles du nouvel état sont prises (et
+    ``StockInsuffisant`` est levée s'il n'y en a plus assez).
+    """
+    ancien_statut, ancien_emploi, ancienne_quantite = ancienne
+    nouveau_statut, nouvel_emploi, nouvelle_quantite = nouvelle
+    retenues = Counter()
+    if ancien_statut in STATUTS_ACTIFS:
+        retenues[ancien_emploi] -= ancienne_quantite
+    if nouveau_statut in STATUTS_ACTIFS:
+        retenues[nouvel_emploi] += nouvelle_quantite
+    for emploi_id, delta in retenues.items():
+        if delta > 0:
+            reserver_places(emploi_id, delta)
+    liberer_places({emploi_id: -delta for emploi_id, delta in retenues.items() if delta < 0})
+
+
+TITRES = {
+    'accepte': "✅ Réservation acceptée",
+    'refuse': "❌ Réservation refusée",
+    'expire': "❌ Réservation expirée",
+}
+
+
+def notifier(transitions, cible):
+    """Une notification par réservation passée à ``cible``, en INSERT groupés."""
+    libelle = dict(Reservation.STATUT_CHOICES)[cible].lower()
+    creneaux = dict(EmploiDuTemps.CRENEAU_CHOICES)
+    creer_notifications([
+        Notification(
+            destinataire_id=t.etudiant_id,
+            titre=TITRES[cible],
+            contenu=(
+                f"Votre réservation pour {t.nom_plat} a été {libelle}.\n\n"
+                f"Détails :\n"
+                f"• Date: {t.date}\n"
+                f"• Créneau: {creneaux.get(t.creneau, t.creneau)}\n"
+                f"• Quantité: {t.quantite}"
+                + (f"\n• Total: {t.total_prix} fcfa" if cible == 'accepte' else "")
+            ),
+            lien=f"/reservations/{t.id}",
+        )
+        for t in transitions
+    ])
+
+
+Ecart = namedtuple('Ecart', 'emploi_id capacite retenues disponible attendu')
+
+
+def ecarts(emplois=None):
+    """
+    Compare, en une requête groupée, les places disponibles de chaque
+    créneau à ``capacite - places retenues par les réservations actives``.
+    Retourne les créneaux en écart (ou sans capacité connue).
+    """
+    queryset = EmploiDuTemps.objects.all() if emplois is None else emplois
+    lignes = queryset.annotate(
+        retenues=Sum('reservation__quantite', filter=Q(reservation__statut__in=STATUTS_ACTIFS), default=0)
+    ).values_list('id', 'capacite', 'retenues', 'quantite_disponible').order_by('id')
+
+    resultat = []
+    for emploi_id, capacite, retenues, disponible in lignes.iterator(chunk_size=2000):
+        # Sans capacité connue, l'état courant est pris comme référence
+        attendu = disponible if capacite is None else max(capacite - retenues, 0)
+        if capacite is None or attendu != disponible:
+            resultat.append(Ecart(emploi_id, capacite, retenues, disponible, attendu))
+    return resultat
+
+
+def corriger(emploi_ids, taille_lot=500):
+    """
+    Écrit les places attendues (et les capacités manquantes) des créneaux
+    ``emploi_ids``, un UPDATE ... CASE par lot, et retourne les écarts
+    corrigés.
+
+    Chaque lot est verrouillé (select_for_update) puis ré-agrégé dans la
+    transaction d'écriture : une réservation ou une libération validée
+    depuis le constat des écarts est comptée au lieu d'être écrasée, et
+    celles qui suivent attendent la fin du lot.
+    """
+    corriges = []
+    for debut in range(0, len(emploi_ids), taille_lot):
+        ids = emploi_ids[debut:debut + taille_lot]
+        with transaction.atomic():
+            # Verrou des créneaux du lot, dans l'ordre des clés
+            list(EmploiDuTemps.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+            lot = ecarts(EmploiDuTemps.objects.filter(pk__in=ids))
+            if not lot:
+                continue
+            EmploiDuTemps.objects.filter(pk__in=[e.emploi_id for e in lot]).update(
+                quantite_disponible=Case(
+                    *[When(pk=e.emploi_id, then=Value(e.attendu)) for e in lot],
+                    output_field=PositiveIntegerField(),
+                ),
+                capacite=Case(
+                    *[When(pk=e.emploi_id, then=Value(
+                        e.attendu + e.retenues if e.capacite is None else e.capacite
+                    )) for e in lot],
+                    output_field=PositiveIntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            signaler_places([e.emploi_id for e in lot if e.attendu != e.disponible])
+        corriges.extend(lot)
+    return corriges
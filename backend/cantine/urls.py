@@ -16,8 +16,10 @@ from .views import (
     NotificationViewSet,
     ParametreViewSet,
     AvisViewSet,
+    StatistiquesViewSet,
     register,
-    get_user_info
+    get_user_info,
+    jeton_profilage
 )
 from .serializers import LogoutSerializer
 
@@ -43,6 +45,7 @@ router.register(r'emploi-du-temps', EmploiDuTempsViewSet)
 router.register(r'notifications', NotificationViewSet)
 router.register(r'parametres', ParametreViewSet)
 router.register(r'avis', AvisViewSet)
+router.register(r'statistiques', StatistiquesViewSet, basename='statistiques')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -51,4 +54,5 @@ urlpatterns = [
     path('auth/register/', register, name='register'),
     path('auth/logout/', LogoutView.as_view(), name='logout'),
     path('auth/me/', get_user_info, name='user_info'),
+    path('profilage/jeton/', jeton_profilage, name='jeton_profilage'),
 ]
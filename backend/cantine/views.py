@@ -1,7 +1,8 @@
 from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.decorators import action, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.reverse import reverse
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.response import Response
 from rest_framework import status
@@ -12,17 +13,31 @@ from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from datetime import timedelta
 import logging
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-from django.http import HttpResponse
+import os
+import uuid
+from django.core.files.storage import default_storage
 from django.conf import settings
-import io
-from .models import Plat, Reservation, EmploiDuTemps, Avis, Notification, Parametre, User
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from .models import (
+    Plat, Reservation, EmploiDuTemps, Avis, Notification, NotificationDiffusee, Parametre, User,
+    notifier_reservations_groupees
+)
 from .serializers import (
     UserSerializer, PlatSerializer, ReservationSerializer,
     EmploiDuTempsSerializer, AvisSerializer, NotificationSerializer,
-    ParametreSerializer, UserInfoSerializer
+    NotificationDiffuseeSerializer, ParametreSerializer, UserInfoSerializer,
+    ReservationListSerializer, ReservationLotItemSerializer, NotePlatSerializer,
+    EmploiDuTempsCompactSerializer, ProgrammationSemaineSerializer, RapportStatistiquesSerializer,
+    ExtractionReservationsSerializer
 )
+from .authentification import JetonRafraichissement
+from .mixins import BudgetRequetesMixin
+from . import cache_menu, expiration, export, inscriptions, journal, notes, planification, prevision, profilage, statistiques
+from .pagination import PaginationCurseur, PaginationReservations, PaginationAvis, PaginationNotifications
+from .filtres import filtrer_reservations, filtrer_notifications, filtrer_avis, filtrer_utilisateurs, filtrer_export
+from .diffusion import notifications_diffusees, modifier_etat
+from .stock import reserver_places, reserver_places_lot, StockInsuffisant, ConflitStock
 from cantine import serializers
 
 logger = logging.getLogger(__name__)
@@ -49,7 +64,7 @@ class CustomTokenObtainPairView(TokenObtainPairView):
                 )
             
             # Générer les tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = JetonRafraichissement.for_user(user)
             response_data = {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -86,13 +101,23 @@ def get_user_info(request):
         logger.error(f"Erreur lors de la récupération des données utilisateur: {str(e)}")
         raise
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def jeton_profilage(request):
+    """Jeton à joindre à une requête pour la profiler (voir cantine.profilage)."""
+    return Response({
+        'jeton': profilage.jeton(request.user),
+        'duree': profilage.DUREE_JETON,
+        'entete': 'X-Profilage',
+    })
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def register(request):
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
+        refresh = JetonRafraichissement.for_user(user)
         return Response({
             'user': serializer.data,
             'refresh': str(refresh),
@@ -104,10 +129,19 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginationCurseur
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = filtrer_utilisateurs(queryset, self.request.query_params)
+        return queryset
 
     def get_permissions(self):
         if self.action == 'create':
             return [permissions.AllowAny()]
+        if self.action in ('importer', 'suivi_import'):
+            return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
     def create(self, request, *args, **kwargs):
@@ -115,7 +149,7 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         
-        refresh = RefreshToken.for_user(user)
+        refresh = JetonRafraichissement.for_user(user)
         data = {
             'user': serializer.data,
             'refresh': str(refresh),
@@ -136,18 +170,101 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def importer(self, request):
+        """
+        Inscription en masse (personnel) : ``fichier`` CSV ou JSON avec les
+        colonnes email, password, first_name, last_name et institut
+        (``institut`` du formulaire par défaut).
+
+        L'import s'exécute en arrière-plan ; la réponse 202 donne l'adresse
+        de son suivi (avancement puis rapport des lignes refusées). Sans
+        broker Celery, il s'exécute dans la requête et se limite à
+        ``inscriptions.LIGNES_MAX_SANS_BROKER`` lignes (413 au-delà).
+        """
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return Response({'fichier': ['Aucun fichier envoyé.']}, status=status.HTTP_400_BAD_REQUEST)
+        extension = os.path.splitext(fichier.name)[1].lower()
+        if extension not in inscriptions.FORMATS:
+            return Response(
+                {'fichier': [f"Formats acceptés : {', '.join(inscriptions.FORMATS)}."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        identifiant = uuid.uuid4().hex
+        chemin = default_storage.save(f"imports/{identifiant}{extension}", fichier)
+        try:
+            demarre = inscriptions.demarrer(
+                identifiant, chemin, inscriptions.FORMATS[extension], request.data.get('institut') or None
+            )
+        except inscriptions.ImportTropVolumineux as e:
+            return Response({'fichier': [str(e)]}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not demarre:
+            return Response(
+                {'detail': "Le service d'import est indisponible, réessayez plus tard."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        suivi = reverse('user-suivi-import', kwargs={'identifiant': identifiant}, request=request)
+        # Sans broker, l'import est déjà terminé : le suivi donne son rapport
+        etat = inscriptions.suivi(identifiant) or {'id': identifiant, 'statut': 'en_attente'}
+        return Response(
+            {**etat, 'suivi': suivi},
+            status=status.HTTP_202_ACCEPTED, headers={'Location': suivi}
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'import/(?P<identifiant>[0-9a-f]{32})')
+    def suivi_import(self, request, identifiant=None):
+        etat = inscriptions.suivi(identifiant)
+        if etat is None:
+            return Response({'detail': 'Import inconnu ou expiré.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(etat)
+
 class PlatViewSet(viewsets.ModelViewSet):
-    queryset = Plat.objects.all()
+    queryset = Plat.objects.select_related('notes')
     serializer_class = PlatSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'classement']:
             return [permissions.IsAuthenticated()]
         return [permissions.IsAdminUser()]
 
+    def list(self, request, *args, **kwargs):
+        version = cache_menu.versions(cache_menu.VERSION_PLATS)[cache_menu.VERSION_PLATS]
+        cle = f"menu:plats:{version}"
+
+        def construire():
+            plats = self.filter_queryset(self.get_queryset())
+            return [dict(plat) for plat in self.get_serializer(plats, many=True).data]
+
+        return cache_menu.reponse_conditionnelle(
+            request, cache_menu.etag(cle), lambda: cache_menu.lire(cle, construire)
+        )
+
+    @action(detail=False, methods=['get'])
+    def classement(self, request):
+        """
+        Plats les mieux notés, lus dans les agrégats de notes.
+
+        Paramètres : ``semaine`` (2025-W20) pour une semaine donnée,
+        ``min_avis`` (1 par défaut), ``limite`` (20, au plus 100) et, pour
+        le personnel, ``tous=1`` pour inclure les avis non approuvés.
+        """
+        semaine = request.query_params.get('semaine')
+        lundi = cache_menu.lundi_de_semaine(semaine) if semaine else None
+        approuves = not (request.user.is_staff and request.query_params.get('tous') in ('1', 'true'))
+        try:
+            min_avis = int(request.query_params.get('min_avis', 1))
+            limite = min(int(request.query_params.get('limite', 20)), 100)
+        except ValueError:
+            raise ValidationError({'detail': ["min_avis et limite doivent être des entiers."]})
+
+        lignes = notes.classement(lundi, approuves=approuves, min_avis=min_avis)[:max(limite, 1)]
+        return Response(NotePlatSerializer(lignes, many=True, context={'approuves': approuves}).data)
+
 class EmploiDuTempsViewSet(viewsets.ModelViewSet):
-    queryset = EmploiDuTemps.objects.all()
+    queryset = EmploiDuTemps.objects.select_related('plat__notes')
     serializer_class = EmploiDuTempsSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -156,100 +273,296 @@ class EmploiDuTempsViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAdminUser()]
 
+    def list(self, request, *args, **kwargs):
+        # ?semaine=2025-W20 : emplois du temps d'une semaine ISO, sinon tous
+        semaine = request.query_params.get('semaine')
+        emplois = self.filter_queryset(self.get_queryset())
+        if semaine:
+            lundi = cache_menu.lundi_de_semaine(semaine)
+            semaine = cache_menu.semaine_iso(lundi)
+            emplois = emplois.filter(date__range=cache_menu.bornes_semaine(lundi))
+            cle_version = cache_menu.cle_version_semaine(semaine)
+        else:
+            cle_version = cache_menu.VERSION_EMPLOIS
+
+        v = cache_menu.versions(cle_version, cache_menu.VERSION_PLATS)
+        cle = f"menu:emplois:{semaine or 'tout'}:{v[cle_version]}:{v[cache_menu.VERSION_PLATS]}"
+
+        # Les places disponibles sont toujours lues en base (une requête indexée)
+        places = dict(emplois.values_list('id', 'quantite_disponible'))
+
+        def construire():
+            return [dict(emploi) for emploi in self.get_serializer(emplois, many=True).data]
+
+        def donnees():
+            return [
+                {**emploi, 'quantite_disponible': places.get(emploi['id'], emploi['quantite_disponible'])}
+                for emploi in cache_menu.lire(cle, construire)
+            ]
+
+        return cache_menu.reponse_conditionnelle(
+            request, cache_menu.etag(cle, sorted(places.items())), donnees
+        )
+
+    @action(detail=False, methods=['get'])
+    def prevision(self, request):
+        """
+        Capacités suggérées pour une semaine (``?semaine=2025-W20``, la
+        semaine prochaine par défaut) : créneaux déjà programmés, sinon ceux
+        de la semaine précédente. ``niveau_service`` règle la marge (1 par
+        défaut, en écarts types).
+        """
+        semaine = request.query_params.get('semaine')
+        if semaine:
+            lundi = cache_menu.lundi_de_semaine(semaine)
+        else:
+            aujourdhui = timezone.localdate()
+            lundi = aujourdhui + timedelta(days=7 - aujourdhui.weekday())
+        niveau_service = prevision.lire_niveau_service(request.query_params.get('niveau_service', 1))
+
+        creneaux = prevision.creneaux_de_semaine(lundi)
+        suggestions = prevision.suggerer(creneaux, lundi, niveau_service)
+        return Response({
+            'semaine': cache_menu.semaine_iso(lundi),
+            'creneaux': [
+                {**suggestion._asdict(), 'date': prevision.date_du_jour(lundi, suggestion.jour)}
+                for suggestion in suggestions
+            ],
+        })
+
     @action(detail=False, methods=['post'])
     def programmer_semaine(self, request):
-        # Logique pour programmer toute la semaine
-        # (à implémenter selon vos besoins)
-        return Response({"status": "Semaine programmée"}, status=status.HTTP_200_OK)
+        """
+        Programme une semaine entière (ou ``nombre_semaines`` consécutives) en
+        une transaction, à partir d'un plan ou de la copie d'une semaine.
+        Avec ``prevision``, les quantités non précisées sont celles suggérées
+        par cantine.prevision.
+        """
+        serializer = ProgrammationSemaineSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        donnees = serializer.validated_data
 
-class ReservationViewSet(viewsets.ModelViewSet):
-    queryset = Reservation.objects.all()
+        lundi = cache_menu.lundi_de_semaine(donnees['semaine'])
+        if 'copier_depuis' in donnees:
+            plan = planification.plan_de_semaine(cache_menu.lundi_de_semaine(donnees['copier_depuis']))
+            if not plan:
+                raise ValidationError({'copier_depuis': ["Aucun créneau programmé cette semaine-là."]})
+        else:
+            plan = donnees['creneaux']
+
+        emplois = planification.programmer_semaines(
+            lundi, plan, donnees['nombre_semaines'], donnees['prevision']
+        )
+        return Response({
+            "status": "Semaine programmée",
+            "semaines": [
+                cache_menu.semaine_iso(lundi + timedelta(weeks=k)) for k in range(donnees['nombre_semaines'])
+            ],
+            "emplois_du_temps": EmploiDuTempsCompactSerializer(emplois, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+class ReservationViewSet(BudgetRequetesMixin, viewsets.ModelViewSet):
+    # Tout ce que les serializers affichent est chargé par jointure
+    queryset = Reservation.objects.select_related('plat__notes', 'emploi_du_temps__plat__notes', 'etudiant')
     serializer_class = ReservationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginationReservations
+    # lot : 4 requêtes pour les statistiques (cantine.statistiques)
+    budget_requetes = {'list': 6, 'retrieve': 6, 'lot': 14}
+    taille_max_lot = 20
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Statut effectif calculé à la lecture : une réservation échue
+        # apparaît expirée même avant le passage du balayage
+        queryset = expiration.annoter(super().get_queryset())
         if not self.request.user.is_staff:
-            queryset = queryset.filter(etudiant=self.request.user)
+            queryset = queryset.filter(etudiant_id=self.request.user.pk)
+        if self.action == 'list':
+            queryset = filtrer_reservations(queryset, self.request.query_params)
         return queryset
 
+    def dispatch(self, request, *args, **kwargs):
+        # Avant le décompte du budget : sans worker (mode eager), le
+        # balayage s'exécute dans la requête
+        expiration.declencher_si_echu()
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        # ?vue=compacte : représentation allégée pour les listes
+        if self.action == 'list' and self.request.query_params.get('vue') == 'compacte':
+            return ReservationListSerializer
+        return super().get_serializer_class()
+
     @action(detail=False, methods=['get'])
     def export(self, request):
+        """
+        Historique des réservations en PDF.
+
+        Si le PDF de la version courante existe, il est servi en flux (avec
+        reprise via Range) ; sinon sa génération est lancée en arrière-plan
+        et la réponse 202 invite le client à réessayer.
+        """
         try:
-            # Récupérer les réservations de l'utilisateur
-            reservations = self.get_queryset().filter(etudiant=request.user).select_related('plat', 'emploi_du_temps')
-            
-            # Préparer les données pour le template
-            total_general = 0
-            reservations_data = []
-            
-            for r in reservations:
-                # Calculer le total pour cette réservation
-                total_plat = r.plat.prix * r.quantite
-                supplements_total = sum(sup.get('prix', 0) * r.quantite for sup in (r.supplements or []))
-                total_reservation = total_plat + supplements_total
-                total_general += total_reservation
-                
-                # Préparer les données du plat
-                plat_data = {
-                    'id': r.plat.id,
-                    'nom_plat': r.plat.nom_plat,
-                    'description': r.plat.description,
-                    'prix': float(r.plat.prix)
-                }
-                
-                # Préparer les données de la réservation
-                reservation_data = {
-                    'id': r.id,
-                    'date_reservation': r.date_reservation,
-                    'emploi_du_temps': {
-                        'id': r.emploi_du_temps.id,
-                        'date': r.emploi_du_temps.date,
-                        'creneau': r.emploi_du_temps.creneau
-                    },
-                    'plat': plat_data,
-                    'quantite': r.quantite,
-                    'statut': r.statut,
-                    'supplements': r.supplements or [],
-                    'get_supplements_total': supplements_total,
-                    'get_total_prix': total_reservation,
-                    'get_statut_display': r.get_statut_display()
-                }
-                reservations_data.append(reservation_data)
-            
-            # Préparer le contexte pour le template
-            context = {
-                'reservations': reservations_data,
-                'date_export': timezone.now().strftime("%d/%m/%Y %H:%M"),
-                'user': request.user,
-                'total_general': total_general
-            }
-            
-            # Rendre le template HTML
-            html_string = render_to_string('reservations_export.html', context)
-            
-            # Générer le PDF
-            pdf_file = io.BytesIO()
-            pisa.CreatePDF(html_string, dest=pdf_file)
-            
-            # Créer la réponse HTTP avec le PDF
-            response = HttpResponse(pdf_file.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename=historique-reservations_{request.user.username}_{timezone.now().strftime("%Y%m%d")}.pdf'
-            
-            return response
+            cle = export.cle_export(request.user)
+            chemin = export.chemin_export(request.user.id, cle)
+
+            if not default_storage.exists(chemin):
+                export.planifier_generation(request.user.id, cle)
+                # Sans broker (mode eager) ou s'il est injoignable, le fichier existe déjà
+                if not default_storage.exists(chemin):
+                    response = Response(
+                        {'statut': 'en_cours', 'detail': "L'export est en cours de génération, réessayez dans quelques secondes."},
+                        status=status.HTTP_202_ACCEPTED
+                    )
+                    response['Retry-After'] = '2'
+                    return response
+
+            nom_fichier = f'historique-reservations_{request.user.username}_{timezone.now().strftime("%Y%m%d")}.pdf'
+            return export.reponse_fichier(request, chemin, nom_fichier)
             
         except Exception as e:
             logger.error(f"Erreur lors de l'export des réservations: {str(e)}")
             return Response({'error': f'Erreur serveur: {str(e)}'}, status=500)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def extraction(self, request):
+        """
+        Toutes les réservations en CSV ou NDJSON (personnel), diffusées en
+        flux à mémoire constante.
+
+        ``?sortie=ndjson&gzip=true&date_debut=2025-01-01&date_fin=2025-01-31
+        &creneau=midi,soir&statut=accepte`` ; voir filtrer_export pour les
+        autres filtres.
+        """
+        options = ExtractionReservationsSerializer(data=request.query_params)
+        options.is_valid(raise_exception=True)
+        reservations = filtrer_export(Reservation.objects.all(), request.query_params)
+        return export.reponse_extraction(
+            request._request, reservations, options.validated_data['sortie'], options.validated_data['gzip']
+        )
+
+    @action(detail=False, methods=['post'])
+    def lot(self, request):
+        """
+        Réserve plusieurs créneaux en une seule requête.
+
+        Corps : une liste (ou ``{"reservations": [...]}``) d'éléments
+        ``{emploi_du_temps_id, quantite, supplements}``. Chaque élément reçoit
+        son propre résultat ; les éléments valides sont enregistrés ensemble,
+        avec un nombre de requêtes indépendant de la taille du lot.
+        """
+        elements = request.data.get('reservations') if isinstance(request.data, dict) else request.data
+        if not isinstance(elements, list) or not elements:
+            return Response(
+                {'reservations': ['Une liste non vide de réservations est attendue.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(elements) > self.taille_max_lot:
+            return Response(
+                {'reservations': [f'Au plus {self.taille_max_lot} réservations par lot.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        resultats = [None] * len(elements)
+
+        def refuser(index, erreurs):
+            resultats[index] = {'index': index, 'statut': 'erreur', 'erreurs': erreurs}
+
+        demandes = {}
+        for index, element in enumerate(elements):
+            item = ReservationLotItemSerializer(data=element)
+            if item.is_valid():
+                demandes[index] = item.validated_data
+            else:
+                refuser(index, item.errors)
+
+        # Deux requêtes pour valider tout le lot : créneaux et doublons
+        ids = {demande['emploi_du_temps_id'] for demande in demandes.values()}
+        # Une réservation échue ne bloque pas le créneau : l'écrire expirée
+        expiration.expirer(etudiant_id=request.user.pk, emploi_du_temps_id__in=ids)
+        emplois = EmploiDuTemps.objects.select_related('plat__notes').in_bulk(ids)
+        deja_reserves = set(
+            Reservation.objects.filter(
+                etudiant=request.user,
+                emploi_du_temps_id__in=ids,
+                statut__in=['en_attente', 'accepte']
+            ).values_list('emploi_du_temps_id', flat=True)
+        )
+        for index, demande in list(demandes.items()):
+            emploi_id = demande['emploi_du_temps_id']
+            if emploi_id not in emplois:
+                refuser(index, {'emploi_du_temps_id': ['Emploi du temps introuvable.']})
+            elif emploi_id in deja_reserves:
+                refuser(index, {'non_field_errors': ['Vous avez déjà une réservation pour ce créneau.']})
+            else:
+                deja_reserves.add(emploi_id)
+                continue
+            del demandes[index]
+
+        creees = []
+        try:
+            with transaction.atomic():
+                restants, disponibles = reserver_places_lot({
+                    demande['emploi_du_temps_id']: demande['quantite'] for demande in demandes.values()
+                })
+                for index, demande in demandes.items():
+                    emploi = emplois[demande['emploi_du_temps_id']]
+                    if emploi.id not in restants:
+                        refuser(index, {'quantite': [
+                            f"Quantité non disponible. Il ne reste que {disponibles.get(emploi.id, 0)} place(s)."
+                        ]})
+                        continue
+                    emploi.quantite_disponible = restants[emploi.id]
+                    reservation = Reservation(
+                        etudiant=request.user,
+                        plat=emploi.plat,
+                        emploi_du_temps=emploi,
+                        quantite=demande['quantite'],
+                        supplements=demande['supplements'],
+                    )
+                    reservation.calculer_total_prix()
+                    creees.append((index, reservation))
+
+                # bulk_create ne déclenche pas les signaux : une notification récapitulative
+                Reservation.objects.bulk_create([reservation for _, reservation in creees])
+                if creees:
+                    statistiques.ajouter_reservations([reservation for _, reservation in creees])
+                    notifier_reservations_groupees(request.user, [reservation for _, reservation in creees])
+        except ConflitStock:
+            return Response(
+                {'detail': 'Les places disponibles ont changé pendant la réservation, veuillez réessayer.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        except IntegrityError:
+            return Response(
+                {'non_field_errors': ['Vous avez déjà une réservation pour un de ces créneaux.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        contexte = self.get_serializer_context()
+        for index, reservation in creees:
+            resultats[index] = {
+                'index': index,
+                'statut': 'cree',
+                'reservation': ReservationSerializer(reservation, context=contexte).data,
+            }
+        return Response(
+            {'crees': len(creees), 'resultats': resultats},
+            status=status.HTTP_201_CREATED if creees else status.HTTP_400_BAD_REQUEST
+        )
+
     def create(self, request, *args, **kwargs):
-        print("=== Données reçues pour la création de réservation ===")
-        print(f"Données brutes: {request.data}")
-        print(f"Utilisateur: {request.user}")
-        
+        journal.evenement(
+            logger, 'reservation.demande', utilisateur=request.user.pk,
+            emploi_du_temps=request.data.get('emploi_du_temps'), quantite=request.data.get('quantite'),
+        )
+
         try:
             # Vérifier d'abord si l'utilisateur a déjà une réservation pour ce créneau
             emploi_id = request.data.get('emploi_du_temps')
+            if emploi_id:
+                # Une réservation échue ne bloque pas le créneau : l'écrire expirée
+                expiration.expirer(etudiant_id=request.user.pk, emploi_du_temps_id=emploi_id)
             if emploi_id and Reservation.objects.filter(
                 etudiant=request.user,
                 emploi_du_temps_id=emploi_id,
@@ -263,58 +576,126 @@ class ReservationViewSet(viewsets.ModelViewSet):
             return super().create(request, *args, **kwargs)
             
         except ValidationError as e:
-            print(f"Erreur de validation: {e}")
             error_data = e.detail if hasattr(e, 'detail') else {'detail': str(e)}
+            journal.evenement(
+                logger, 'reservation.refusee', utilisateur=request.user.pk,
+                erreurs=','.join(error_data) if isinstance(error_data, dict) else 'detail',
+            )
             return Response(
                 error_data,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except Exception as e:
-            print(f"Erreur inattendue lors de la création de la réservation: {str(e)}")
-            print(f"Type d'erreur: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Erreur inattendue lors de la création de la réservation")
             return Response(
                 {'detail': 'Une erreur est survenue lors de la création de la réservation.'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
     def perform_create(self, serializer):
-        print("=== Validation des données de la réservation ===")
-        print(f"Données validées: {serializer.validated_data}")
-        
         emploi = serializer.validated_data['emploi_du_temps']
-        print(f"Emploi du temps: {emploi.id}, Quantité disponible: {emploi.quantite_disponible}")
-        
-        # Vérifier la quantité disponible
         quantite_demandee = serializer.validated_data.get('quantite', 1)
-        print(f"Quantité demandée: {quantite_demandee}, Quantité disponible: {emploi.quantite_disponible}")
-        
-        if emploi.quantite_disponible < quantite_demandee:
+        logger.debug(
+            "Réservation demandée: emploi=%s quantite=%s etudiant=%s",
+            emploi.id, quantite_demandee, self.request.user.id
+        )
+
+        expiration.expirer(etudiant_id=self.request.user.pk, emploi_du_temps_id=emploi.id)
+        try:
+            # Le stock et la réservation sont écrits dans la même transaction :
+            # si l'insertion échoue, les places sont rendues automatiquement.
+            with transaction.atomic():
+                restant = reserver_places(emploi.id, quantite_demandee)
+                reservation = serializer.save(etudiant=self.request.user)
+        except StockInsuffisant as e:
             raise ValidationError({
-                'quantite': [f'Quantité non disponible. Il ne reste que {emploi.quantite_disponible} place(s).']
+                'quantite': [str(e)]
             }, code='quantity_unavailable')
-        
-        # Sauvegarder la réservation
-        print("Sauvegarde de la réservation...")
-        reservation = serializer.save(etudiant=self.request.user)
-        print(f"Réservation créée avec succès: {reservation.id}")
-        
-        # Mettre à jour la quantité disponible
-        emploi.quantite_disponible -= quantite_demandee
-        emploi.save()
-        print(f"Quantité mise à jour: {emploi.quantite_disponible} places restantes")
+        except IntegrityError:
+            # Contrainte unique_active_reservation_per_slot : deux requêtes
+            # concurrentes du même étudiant pour le même créneau.
+            raise ValidationError({
+                'non_field_errors': ['Vous avez déjà une réservation pour ce créneau.']
+            })
+
+        emploi.quantite_disponible = restant
+        logger.debug(
+            "Réservation %s créée, %s place(s) restante(s)", reservation.id, restant
+        )
+
+    def perform_update(self, serializer):
+        # Le stock suit la quantité et le créneau (récepteur pre_save) dans la
+        # transaction de Reservation.save() : un refus n'y laisse aucune trace.
+        try:
+            serializer.save()
+        except StockInsuffisant as e:
+            raise ValidationError({
+                'quantite': [str(e)]
+            }, code='quantity_unavailable')
+        except IntegrityError:
+            raise ValidationError({
+                'emploi_du_temps_id': ['Vous avez déjà une réservation pour ce créneau.']
+            })
 
 class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginationNotifications
 
     def get_queryset(self):
-        return Notification.objects.filter(destinataire=self.request.user)
+        return Notification.objects.filter(destinataire_id=self.request.user.pk)
+
+    def get_diffusion(self):
+        """
+        Retourne la diffusion désignée par un identifiant négatif dans l'URL,
+        ou None s'il s'agit d'une notification personnelle.
+        """
+        try:
+            pk = int(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        except (TypeError, ValueError):
+            return None
+        if pk >= 0:
+            return None
+        return get_object_or_404(notifications_diffusees(self.request.user), pk=-pk)
+
+    def serialiser(self, notification):
+        if isinstance(notification, NotificationDiffusee):
+            return NotificationDiffuseeSerializer(
+                notification, context=self.get_serializer_context()
+            ).data
+        return self.get_serializer(notification).data
+
+    def list(self, request, *args, **kwargs):
+        # Flux unique : notifications personnelles et diffusées, fusionnées
+        # par date d'envoi décroissante puis paginées par curseur
+        params = request.query_params
+        page = self.paginator.paginer_flux(
+            filtrer_notifications(self.get_queryset(), params),
+            filtrer_notifications(notifications_diffusees(request.user), params),
+            request,
+        )
+        return self.get_paginated_response([self.serialiser(notification) for notification in page])
+
+    def retrieve(self, request, *args, **kwargs):
+        diffusion = self.get_diffusion()
+        if diffusion is not None:
+            return Response(self.serialiser(diffusion))
+        return super().retrieve(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        diffusion = self.get_diffusion()
+        if diffusion is not None:
+            modifier_etat(diffusion, request.user, est_supprimee=True)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return super().destroy(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
     def marquer_comme_lue(self, request, pk=None):
+        diffusion = self.get_diffusion()
+        if diffusion is not None:
+            modifier_etat(diffusion, request.user, est_lue=True)
+            return Response({'status': 'Notification marquée comme lue'})
         notification = self.get_object()
         notification.est_lue = True
         notification.save()
@@ -322,6 +703,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
         
     @action(detail=True, methods=['delete'])
     def supprimer(self, request, pk=None):
+        diffusion = self.get_diffusion()
+        if diffusion is not None:
+            modifier_etat(diffusion, request.user, est_supprimee=True)
+            return Response(
+                {'status': 'Notification supprimée avec succès', 'id': -diffusion.id},
+                status=status.HTTP_200_OK
+            )
         notification = self.get_object()
         notification_id = notification.id
         notification.delete()
@@ -335,17 +723,35 @@ class ParametreViewSet(viewsets.ModelViewSet):
     serializer_class = ParametreSerializer
     permission_classes = [permissions.IsAdminUser]
 
+class StatistiquesViewSet(viewsets.ViewSet):
+    """
+    Statistiques de fréquentation et de recette (personnel) : occupation,
+    recette, taux d'acceptation, de refus et d'expiration, lus dans les
+    tables de synthèse de cantine.statistiques.
+
+    ``?debut=2025-01-01&fin=2025-06-30&grouper=semaine&type_plat=vip``
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        parametres_rapport = RapportStatistiquesSerializer(data=request.query_params)
+        parametres_rapport.is_valid(raise_exception=True)
+        donnees = dict(parametres_rapport.validated_data)
+        debut, fin, grouper = donnees.pop('debut'), donnees.pop('fin'), donnees.pop('grouper')
+        return Response(statistiques.rapport(debut, fin, grouper, donnees))
+
 class AvisViewSet(viewsets.ModelViewSet):
     queryset = Avis.objects.all()
     serializer_class = AvisSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginationAvis
 
     def get_queryset(self):
-        queryset = Avis.objects.all()
+        queryset = Avis.objects.select_related('etudiant', 'plat')
         
         # Pour les étudiants: seulement leurs avis
         if not self.request.user.is_staff:
-            queryset = queryset.filter(etudiant=self.request.user)
+            queryset = queryset.filter(etudiant_id=self.request.user.pk)
         
         # Filtres supplémentaires
         plat_id = self.request.query_params.get('plat')
@@ -355,6 +761,9 @@ class AvisViewSet(viewsets.ModelViewSet):
         approuve_only = self.request.query_params.get('approuve')
         if approuve_only and self.request.user.is_staff:
             queryset = queryset.filter(est_approuve=True)
+
+        if self.action == 'list':
+            queryset = filtrer_avis(queryset, self.request.query_params)
         
         return queryset
 
@@ -1,11 +1,11 @@
 import apiClient from "../lib/apiClient";
+import { toutesLesPages } from "../lib/pagination";
 import { User, Plat, EmploiDuTemps, Parametre, Avis } from "../types/models";
 
 export const adminApi = {
   // Gestion des utilisateurs
   getAllUsers: async (): Promise<User[]> => {
-    const response = await apiClient.get<User[]>("/admin/users");
-    return response.data;
+    return toutesLesPages<User>(apiClient, "/admin/users");
   },
 
   updateUser: async (id: number, data: Partial<User>): Promise<User> => {
@@ -70,8 +70,7 @@ export const adminApi = {
 
   // Gestion des avis
   getAllAvis: async (): Promise<Avis[]> => {
-    const response = await apiClient.get<Avis[]>("/admin/avis");
-    return response.data;
+    return toutesLesPages<Avis>(apiClient, "/admin/avis");
   },
 
   approuverAvis: async (id: number): Promise<Avis> => {
@@ -1,4 +1,5 @@
 import { apiClient } from './client';
+import { toutesLesPages } from '../lib/pagination';
 import { Avis } from "../types/models";
 
 export interface AvisRequest {
@@ -13,16 +14,14 @@ export const avisApi = {
     const params: { plat?: number; approuve?: boolean } = {};
     if (platId) params.plat = platId;
     if (onlyApproved) params.approuve = true;
-    const response = await apiClient.get("/avis/", { params });
-    return response.data;
+    return toutesLesPages<Avis>(apiClient, "/avis/", { params });
   },
 
   // Récupère les avis pour un plat spécifique
   getByPlatId: async (platId: number, onlyApproved?: boolean): Promise<Avis[]> => {
     const params: { plat: number; approuve?: boolean } = { plat: platId };
     if (onlyApproved) params.approuve = true;
-    const response = await apiClient.get("/avis/", { params });
-    return response.data;
+    return toutesLesPages<Avis>(apiClient, "/avis/", { params });
   },
 
   create: async (data: AvisRequest): Promise<Avis> => {
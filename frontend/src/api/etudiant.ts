@@ -1,11 +1,11 @@
 import apiClient from "../lib/apiClient";
+import { toutesLesPages } from "../lib/pagination";
 import { Reservation, Avis, Notification } from "../types/models";
 
 export const etudiantApi = {
   // Réservations
   getAllReservations: async (): Promise<Reservation[]> => {
-    const response = await apiClient.get<Reservation[]>("/reservations/");
-    return response.data;
+    return toutesLesPages<Reservation>(apiClient, "/reservations/");
   },
 
   getReservationById: async (id: number): Promise<Reservation> => {
@@ -44,8 +44,7 @@ export const etudiantApi = {
 
   // Notifications
   getAllNotifications: async (): Promise<Notification[]> => {
-    const response = await apiClient.get<Notification[]>("/api/notifications/");
-    return response.data;
+    return toutesLesPages<Notification>(apiClient, "/api/notifications/");
   },
 
   markNotificationAsRead: async (id: number): Promise<Notification> => {
@@ -1,10 +1,10 @@
 import apiClient from "../lib/apiClient";
+import { toutesLesPages } from "../lib/pagination";
 import { Notification, NotificationRequest } from "../types/models";
 
 export const notificationsApi = {
   getAll: async (): Promise<Notification[]> => {
-    const response = await apiClient.get<Notification[]>("/notifications");
-    return response.data;
+    return toutesLesPages<Notification>(apiClient, "/notifications/");
   },
 
   getById: async (id: number): Promise<Notification> => {
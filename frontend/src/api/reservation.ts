@@ -1,10 +1,10 @@
 import { apiClient } from './client';
+import { toutesLesPages } from '../lib/pagination';
 import { Reservation, ApiResponse, ReservationRequest } from '../types/models';
 
 export const reservationApi = {
   async getAll(): Promise<ApiResponse<Reservation[]>> {
-    const response = await apiClient.get('/reservations/');
-    return response.data;
+    return { data: await toutesLesPages<Reservation>(apiClient, '/reservations/') };
   },
 
   async getByUser(userId: string): Promise<ApiResponse<Reservation[]>> {
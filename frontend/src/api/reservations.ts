@@ -1,10 +1,10 @@
 import apiClient from "../lib/apiClient";
+import { toutesLesPages } from "../lib/pagination";
 import { Reservation, ReservationRequest } from "../types/models";
 
 export const reservationsApi = {
   getAll: async (): Promise<Reservation[]> => {
-    const response = await apiClient.get<Reservation[]>("/api/reservations");
-    return response.data;
+    return toutesLesPages<Reservation>(apiClient, "/api/reservations/");
   },
 
   getById: async (id: number): Promise<Reservation> => {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { apiClient } from '../../api/client';
+import { toutesLesPages } from '../../lib/pagination';
 import { Notification } from '../../types/models';
 
 interface NotificationBellProps {
@@ -39,8 +40,7 @@ export const NotificationBell: React.FC<NotificationBellProps> = ({ }) => {
 
   const fetchNotifications = async () => {
     try {
-      const response = await apiClient.get('/notifications');
-      setNotifications(response.data);
+      setNotifications(await toutesLesPages<Notification>(apiClient, '/notifications/'));
     } catch (error) {
       console.error('Erreur lors du chargement des notifications:', error);
     }
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { useNotification } from "../../hooks/useNotification";
 import { apiClient } from "../../api/client";
+import { toutesLesPages } from "../../lib/pagination";
 import { Notification } from "../../types/models";
 
 export const NotificationCenter: React.FC = () => {
@@ -32,8 +33,7 @@ export const NotificationCenter: React.FC = () => {
 
   const fetchNotifications = async () => {
     try {
-      const response = await apiClient.get('/notifications');
-      setNotifications(response.data);
+      setNotifications(await toutesLesPages<Notification>(apiClient, '/notifications/'));
     } catch (error) {
       console.error('Erreur lors du chargement des notifications:', error);
       showNotification("Erreur lors du chargement des notifications", "error");
@@ -4,6 +4,7 @@ import { useAuth } from "../../../features/auth/AuthProvider";
 import { useAvis } from "../../../hooks/useAvis";
 import { useReservation } from "../../../hooks/useReservation";
 import apiClient from "../../../lib/apiClient";
+import { toutesLesPages } from "../../../lib/pagination";
 
 interface ReservationRequest {
   plat_id: number;
@@ -69,15 +70,17 @@ export const PlatCard: React.FC<PlatCardProps> = ({ plat }) => {
 
       try {
         //console.log("Vérification des réservations pour l'utilisateur:", user.id, "et le plat:", plat.id);
-        const response = await typedApiClient.get<ReservationResponse[]>(`/api/reservations/?etudiant=${user.id}&plat=${plat.id}`);
-        //console.log("Réponse complète de l'API:", response);
-        //console.log("Données brutes des réservations:", response.data);
+        // Liste paginée, filtrée côté serveur sur le plat et le statut
+        const reservations = await toutesLesPages<ReservationResponse>(apiClient, "/api/reservations/", {
+          params: { plat: plat.id, statut: "accepte" },
+        });
+        //console.log("Données brutes des réservations:", reservations);
 
-        if (Array.isArray(response.data) && response.data.length > 0) {
-          //console.log("Toutes les réservations:", response.data);
+        if (reservations.length > 0) {
+          //console.log("Toutes les réservations:", reservations);
           
           // Vérifier s'il y a une réservation acceptée pour ce plat
-          const acceptedReservationForThisPlat = response.data.find(reservation => {
+          const acceptedReservationForThisPlat = reservations.find(reservation => {
             const status = reservation.statut?.toLowerCase();
             const isForThisPlat = reservation.plat?.id === plat.id;
             const isAccepted = status === 'accepte';
@@ -1,5 +1,6 @@
 import { useState, useCallback } from "react";
 import apiClient from "../lib/apiClient";
+import { toutesLesPages } from "../lib/pagination";
 import { Reservation, ReservationRequest } from "../types/models";
 import { AxiosError } from "axios";
 
@@ -28,9 +29,9 @@ export function useReservation() {
   const fetchReservations = useCallback(async (): Promise<void> => {
     setState(prev => ({ ...prev, isLoading: true, error: null }));
     try {
-      const response = await apiClient.get<Reservation[]>("/api/reservations/");
+      const reservations = await toutesLesPages<Reservation>(apiClient, "/api/reservations/");
       setState({
-        reservations: response.data,
+        reservations,
         isLoading: false,
         error: null,
       });
@@ -0,0 +1,23 @@
+import type { AxiosInstance, AxiosRequestConfig } from "axios";
+import { PaginatedResponse } from "../types/models";
+
+// Les listes réservations, notifications, avis et utilisateurs sont paginées
+// par curseur : { next, previous, results }. On suit `next` (URL absolue,
+// paramètres compris) jusqu'à la dernière page.
+export async function toutesLesPages<T>(
+  client: AxiosInstance,
+  url: string,
+  config?: AxiosRequestConfig
+): Promise<T[]> {
+  const resultats: T[] = [];
+  let suivante: string | null = url;
+  let options: AxiosRequestConfig | undefined = config;
+  while (suivante) {
+    const response: { data: PaginatedResponse<T> } = await client.get<PaginatedResponse<T>>(suivante, options);
+    resultats.push(...response.data.results);
+    suivante = response.data.next;
+    // `next` contient déjà les paramètres de la requête
+    options = { ...config, params: undefined };
+  }
+  return resultats;
+}
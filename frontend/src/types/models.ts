@@ -121,7 +121,7 @@ export interface ApiResponse<T> {
 }
 
 export interface PaginatedResponse<T> {
-  count: number;
+  count?: number; // absent des listes paginées par curseur
   next: string | null;
   previous: string | null;
   results: T[];